@@ -1,31 +1,72 @@
 import boto3
+import faiss
+import json
 import streamlit
 import uuid
 import os
 import time
 import threading
+import shutil
 
+from boto3.s3.transfer import TransferConfig
 from langchain_aws.embeddings import BedrockEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader
 from langchain_community.vectorstores import FAISS
 
+from aws_io import AsyncAWS
+from embedding_cache import EmbeddingCache
+from embedding_pipeline import EmbeddingPipeline
+from bm25_index import build_bm25_index, save_bm25_index
+from compact_index import COMPACT_FORMAT, VECTORS_EXTENSION, load_compact_vectors, save_compact_index
+from checkpoints import CheckpointWriter, clear_checkpoints, get_completed_ranges, get_missing_chunk_ids, get_requests_by_status
+from fakes import FakeEmbeddings
+from index_builder import build_index, choose_index_config, reconstruct_all
+from job_queue import JobQueue
+from pdf_parser import parse_pdf, parse_workers
+from tracing import shared_tracer, trace_breakdown
+
 
 # Hard-coded items
 CHECKPOINT_TABLE = "PDFProcessingCheckpoints"
+REQUEST_STATUS_TABLE = "PDFProcessingRequests"
+REQUEST_PAGE_SIZE = 50
 HEARTBEAT_TABLE = "ContainerHeartbeats"
 CONTAINER_INFO_TABLE = "ContainerInfo"
+MANIFEST_KEY = "manifest.json"
 HEARTBEAT_INTERVAL = 60
+CHECKPOINT_FLUSH_INTERVAL = 30
+PROGRESS_PREFIX = "progress/"
+EMBEDDING_MODEL_ID = "amazon.titan-embed-text-v1"
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
 
 # Environment Variables
 admin_name = os.getenv("CONSUMER_NAME")
 container_id = os.getenv("CONTAINER_ID")
 az = os.getenv("AVAILABILITY_ZONE")
-
-s3_client = boto3.client("s3")
-dynamodb_client = boto3.client("dynamodb")
-bedrock_client = boto3.client("bedrock-runtime")
-bedrock_embeddings =BedrockEmbeddings(model_id="amazon.titan-embed-text-v1", client=bedrock_client)
+embeddings_backend = os.getenv("EMBEDDINGS_BACKEND", "bedrock")
+embedding_batch_size = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+embedding_max_in_flight = int(os.getenv("EMBEDDING_MAX_IN_FLIGHT", "4"))
+embedding_cache_bucket = os.getenv("EMBEDDING_CACHE_BUCKET")
+embedding_cache_folder_path = os.getenv("EMBEDDING_CACHE_PATH", "/embedding_cache/")
+pdf_parse_workers = int(os.getenv("PDF_PARSE_WORKERS", "0")) or None
+pdf_parse_min_pages_per_worker = int(os.getenv("PDF_PARSE_MIN_PAGES_PER_WORKER", "100"))
+index_type = os.getenv("INDEX_TYPE") or None
+index_use_pq = os.getenv("INDEX_USE_PQ", "false").lower() == "true"
+vector_store_folder_path = os.getenv("VECTOR_STORE_PATH", "/vector_stores/")
+
+aws_io = AsyncAWS(max_pool_connections=int(os.getenv("AWS_MAX_POOL_CONNECTIONS", "32")))
+s3_client = boto3.client("s3", config=aws_io.client_config)
+upload_transfer_config = TransferConfig(multipart_threshold=UPLOAD_CHUNK_SIZE, multipart_chunksize=UPLOAD_CHUNK_SIZE,
+                                        max_concurrency=4)
+dynamodb_client = boto3.client("dynamodb", config=aws_io.client_config)
+bedrock_client = boto3.client("bedrock-runtime", config=aws_io.client_config)
+if embeddings_backend == "fake":
+    bedrock_embeddings = FakeEmbeddings()
+else:
+    bedrock_embeddings = BedrockEmbeddings(model_id=EMBEDDING_MODEL_ID, client=bedrock_client)
+embedding_cache = EmbeddingCache(embedding_cache_folder_path, EMBEDDING_MODEL_ID if embeddings_backend != "fake" else "fake")
+job_queue = JobQueue(os.getenv("JOB_QUEUE_PATH", "/jobs/queue.db"))
+metrics_path = os.getenv("METRICS_PATH", "/jobs/metrics.prom")
+upload_folder_path = os.getenv("UPLOAD_PATH", "/jobs/uploads/")
 
 
 def save_container_info(admin_name, container_id, role, az):
@@ -41,18 +82,6 @@ def save_container_info(admin_name, container_id, role, az):
     )
 
 
-def save_checkpoint(request_id, chunk_id, status):
-    """ Saves Checkpointing Info to a DynamoDB Table to help resume any failed operations """
-    dynamodb_client.put_item(
-        TableName=CHECKPOINT_TABLE,
-        Item={
-            'RequestID': {'S': request_id},
-            'ChunkID': {'N': str(chunk_id)},
-            'Status': {'S': status}
-        }
-    )
-
-
 def save_heartbeat(container_id, request_id):
     """ Periodically Sends Container Heartbeats to help identify when a container goes down """
     while True:
@@ -69,82 +98,356 @@ def save_heartbeat(container_id, request_id):
         time.sleep(HEARTBEAT_INTERVAL)
 
 
-def get_last_processed_chunk(request_id):
-    response = dynamodb_client.query(
-        TableName=CHECKPOINT_TABLE,
-        KeyConditionExpression='RequestID = :requestid',
-        ExpressionAttributeValues={
-            ':requestid': {'S': request_id}
-        },
-        ScanIndexForward=False,
-        Limit=1
-    )
-    
-    items = response.get('Items')
-    if items:
-        return int(items[0]['ChunkID']['N'])
-    return -1
+def get_upload_path(request_id):
+    """ A new local path per upload, so a queued job keeps parsing its own file when the same PDF is uploaded again """
+    os.makedirs(upload_folder_path, exist_ok=True)
+    return os.path.join(upload_folder_path, f"{request_id}.{uuid.uuid4().hex}.pdf")
 
 
-def split_into_docs(pages, chunk_size, overlap_size):
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=overlap_size)
-    documents = text_splitter.split_documents(pages)
-    return documents
+def fetch_uploaded_pdf(pdf_name, request_id):
+    """ Downloads the request's PDF from S3 when the job's local copy is gone, e.g. for a resumed request """
+    if not os.path.exists(pdf_name):
+        os.makedirs(os.path.dirname(pdf_name) or ".", exist_ok=True)
+        s3_client.download_file(Bucket=f"GPI-{request_id}", Key=f"{request_id}.pdf", Filename=f"{pdf_name}.tmp",
+                                Config=upload_transfer_config)
+        os.replace(f"{pdf_name}.tmp", pdf_name)
 
 
-def create_vector_store(request_id, chunk_id, document, local_folder_path):
-    chunk_embeddings = bedrock_embeddings.embed_texts([document]) 
-        
-    faiss_vector_store = FAISS.from_documents([document], chunk_embeddings)
-    faiss_vector_store.save_local(index_name=f"{request_id}_{chunk_id}", folder_path=local_folder_path)
-    
-    s3_bucket_name = f"GPI-{request_id}"
-    s3_client.create_bucket(Bucket=s3_bucket_name)
-    
-    s3_client.upload_file(Filename=f"vs_{request_id}_{chunk_id}.faiss", Bucket=s3_bucket_name, Key=f"vs_{request_id}_{chunk_id}.faiss")
-    s3_client.upload_file(Filename=f"vs_{request_id}_{chunk_id}.pkl", Bucket=s3_bucket_name, Key=f"vs_{request_id}_{chunk_id}.pkl")
-    
-    save_checkpoint(request_id, chunk_id, 'PROCESSED')
-    streamlit.write(f"Processed Chunk:{chunk_id}, uploaded FAISS Vector Store to S3 bucket: {s3_bucket_name}.")
+def remove_uploaded_pdf(pdf_name):
+    """ Deletes a job's local copy once the job has finished; the PDF stays in S3 """
+    if os.path.dirname(os.path.abspath(pdf_name)) == os.path.abspath(upload_folder_path) and os.path.exists(pdf_name):
+        os.remove(pdf_name)
 
-    return True
 
+def queue_upload(request_id, saved_file_name, update=False):
+    """ Queues a job for a saved upload and returns it, with the request's job it waits behind (or None)
 
-def process_pdf(pdf_name, request_id):
-    """Process PDF into chunks and create a vector store."""
-    pdfLoader = PyPDFLoader(pdf_name)
-    pages = pdfLoader.load_and_split()
+    A new ingestion of a request that already has a job joins that job, so its upload is deleted.
+    """
+    active_job = job_queue.get_active_job(request_id)
+    job = job_queue.get_job(job_queue.enqueue(request_id, saved_file_name, update=update))
+    if job['pdf_name'] != saved_file_name:
+        remove_uploaded_pdf(saved_file_name)
+    return job, active_job if active_job and active_job['id'] != job['id'] else None
 
-    streamlit.write(f"Total # of Pages: {len(pages)}")
 
-    documents = split_into_docs(pages, 1000, 200)
-    streamlit.write("Finished processing pages into documents.\n\n")
+def save_uploaded_pdf(uploaded_pdf, saved_file_name, s3_bucket_name, key):
+    """ Streams the uploaded PDF to local disk and then to S3 in chunks, never holding another full copy in memory """
+    uploaded_pdf.seek(0)
+    with open(saved_file_name, "wb") as sf:
+        shutil.copyfileobj(uploaded_pdf, sf, UPLOAD_CHUNK_SIZE)
 
-    last_processed_chunk = get_last_processed_chunk(request_id)
-    start_chunk = last_processed_chunk + 1
+    # From the file name, so each part is read from disk as it is sent; upload_fileobj buffers whole parts in memory
+    s3_client.upload_file(Filename=saved_file_name, Bucket=s3_bucket_name, Key=key, Config=upload_transfer_config)
 
-    local_folder_path = "/vector_stores/"
-    os.makedirs(local_folder_path, exist_ok=True)
 
-    for chunk_id in range(start_chunk, len(documents)):
-        document = documents[chunk_id]
-        result = create_vector_store(request_id, chunk_id, document, local_folder_path)
-        if not result:
-            streamlit.write(f"Failed to create Vector Store for Chunk:{chunk_id}. Please check the logs.")
-            break
+def add_to_vector_store(vector_store, chunk_ids, documents, vectors):
+    """ Adds a batch of embedded chunks to the request's index, creating it on the first batch """
+    text_embeddings = [(document.page_content, vector) for document, vector in zip(documents, vectors)]
+    metadatas = [dict(document.metadata, chunk_id=chunk_id) for document, chunk_id in zip(documents, chunk_ids)]
+    ids = [str(chunk_id) for chunk_id in chunk_ids]
 
+    if vector_store is None:
+        return FAISS.from_embeddings(text_embeddings, bedrock_embeddings, metadatas=metadatas, ids=ids)
 
-def get_failed_requests():
-    response = dynamodb_client.scan(
-        TableName=CHECKPOINT_TABLE,
-        FilterExpression='Status = :status',
-        ExpressionAttributeValues={':status': {'S': 'FAILED'}}
-    )
-    
-    failed_requests = response.get('Items', [])
-    failed_request_ids = [req['RequestID']['S'] for req in failed_requests]
+    vector_store.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+    return vector_store
+
+
+def get_published_manifest(s3_bucket_name):
+    """ Returns the manifest of the index currently published in the bucket, if any """
+    try:
+        response = s3_client.get_object(Bucket=s3_bucket_name, Key=MANIFEST_KEY)
+    except (s3_client.exceptions.NoSuchKey, s3_client.exceptions.NoSuchBucket):
+        return None
+    return json.loads(response['Body'].read())
 
-    return failed_request_ids
+
+def load_published_vectors(s3_bucket_name, manifest, local_folder_path):
+    """ Returns {chunk fingerprint: vector} for every chunk in the published index
+
+    Rows of the published vectors are in chunk ID order, as are the manifest's fingerprints.
+    """
+    index_name = manifest['index_name']
+    os.makedirs(local_folder_path, exist_ok=True)
+    # Indexes published before the compact layout only have their vectors in the FAISS index file
+    extension = VECTORS_EXTENSION if manifest.get('format') == COMPACT_FORMAT else "faiss"
+    filename = os.path.join(local_folder_path, f"{index_name}.{extension}")
+    s3_client.download_file(Bucket=s3_bucket_name, Key=f"{manifest['index_prefix']}{index_name}.{extension}", Filename=filename)
+
+    if extension == VECTORS_EXTENSION:
+        vectors = load_compact_vectors(local_folder_path, index_name, manifest['dimension'])
+    else:
+        vectors = reconstruct_all(faiss.read_index(filename))
+    return dict(zip(manifest.get('fingerprints', []), vectors))
+
+
+def remove_old_index_versions(s3_bucket_name, keep_prefixes):
+    """ Deletes index versions other than the given ones; the previous version is kept for readers still loading it """
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=s3_bucket_name, Prefix="indexes/"):
+        stale = [{'Key': content['Key']} for content in page.get('Contents', [])
+                 if not any(content['Key'].startswith(prefix) for prefix in keep_prefixes)]
+        if stale:
+            s3_client.delete_objects(Bucket=s3_bucket_name, Delete={'Objects': stale, 'Quiet': True})
+
+
+def publish_vector_store(request_id, vector_store, local_folder_path, report=streamlit.write):
+    """ Writes the request's index once and uploads it with a manifest of its chunk IDs """
+    s3_bucket_name = f"GPI-{request_id}"
+    s3_client.create_bucket(Bucket=s3_bucket_name)
+
+    version = str(int(time.time() * 1000))
+    index_name = request_id
+    index_prefix = f"indexes/{version}/"
+
+    with shared_tracer.span("index") as span:
+        # A resumed job adds restored chunks before newly embedded ones, so rows are put back in chunk ID order
+        vectors = reconstruct_all(vector_store.index)
+        documents = [vector_store.docstore.search(doc_id) for _, doc_id in sorted(vector_store.index_to_docstore_id.items())]
+        order = sorted(range(len(documents)), key=lambda position: documents[position].metadata['chunk_id'])
+        vectors = vectors[order]
+        documents = [documents[position] for position in order]
+        chunk_ids = [document.metadata['chunk_id'] for document in documents]
+
+        # Chunks are added to an exact flat index as they are embedded; large corpora get an ANN index here
+        index_config = choose_index_config(len(vectors), vectors.shape[1], index_type=index_type, use_pq=index_use_pq)
+        ann_index = build_index(vectors, index_config) if index_config['type'] != "flat" else None
+        extensions = save_compact_index(local_folder_path, index_name, vectors, documents, chunk_ids, ann_index)
+
+        # A keyword index over the same chunks lets the user app match exact clause and part numbers
+        save_bm25_index(build_bm25_index([str(chunk_id) for chunk_id in chunk_ids], [document.page_content for document in documents]),
+                        os.path.join(local_folder_path, f"{index_name}.bm25.json.gz"))
+        span.update(index_type=index_config['type'], vectors=len(vectors))
+
+    with shared_tracer.span("upload") as span:
+        filenames = [os.path.join(local_folder_path, f"{index_name}.{extension}") for extension in extensions + ["bm25.json.gz"]]
+        # The index files and the lookup of the manifest being replaced are independent, so they overlap
+        *_, previous_manifest = aws_io.gather(
+            *(aws_io.call(s3_client, "upload_file", Filename=filename,
+                          Bucket=s3_bucket_name, Key=f"{index_prefix}{os.path.basename(filename)}")
+              for filename in filenames),
+            aws_io.run("s3", get_published_manifest, s3_bucket_name)
+        )
+        span['bytes'] = sum(os.path.getsize(filename) for filename in filenames)
+
+    manifest = {
+        'request_id': request_id,
+        'version': version,
+        'index_name': index_name,
+        'index_prefix': index_prefix,
+        'format': COMPACT_FORMAT,
+        'embedding_model': EMBEDDING_MODEL_ID,
+        'dimension': int(vectors.shape[1]),
+        'index': index_config,
+        'chunk_ids': chunk_ids,
+        # Content fingerprints of the chunks, in chunk ID order, so the next version can be diffed against this one
+        'fingerprints': [embedding_cache.key(document.page_content).hex() for document in documents]
+    }
+    # The manifest is written last, so readers only ever see a fully uploaded index
+    s3_client.put_object(Bucket=s3_bucket_name, Key=MANIFEST_KEY, Body=json.dumps(manifest).encode("utf-8"),
+                         ContentType="application/json")
+
+    if previous_manifest:
+        remove_old_index_versions(s3_bucket_name, [index_prefix, previous_manifest['index_prefix']])
+
+    report(f"Uploaded FAISS Vector Store ({index_config['type']}) with {len(manifest['chunk_ids'])} chunks to S3 bucket: {s3_bucket_name}.")
+    return manifest
+
+
+def download_embedding_cache():
+    if embedding_cache_bucket:
+        embedding_cache.download(s3_client, embedding_cache_bucket)
+
+
+def persist_embedding_cache():
+    if embedding_cache_bucket:
+        embedding_cache.upload(s3_client, embedding_cache_bucket)
+    else:
+        embedding_cache.save()
+
+
+def get_progress_cache(request_id):
+    """ Vectors of a request's checkpointed chunks, synced with the request's bucket so any container can resume it """
+    return EmbeddingCache(os.path.join(vector_store_folder_path, "progress", request_id), embedding_cache.model_id,
+                          key_prefix=PROGRESS_PREFIX)
+
+
+def clear_progress(request_id):
+    """ Deletes a request's progress vectors once its index is published; the index holds them from then on """
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=f"GPI-{request_id}", Prefix=PROGRESS_PREFIX):
+        keys = [{'Key': content['Key']} for content in page.get('Contents', [])]
+        if keys:
+            s3_client.delete_objects(Bucket=f"GPI-{request_id}", Delete={'Objects': keys, 'Quiet': True})
+    shutil.rmtree(os.path.join(vector_store_folder_path, "progress", request_id), ignore_errors=True)
+
+
+def clear_previous_version(request_id, documents, local_folder_path, report):
+    """ Prepares an update of a published document: diffs chunk fingerprints against the published
+    version, seeds the embedding cache with the vectors of unchanged chunks and resets checkpoints """
+    s3_bucket_name = f"GPI-{request_id}"
+    manifest = get_published_manifest(s3_bucket_name)
+    if manifest is None:
+        report(f"No published version of Request ID: {request_id} was found, processing it in full.")
+        return
+
+    previous_fingerprints = set(manifest.get('fingerprints', []))
+    fingerprints = [embedding_cache.key(document.page_content).hex() for document in documents]
+    current_fingerprints = set(fingerprints)
+    unchanged = sum(1 for fingerprint in fingerprints if fingerprint in previous_fingerprints)
+    deleted = len(previous_fingerprints - current_fingerprints)
+
+    previous_vectors = load_published_vectors(s3_bucket_name, manifest, os.path.join(local_folder_path, "previous"))
+    kept = [(document.page_content, previous_vectors[fingerprint])
+            for document, fingerprint in zip(documents, fingerprints) if fingerprint in previous_vectors]
+    embedding_cache.put_many([text for text, _ in kept], [vector for _, vector in kept])
+
+    clear_checkpoints(dynamodb_client, CHECKPOINT_TABLE, request_id)
+    report(f"Updating from version {manifest['version']}: {unchanged} unchanged chunks, "
+           f"{len(fingerprints) - unchanged} new or changed chunks, {deleted} deleted chunks.")
+
+
+def process_pdf(pdf_name, request_id, report=streamlit.write, update=False):
+    """Process PDF into chunks and create a vector store, sending progress messages to report.
+
+    With update=True only chunks that differ from the published version are embedded, and the
+    rebuilt index no longer contains chunks that were deleted from the PDF.
+    """
+    # Pages are loaded and split together in the parser's worker processes, so both are one span
+    with shared_tracer.span("load_split") as span:
+        parse_started_at = time.perf_counter()
+        page_count, documents = parse_pdf(pdf_name, 1000, 200, workers=pdf_parse_workers,
+                                          min_pages_per_worker=pdf_parse_min_pages_per_worker)
+        parse_seconds = time.perf_counter() - parse_started_at
+        span.update(pages=page_count, chunks=len(documents))
+
+    report(f"Total # of Pages: {page_count}")
+    report(f"Finished processing pages into documents ({page_count / max(parse_seconds, 1e-6):.1f} pages/sec with {parse_workers(page_count, pdf_parse_workers, pdf_parse_min_pages_per_worker)} workers).\n\n")
+
+    local_folder_path = vector_store_folder_path
+    os.makedirs(local_folder_path, exist_ok=True)
+
+    s3_bucket_name = f"GPI-{request_id}"
+    s3_client.create_bucket(Bucket=s3_bucket_name)
+    progress_cache = get_progress_cache(request_id)
+
+    def persist_progress():
+        persist_embedding_cache()
+        progress_cache.upload(s3_client, s3_bucket_name)
+
+    # A chunk is checkpointed once its embedding is persisted in the request's bucket, so a resumed job,
+    # in this container or another, reads it back instead of embedding it again
+    checkpoint_writer = CheckpointWriter(dynamodb_client, CHECKPOINT_TABLE, REQUEST_STATUS_TABLE, request_id,
+                                         flush_interval=CHECKPOINT_FLUSH_INTERVAL, before_flush=persist_progress)
+    checkpoint_writer.set_state('IN_PROGRESS', total_chunks=len(documents))
+    try:
+        if not documents:
+            # E.g. a scanned PDF with no text layer; there is nothing to embed or publish
+            raise ValueError(f"No text could be extracted from the {page_count} pages of the PDF. "
+                             f"Scanned PDFs need OCR before they can be processed.")
+        if update:
+            clear_previous_version(request_id, documents, local_folder_path, report)
+        with shared_tracer.span("resume"):
+            # Reading checkpoints and fetching the shared embedding cache and the request's progress are independent, so they overlap
+            completed_ranges, _, _ = aws_io.gather(
+                aws_io.run("dynamodb", get_completed_ranges, dynamodb_client, CHECKPOINT_TABLE, request_id),
+                aws_io.run("s3", download_embedding_cache),
+                aws_io.run("s3", progress_cache.download, s3_client, s3_bucket_name)
+            )
+        texts = [document.page_content for document in documents]
+        missing_chunk_ids = set(get_missing_chunk_ids(completed_ranges, len(documents)))
+        completed_chunk_ids = [chunk_id for chunk_id in range(len(documents)) if chunk_id not in missing_chunk_ids]
+        restored = [(chunk_id, vector) for chunk_id, vector
+                    in zip(completed_chunk_ids, progress_cache.get_many([texts[chunk_id] for chunk_id in completed_chunk_ids]))
+                    if vector is not None]
+        # A checkpointed chunk whose vector is not in the bucket (e.g. written before progress was kept there) is embedded again
+        pending_chunk_ids = sorted(missing_chunk_ids | (set(completed_chunk_ids) - {chunk_id for chunk_id, _ in restored}))
+        if completed_chunk_ids:
+            report(f"Resuming: {len(completed_chunk_ids)} of {len(documents)} chunks were already processed, "
+                   f"{len(restored)} of their vectors were restored.")
+
+        vector_store = None
+        embed_started_at = time.perf_counter()
+        add_seconds = 0.0
+        for offset in range(0, len(restored), embedding_batch_size):
+            batch = restored[offset:offset + embedding_batch_size]
+            chunk_ids = [chunk_id for chunk_id, _ in batch]
+            add_started_at = time.perf_counter()
+            vector_store = add_to_vector_store(vector_store, chunk_ids, [documents[chunk_id] for chunk_id in chunk_ids],
+                                               [vector for _, vector in batch])
+            add_seconds += time.perf_counter() - add_started_at
+
+        # Only chunks without a checkpointed vector are embedded, in batches with several requests in flight;
+        # chunks seen in other documents come back from the shared embedding cache without calling the embedder
+        embedding_pipeline = EmbeddingPipeline(bedrock_embeddings, batch_size=embedding_batch_size,
+                                               max_in_flight=embedding_max_in_flight, cache=embedding_cache)
+        for offset, vectors in embedding_pipeline.iter_batches([texts[chunk_id] for chunk_id in pending_chunk_ids]):
+            chunk_ids = pending_chunk_ids[offset:offset + len(vectors)]
+            add_started_at = time.perf_counter()
+            vector_store = add_to_vector_store(vector_store, chunk_ids, [documents[chunk_id] for chunk_id in chunk_ids], vectors)
+            add_seconds += time.perf_counter() - add_started_at
+            progress_cache.put_many([texts[chunk_id] for chunk_id in chunk_ids], vectors)
+            checkpoint_writer.mark_processed(chunk_ids)
+            report(f"Processed Chunks:{chunk_ids[0]}-{chunk_ids[-1]}.")
+        # Embedding and adding batches to the in-memory index interleave, so their totals are recorded separately
+        shared_tracer.record("embed", time.perf_counter() - embed_started_at - add_seconds, started_at=embed_started_at,
+                             chunks=embedding_pipeline.stats['chunks'], embedded=embedding_pipeline.stats['embedded'])
+        shared_tracer.record("index_add", add_seconds, started_at=embed_started_at)
+
+        with shared_tracer.span("checkpoint"):
+            checkpoint_writer.flush()
+            persist_embedding_cache()
+
+        report(f"Embedded {embedding_pipeline.stats['chunks']} chunks in {embedding_pipeline.stats['batches']} batches "
+               f"({embedding_pipeline.chunks_per_sec:.1f} chunks/sec, {embedding_pipeline.stats['retries']} throttling retries).")
+        report(f"Reused {embedding_pipeline.stats['reused']} chunk embeddings from the cache, "
+               f"embedded {embedding_pipeline.stats['embedded']} chunks fresh.")
+
+        publish_vector_store(request_id, vector_store, local_folder_path, report=report)
+        clear_progress(request_id)
+    except Exception as e:
+        checkpoint_writer.set_state('FAILED', total_chunks=len(documents))
+        report(f"Failed to process Request ID: {request_id}: {e}. Please check the logs.")
+        raise
+
+    checkpoint_writer.set_state('COMPLETE', total_chunks=len(documents))
+    report(f"Finished Request ID: {request_id} with {checkpoint_writer.write_calls} checkpoint writes.")
+
+
+def get_failed_requests(start_key=None):
+    """ Returns a page of FAILED request IDs from the status index, and the key of the next page """
+    return get_requests_by_status(dynamodb_client, REQUEST_STATUS_TABLE, 'FAILED', limit=REQUEST_PAGE_SIZE, start_key=start_key)
+
+
+def get_in_progress_requests(start_key=None):
+    return get_requests_by_status(dynamodb_client, REQUEST_STATUS_TABLE, 'IN_PROGRESS', limit=REQUEST_PAGE_SIZE, start_key=start_key)
+
+
+def show_ingestion_jobs():
+    """ Shows the progress the ingestion worker publishes to the job queue """
+    streamlit.write("##")
+    streamlit.write("Ingestion jobs")
+    streamlit.button("Refresh progress")
+    streamlit.json(job_queue.stats())
+    streamlit.dataframe([
+        {key: job[key] for key in ('id', 'request_id', 'status', 'progress', 'error')}
+        for job in job_queue.list_jobs()
+    ])
+
+
+def show_debug_panel():
+    """ Shows the stage breakdown of the last finished ingestion, and the worker's stage histograms """
+    with streamlit.sidebar.expander("Debug: last ingestion"):
+        job = job_queue.get_last_traced_job()
+        if job:
+            streamlit.write(f"Job {job['id']} for Request ID: {job['request_id']} ({job['status']})")
+            streamlit.dataframe(trace_breakdown(job['trace']))
+        else:
+            streamlit.write("No ingestion has finished yet.")
+        if os.path.exists(metrics_path):
+            with open(metrics_path) as f:
+                streamlit.code(f.read(), language="text")
 
 
 def main():
@@ -167,25 +470,45 @@ def main():
                 
                 s3_response = s3_client.list_objects_v2(Bucket=s3_bucket_name, Prefix=f"{request_id}.pdf")
                 if 'Contents' in s3_response:
-                    streamlit.write(f"A PDF with the name '{pdf_name}' already exists in the bucket '{s3_bucket_name}'. Please choose a different name.")
+                    streamlit.write(f"A PDF with the name '{pdf_name}' already exists in the bucket '{s3_bucket_name}'. Please choose a different name, or upload this file as its new version.")
+                    if streamlit.button("Upload as new version"):
+                        saved_file_name = get_upload_path(request_id)
+                        save_uploaded_pdf(uploaded_pdf, saved_file_name, s3_bucket_name, f"{request_id}.pdf")
+                        job, active_job = queue_upload(request_id, saved_file_name, update=True)
+                        streamlit.write(f"Queued update job {job['id']} for Request ID: {request_id}.")
+                        if active_job:
+                            streamlit.write(f"It starts once job {active_job['id']} for this request has finished.")
                 else:
                     streamlit.write(f"Request ID: {request_id}")
-                    saved_file_name = f"{request_id}.pdf"
-                    with open(saved_file_name, "wb") as sf:
-                        sf.write(uploaded_pdf.getvalue())
-                    
-                    s3_client.upload_file(Filename=saved_file_name, Bucket=s3_bucket_name, Key=f"{request_id}.pdf")
-                    process_pdf(saved_file_name, request_id)
+                    saved_file_name = get_upload_path(request_id)
+                    save_uploaded_pdf(uploaded_pdf, saved_file_name, s3_bucket_name, f"{request_id}.pdf")
+                    job, _ = queue_upload(request_id, saved_file_name)
+                    if job['pdf_name'] != saved_file_name:
+                        streamlit.write(f"Request ID: {request_id} is already being ingested by job {job['id']}.")
+                    else:
+                        streamlit.write(f"Queued ingestion job {job['id']} for Request ID: {request_id}.")
 
     if uploaded_pdf is None:
         streamlit.write("If any of your previous processings were failed and you want to resume, select from the list below:")
-        failed_requests = get_failed_requests()
+        failed_requests, next_start_key = get_failed_requests(streamlit.session_state.get('failed_requests_start_key'))
+        if next_start_key and streamlit.button("Show older failed requests"):
+            streamlit.session_state['failed_requests_start_key'] = next_start_key
+            streamlit.rerun()
+
+        in_progress_requests, _ = get_in_progress_requests()
+        if in_progress_requests:
+            streamlit.write(f"Requests currently in progress: {', '.join(in_progress_requests)}")
+
         selected_request_id = streamlit.selectbox("Select a Request ID to resume:", ["Select an ID"] + failed_requests)
 
         if selected_request_id != "Select an ID":
-            streamlit.write(f"Resuming processing for Request ID: {selected_request_id}")
-            saved_file_name = f"{selected_request_id}.pdf"
-            process_pdf(saved_file_name, selected_request_id)
+            # The worker downloads the PDF from S3, since the failed job's local copy has been removed
+            saved_file_name = get_upload_path(selected_request_id)
+            job, _ = queue_upload(selected_request_id, saved_file_name)
+            streamlit.write(f"Queued ingestion job {job['id']} to resume Request ID: {selected_request_id}.")
+
+    show_ingestion_jobs()
+    show_debug_panel()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,131 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from botocore.config import Config
+
+
+DEFAULT_LIMITS = {'s3': 16, 'dynamodb': 8, 'bedrock-runtime': 4}
+
+
+class AsyncAWS:
+    """ asyncio layer over blocking boto3 calls, so independent calls can overlap
+
+    Calls run on a shared thread pool sized to the clients' connection pools. Per-service limits
+    are enforced with thread semaphores, so they hold across every event loop and thread of the
+    process (Streamlit sessions, ingestion worker jobs). Functions run through this layer must not
+    call gather themselves, or they could wait on their own pool.
+    """
+
+    def __init__(self, max_pool_connections=32, limits=None):
+        self.client_config = Config(max_pool_connections=max_pool_connections)
+        self._executor = ThreadPoolExecutor(max_workers=max_pool_connections, thread_name_prefix="aws-io")
+        self._limits = {service: threading.BoundedSemaphore(limit) for service, limit in (limits or DEFAULT_LIMITS).items()}
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.stats = {'calls': 0, 'max_in_flight': 0}
+
+    def _call_limited(self, service, function, *args, **kwargs):
+        with self._limits.get(service) or nullcontext():
+            with self._lock:
+                self._in_flight += 1
+                self.stats['calls'] += 1
+                self.stats['max_in_flight'] = max(self.stats['max_in_flight'], self._in_flight)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+
+    async def run(self, service, function, *args, **kwargs):
+        """ Runs a blocking function that talks to the given service, within that service's limit """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(self._call_limited, service, function, *args, **kwargs))
+
+    async def call(self, client, operation, **kwargs):
+        """ Runs a boto3 client operation, e.g. await aws_io.call(s3_client, "upload_file", ...) """
+        return await self.run(client.meta.service_model.service_name, getattr(client, operation), **kwargs)
+
+    def gather(self, *coroutines):
+        """ Runs the coroutines concurrently from synchronous code and returns their results in order """
+        async def gather_all():
+            return await asyncio.gather(*coroutines)
+        return asyncio.run(gather_all())
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    import tempfile
+    import time
+
+    import boto3
+    from moto import mock_aws
+
+    from checkpoints import CheckpointWriter, get_completed_ranges
+    from embedding_cache import EmbeddingCache
+
+    parser = argparse.ArgumentParser(description="Benchmark the AWS I/O of one ingestion with blocking and with overlapping calls.")
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated network latency added to every AWS request, in seconds")
+    parser.add_argument("--index-files", type=int, default=6)
+    parser.add_argument("--chunks", type=int, default=2000)
+    args = parser.parse_args()
+
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws(), tempfile.TemporaryDirectory() as folder:
+        aws_io = AsyncAWS()
+        s3 = boto3.client("s3", config=aws_io.client_config)
+        dynamodb = boto3.client("dynamodb", config=aws_io.client_config)
+        for client in (s3, dynamodb):
+            client.meta.events.register("before-send", lambda **kwargs: time.sleep(args.latency))
+
+        s3.create_bucket(Bucket="index-bucket")
+        s3.create_bucket(Bucket="cache-bucket")
+        dynamodb.create_table(TableName="Checkpoints", BillingMode="PAY_PER_REQUEST",
+                              KeySchema=[{'AttributeName': "RequestID", 'KeyType': "HASH"}, {'AttributeName': "ChunkID", 'KeyType': "RANGE"}],
+                              AttributeDefinitions=[{'AttributeName': "RequestID", 'AttributeType': "S"}, {'AttributeName': "ChunkID", 'AttributeType': "N"}])
+        dynamodb.create_table(TableName="Requests", BillingMode="PAY_PER_REQUEST",
+                              KeySchema=[{'AttributeName': "RequestID", 'KeyType': "HASH"}],
+                              AttributeDefinitions=[{'AttributeName': "RequestID", 'AttributeType': "S"}])
+
+        cache = EmbeddingCache(os.path.join(folder, "cache"), "benchmark")
+        cache.put_many([f"chunk {i}" for i in range(args.chunks)], [[float(i)] * 64 for i in range(args.chunks)])
+        cache.upload(s3, "cache-bucket")
+        filenames = []
+        for i in range(args.index_files):
+            filenames.append(os.path.join(folder, f"index.{i}"))
+            with open(filenames[-1], "wb") as f:
+                f.write(os.urandom(1024 * 1024))
+
+        def ingest_sync(request_id):
+            writer = CheckpointWriter(dynamodb, "Checkpoints", "Requests", request_id)
+            writer.set_state('IN_PROGRESS', total_chunks=args.chunks)
+            get_completed_ranges(dynamodb, "Checkpoints", request_id)
+            cache.download(s3, "cache-bucket")
+            writer.mark_processed(range(args.chunks))
+            writer.flush()
+            for i, filename in enumerate(filenames):
+                s3.upload_file(Filename=filename, Bucket="index-bucket", Key=f"{request_id}/index.{i}")
+            s3.put_object(Bucket="index-bucket", Key=f"{request_id}/manifest.json", Body=b"{}")
+            writer.set_state('COMPLETE', total_chunks=args.chunks)
+
+        def ingest_async(request_id):
+            writer = CheckpointWriter(dynamodb, "Checkpoints", "Requests", request_id)
+            writer.set_state('IN_PROGRESS', total_chunks=args.chunks)
+            aws_io.gather(aws_io.run("dynamodb", get_completed_ranges, dynamodb, "Checkpoints", request_id),
+                          aws_io.run("s3", cache.download, s3, "cache-bucket"))
+            writer.mark_processed(range(args.chunks))
+            writer.flush()
+            aws_io.gather(*(aws_io.call(s3, "upload_file", Filename=filename, Bucket="index-bucket", Key=f"{request_id}/index.{i}")
+                            for i, filename in enumerate(filenames)))
+            s3.put_object(Bucket="index-bucket", Key=f"{request_id}/manifest.json", Body=b"{}")
+            writer.set_state('COMPLETE', total_chunks=args.chunks)
+
+        for name, ingest in (("sync", ingest_sync), ("async", ingest_async)):
+            started_at = time.perf_counter()
+            ingest(f"request-{name}")
+            print(f"{name}: {time.perf_counter() - started_at:.2f}s of AWS I/O per ingestion "
+                  f"({args.latency * 1000:.0f}ms per request, {args.index_files} index files)")
+        print(f"async layer: {aws_io.stats['calls']} calls, at most {aws_io.stats['max_in_flight']} in flight")
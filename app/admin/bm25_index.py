@@ -0,0 +1,39 @@
+import gzip
+import json
+import re
+from collections import Counter
+
+
+# Keeps dotted/dashed identifiers such as clause numbers (4.2.1) and part numbers (AB-1234) as single terms
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.\-/][a-z0-9]+)*")
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def build_bm25_index(doc_ids, texts, k1=1.5, b=0.75):
+    """ Builds a compact inverted index: for each term, parallel lists of document positions and term frequencies """
+    postings = {}
+    doc_lengths = []
+    for position, text in enumerate(texts):
+        terms = Counter(tokenize(text))
+        doc_lengths.append(sum(terms.values()))
+        for term, frequency in terms.items():
+            docs, frequencies = postings.setdefault(term, ([], []))
+            docs.append(position)
+            frequencies.append(frequency)
+
+    return {
+        'k1': k1,
+        'b': b,
+        'doc_ids': list(doc_ids),
+        'doc_lengths': doc_lengths,
+        'avg_doc_length': sum(doc_lengths) / len(doc_lengths) if doc_lengths else 0.0,
+        'postings': postings
+    }
+
+
+def save_bm25_index(index, filename):
+    with gzip.open(filename, "wt", encoding="utf-8") as f:
+        json.dump(index, f, separators=(",", ":"))
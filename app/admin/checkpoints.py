@@ -0,0 +1,233 @@
+import bisect
+import threading
+import time
+
+
+BATCH_WRITE_LIMIT = 25
+STATUS_INDEX = "StatusIndex"
+
+
+def coalesce_ranges(chunk_ids):
+    """ Turns chunk IDs into sorted, inclusive (start, end) ranges """
+    ranges = []
+    for chunk_id in sorted(set(chunk_ids)):
+        if ranges and chunk_id == ranges[-1][1] + 1:
+            ranges[-1] = (ranges[-1][0], chunk_id)
+        else:
+            ranges.append((chunk_id, chunk_id))
+    return ranges
+
+
+def get_completed_ranges(dynamodb_client, table_name, request_id):
+    """ Returns the merged chunk ranges checkpointed for a request, across all workers """
+    paginator = dynamodb_client.get_paginator('query')
+    chunk_ids = []
+    for page in paginator.paginate(
+        TableName=table_name,
+        KeyConditionExpression='RequestID = :requestid AND ChunkID >= :first',
+        ExpressionAttributeValues={
+            ':requestid': {'S': request_id},
+            ':first': {'N': '0'}
+        }
+    ):
+        for item in page.get('Items', []):
+            start = int(item['ChunkID']['N'])
+            end = int(item.get('EndChunkID', item['ChunkID'])['N'])
+            chunk_ids.extend(range(start, end + 1))
+    return coalesce_ranges(chunk_ids)
+
+
+def clear_checkpoints(dynamodb_client, table_name, request_id):
+    """ Deletes a request's chunk range rows, e.g. before its document is re-ingested as a new version """
+    paginator = dynamodb_client.get_paginator('query')
+    keys = []
+    for page in paginator.paginate(
+        TableName=table_name,
+        KeyConditionExpression='RequestID = :requestid',
+        ExpressionAttributeValues={':requestid': {'S': request_id}},
+        ProjectionExpression='RequestID, ChunkID'
+    ):
+        keys.extend(page.get('Items', []))
+
+    for i in range(0, len(keys), BATCH_WRITE_LIMIT):
+        requests = [{'DeleteRequest': {'Key': key}} for key in keys[i:i + BATCH_WRITE_LIMIT]]
+        while requests:
+            response = dynamodb_client.batch_write_item(RequestItems={table_name: requests})
+            requests = response.get('UnprocessedItems', {}).get(table_name, [])
+            if requests:
+                time.sleep(0.1)
+
+
+def get_requests_by_status(dynamodb_client, status_table_name, status, limit=50, start_key=None):
+    """ Returns one page of request IDs in the given state, newest first, and the key of the next page """
+    kwargs = {}
+    if start_key:
+        kwargs['ExclusiveStartKey'] = start_key
+    response = dynamodb_client.query(
+        TableName=status_table_name,
+        IndexName=STATUS_INDEX,
+        KeyConditionExpression='#status = :status',
+        ExpressionAttributeNames={'#status': 'Status'},
+        ExpressionAttributeValues={':status': {'S': status}},
+        ScanIndexForward=False,
+        Limit=limit,
+        **kwargs
+    )
+    request_ids = [item['RequestID']['S'] for item in response.get('Items', [])]
+    return request_ids, response.get('LastEvaluatedKey')
+
+
+def get_missing_chunk_ids(completed_ranges, total_chunks):
+    completed = set()
+    for start, end in completed_ranges:
+        completed.update(range(start, end + 1))
+    return [chunk_id for chunk_id in range(total_chunks) if chunk_id not in completed]
+
+
+class CheckpointWriter:
+    """ Buffers processed chunk IDs and flushes them as range rows with BatchWriteItem """
+
+    def __init__(self, dynamodb_client, table_name, status_table_name, request_id, flush_interval=30.0, before_flush=None, max_retries=5):
+        self.dynamodb_client = dynamodb_client
+        self.table_name = table_name
+        self.status_table_name = status_table_name
+        self.request_id = request_id
+        self.flush_interval = flush_interval
+        self.before_flush = before_flush
+        self.max_retries = max_retries
+        self._pending = set()
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self.write_calls = 0
+
+    def set_state(self, status, total_chunks=None):
+        """ Records IN_PROGRESS/FAILED/COMPLETE on the request's status record """
+        item = {
+            'RequestID': {'S': self.request_id},
+            'Status': {'S': status},
+            'UpdatedAt': {'N': str(int(time.time()))}
+        }
+        if total_chunks is not None:
+            item['TotalChunks'] = {'N': str(total_chunks)}
+        self.dynamodb_client.put_item(TableName=self.status_table_name, Item=item)
+        self.write_calls += 1
+
+    def mark_processed(self, chunk_ids):
+        with self._lock:
+            self._pending.update(chunk_ids)
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, set()
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+
+        try:
+            self._write_ranges(pending)
+        except Exception:
+            with self._lock:
+                self._pending.update(pending)
+            raise
+
+    def _write_ranges(self, pending):
+        # Whatever makes the chunks recoverable (e.g. persisting their embeddings) must land first
+        if self.before_flush:
+            self.before_flush()
+
+        requests = [{
+            'PutRequest': {
+                'Item': {
+                    'RequestID': {'S': self.request_id},
+                    'ChunkID': {'N': str(start)},
+                    'EndChunkID': {'N': str(end)},
+                    'Status': {'S': 'PROCESSED'}
+                }
+            }
+        } for start, end in self._merge_with_stored(pending)]
+
+        for i in range(0, len(requests), BATCH_WRITE_LIMIT):
+            self._batch_write(requests[i:i + BATCH_WRITE_LIMIT])
+
+    def _merge_with_stored(self, pending):
+        """ Returns the ranges to write for the pending chunk IDs, widened by the ranges already stored
+
+        Rows are keyed by their first chunk ID, so writing a narrower range over a stored row that
+        starts at the same chunk (e.g. a resume re-embedding chunk N) would lose the rest of that row.
+        A merged range contains every stored row it overlaps, so it only ever replaces a row with a wider one.
+        """
+        covered = set(pending)
+        for start, end in get_completed_ranges(self.dynamodb_client, self.table_name, self.request_id):
+            covered.update(range(start, end + 1))
+        merged = coalesce_ranges(covered)
+        starts = [start for start, _ in merged]
+        # Only the merged ranges holding pending chunks change
+        touched = {bisect.bisect_right(starts, start) - 1 for start, _ in coalesce_ranges(pending)}
+        return [merged[i] for i in sorted(touched)]
+
+    def _batch_write(self, requests):
+        for attempt in range(self.max_retries + 1):
+            response = self.dynamodb_client.batch_write_item(RequestItems={self.table_name: requests})
+            self.write_calls += 1
+            requests = response.get('UnprocessedItems', {}).get(self.table_name, [])
+            if not requests:
+                return
+            time.sleep(min(5.0, 0.1 * (2 ** attempt)))
+        raise RuntimeError(f"{len(requests)} checkpoint writes for {self.request_id} were still unprocessed after retries")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import boto3
+    from moto import mock_aws
+
+    parser = argparse.ArgumentParser(description="Benchmark checkpoint writes and status lookups against a moto DynamoDB stand-in.")
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--documents", type=int, nargs="+", default=[1, 10, 50])
+    args = parser.parse_args()
+
+    with mock_aws():
+        client = boto3.client("dynamodb", region_name="us-east-1")
+        client.create_table(
+            TableName="PDFProcessingCheckpoints",
+            KeySchema=[{'AttributeName': 'RequestID', 'KeyType': 'HASH'}, {'AttributeName': 'ChunkID', 'KeyType': 'RANGE'}],
+            AttributeDefinitions=[{'AttributeName': 'RequestID', 'AttributeType': 'S'}, {'AttributeName': 'ChunkID', 'AttributeType': 'N'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        client.create_table(
+            TableName="PDFProcessingRequests",
+            KeySchema=[{'AttributeName': 'RequestID', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'RequestID', 'AttributeType': 'S'},
+                                  {'AttributeName': 'Status', 'AttributeType': 'S'},
+                                  {'AttributeName': 'UpdatedAt', 'AttributeType': 'N'}],
+            GlobalSecondaryIndexes=[{
+                'IndexName': STATUS_INDEX,
+                'KeySchema': [{'AttributeName': 'Status', 'KeyType': 'HASH'}, {'AttributeName': 'UpdatedAt', 'KeyType': 'RANGE'}],
+                'Projection': {'ProjectionType': 'KEYS_ONLY'}
+            }],
+            BillingMode='PAY_PER_REQUEST'
+        )
+
+        written = 0
+        for documents in args.documents:
+            while written < documents:
+                writer = CheckpointWriter(client, "PDFProcessingCheckpoints", "PDFProcessingRequests", f"doc-{written}", flush_interval=0.5)
+                writer.set_state('IN_PROGRESS', total_chunks=args.chunks)
+                for start in range(0, args.chunks, args.batch_size):
+                    writer.mark_processed(range(start, min(start + args.batch_size, args.chunks)))
+                writer.flush()
+                writer.set_state('FAILED' if written % 2 else 'COMPLETE')
+                written += 1
+
+            started_at = time.perf_counter()
+            failed, _ = get_requests_by_status(client, "PDFProcessingRequests", 'FAILED')
+            lookup = time.perf_counter() - started_at
+            ranges = get_completed_ranges(client, "PDFProcessingCheckpoints", "doc-0")
+            print(f"{documents} documents x {args.chunks} chunks: {writer.write_calls} write calls per document "
+                  f"(vs {args.chunks} put_item calls), status lookup {lookup * 1000:.1f}ms for {len(failed)} failed requests, "
+                  f"doc-0 missing {len(get_missing_chunk_ids(ranges, args.chunks))} chunks")
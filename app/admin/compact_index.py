@@ -0,0 +1,47 @@
+import json
+import os
+
+import faiss
+import numpy
+
+
+# Published index layout, readable without unpickling anything:
+#   <name>.vectors.f32   raw little-endian float32 vectors, one row per chunk, memory-mappable
+#   <name>.ids.i64       chunk ID of each row, ascending
+#   <name>.chunks.jsonl  one JSON record (page_content, metadata) per row
+#   <name>.offsets.u64   byte offset of each record in the chunks file, plus the file's length
+#   <name>.faiss         ANN index over the same rows, only for non-flat index types
+COMPACT_FORMAT = "compact-v1"
+VECTORS_EXTENSION = "vectors.f32"
+IDS_EXTENSION = "ids.i64"
+CHUNKS_EXTENSION = "chunks.jsonl"
+OFFSETS_EXTENSION = "offsets.u64"
+ANN_INDEX_EXTENSION = "faiss"
+
+
+def save_compact_index(folder_path, index_name, vectors, documents, chunk_ids, ann_index=None):
+    """ Writes the index in the compact layout and returns the extensions of the files written """
+    def path(extension):
+        return os.path.join(folder_path, f"{index_name}.{extension}")
+
+    numpy.ascontiguousarray(vectors, dtype="<f4").tofile(path(VECTORS_EXTENSION))
+    numpy.asarray(chunk_ids, dtype="<i8").tofile(path(IDS_EXTENSION))
+
+    offsets = [0]
+    with open(path(CHUNKS_EXTENSION), "wb") as f:
+        for document in documents:
+            record = {'page_content': document.page_content, 'metadata': document.metadata}
+            f.write(json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n")
+            offsets.append(f.tell())
+    numpy.asarray(offsets, dtype="<u8").tofile(path(OFFSETS_EXTENSION))
+
+    extensions = [VECTORS_EXTENSION, IDS_EXTENSION, CHUNKS_EXTENSION, OFFSETS_EXTENSION]
+    if ann_index is not None:
+        faiss.write_index(ann_index, path(ANN_INDEX_EXTENSION))
+        extensions.append(ANN_INDEX_EXTENSION)
+    return extensions
+
+
+def load_compact_vectors(folder_path, index_name, dimension):
+    """ Returns the published vectors as a read-only memory-mapped (rows, dimension) array """
+    return numpy.memmap(os.path.join(folder_path, f"{index_name}.{VECTORS_EXTENSION}"), dtype="<f4", mode="r").reshape(-1, dimension)
@@ -0,0 +1,203 @@
+import hashlib
+import os
+import re
+import struct
+import threading
+import uuid
+
+import numpy
+
+
+SEGMENT_EXTENSION = ".segment"
+SEGMENT_MAGIC = b"QPDFEMB1"
+# Magic, vector count and dimension, padded so keys and vectors start at fixed offsets
+SEGMENT_HEADER = struct.Struct("<8sQI12x")
+KEY_SIZE = 32
+
+
+def segment_size(count, dimension):
+    return SEGMENT_HEADER.size + count * KEY_SIZE + count * dimension * 4
+
+
+class EmbeddingCache:
+    """ Content-addressed store of chunk embeddings: sha256(model ID + normalized text) -> float32 vector
+
+    Stored as immutable segment files in '<folder>/<model>/', one per save. A segment holds a
+    header, the 32-byte digests and the float32 rows in the same order, so its keys can only be
+    read with its own vectors. Syncing with S3 transfers only segments the other side lacks.
+    """
+
+    def __init__(self, folder_path, model_id, max_segments=64, key_prefix=""):
+        self.model_id = model_id
+        self.prefix = re.sub(r"[^A-Za-z0-9_.-]", "_", model_id)
+        self.folder_path = os.path.join(folder_path, self.prefix)
+        # Segments are stored in S3 under '<key_prefix><model>/'
+        self.key_prefix = f"{key_prefix}{self.prefix}/"
+        self.max_segments = max_segments
+        self._lock = threading.RLock()
+        self._pending = {}
+        # Segments already in S3, remote segments that failed validation and are not downloaded again,
+        # and remote segments merged away by compaction that the next upload deletes
+        self._remote = set()
+        self._rejected = set()
+        self._stale = set()
+        self.load()
+
+    def load(self):
+        with self._lock:
+            self._rows = {}
+            self._segments = {}
+            self.dimension = None
+            if os.path.isdir(self.folder_path):
+                for name in sorted(os.listdir(self.folder_path)):
+                    if name.endswith(SEGMENT_EXTENSION):
+                        self._open_segment(name)
+            # Vectors added by other jobs since the last save stay pending unless the segments already have them
+            self._pending = {key: vector for key, vector in self._pending.items() if key not in self._rows}
+
+    def _path(self, name):
+        return os.path.join(self.folder_path, name)
+
+    def _open_segment(self, name):
+        """ Maps a segment's vectors and indexes its keys; a segment that fails validation is deleted,
+        so its chunks are embedded again instead of being read with the wrong vectors """
+        path = self._path(name)
+        with open(path, "rb") as f:
+            header = f.read(SEGMENT_HEADER.size)
+            magic, count, dimension = SEGMENT_HEADER.unpack(header) if len(header) == SEGMENT_HEADER.size else (None, 0, 0)
+            keys = f.read(count * KEY_SIZE)
+        if magic != SEGMENT_MAGIC or count == 0 or os.path.getsize(path) != segment_size(count, dimension) \
+                or self.dimension not in (None, dimension):
+            os.remove(path)
+            self._rejected.add(name)
+            return False
+
+        self.dimension = dimension
+        self._segments[name] = numpy.memmap(path, dtype="<f4", mode="r", offset=SEGMENT_HEADER.size + count * KEY_SIZE,
+                                            shape=(count, dimension))
+        for i in range(count):
+            self._rows.setdefault(keys[i * KEY_SIZE:(i + 1) * KEY_SIZE], (name, i))
+        return True
+
+    def _write_segment(self, keys, vectors):
+        """ Writes a new segment and returns its name; it only appears under that name once complete """
+        os.makedirs(self.folder_path, exist_ok=True)
+        name = f"{uuid.uuid4().hex}{SEGMENT_EXTENSION}"
+        temp_path = self._path(f"{name}.tmp")
+        with open(temp_path, "wb") as f:
+            f.write(SEGMENT_HEADER.pack(SEGMENT_MAGIC, len(keys), vectors.shape[1]))
+            f.write(b"".join(keys))
+            f.write(numpy.ascontiguousarray(vectors, dtype="<f4").tobytes())
+        os.replace(temp_path, self._path(name))
+        return name
+
+    def __len__(self):
+        return len(self._rows) + len(self._pending)
+
+    def key(self, text):
+        normalized = " ".join(text.split())
+        return hashlib.sha256(f"{self.model_id}\n{normalized}".encode("utf-8")).digest()
+
+    def get_many(self, texts):
+        """ Returns a vector (or None on a miss) for each text """
+        with self._lock:
+            vectors = []
+            for text in texts:
+                key = self.key(text)
+                if key in self._pending:
+                    vectors.append(self._pending[key])
+                elif key in self._rows:
+                    name, row = self._rows[key]
+                    vectors.append(self._segments[name][row])
+                else:
+                    vectors.append(None)
+            return vectors
+
+    def put_many(self, texts, vectors):
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = self.key(text)
+                if key in self._rows:
+                    continue
+                vector = numpy.asarray(vector, dtype=numpy.float32)
+                if self.dimension is None:
+                    self.dimension = len(vector)
+                elif vector.shape != (self.dimension,):
+                    raise ValueError(f"Expected {self.dimension}-dimensional vectors for {self.model_id}, got {vector.shape}")
+                self._pending[key] = vector
+
+    def save(self):
+        """ Writes the vectors added since the last save as a new segment, compacting once there are too many """
+        with self._lock:
+            if not self._pending:
+                return
+            keys = list(self._pending)
+            name = self._write_segment(keys, numpy.stack([self._pending[key] for key in keys]))
+            self._open_segment(name)
+            self._pending = {}
+            if len(self._segments) > self.max_segments:
+                self.compact()
+
+    def compact(self):
+        """ Merges all segments into one; returns the names of the segments it replaced """
+        with self._lock:
+            self.save()
+            if len(self._segments) <= 1:
+                return []
+            keys = list(self._rows)
+            vectors = numpy.stack([self._segments[name][row] for name, row in self._rows.values()])
+            replaced = list(self._segments)
+            self._write_segment(keys, vectors)
+            for name in replaced:
+                os.remove(self._path(name))
+            self._stale.update(name for name in replaced if name in self._remote)
+            self.load()
+            return replaced
+
+    def download(self, s3_client, s3_bucket_name):
+        """ Fetches the segments stored in S3 that are not on local disk yet """
+        remote_names = set()
+        paginator = s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=s3_bucket_name, Prefix=self.key_prefix):
+            remote_names.update(os.path.basename(content['Key']) for content in page.get('Contents', [])
+                                if content['Key'].endswith(SEGMENT_EXTENSION))
+
+        with self._lock:
+            missing = remote_names - set(self._segments) - self._rejected - self._stale
+        os.makedirs(self.folder_path, exist_ok=True)
+        downloaded = []
+        for name in sorted(missing):
+            temp_path = self._path(f"{name}.tmp")
+            try:
+                s3_client.download_file(Bucket=s3_bucket_name, Key=f"{self.key_prefix}{name}", Filename=temp_path)
+            except s3_client.exceptions.ClientError as e:
+                # Another worker may have compacted the segment away since it was listed
+                if e.response['Error']['Code'] not in ("404", "NoSuchKey"):
+                    raise
+                continue
+            os.replace(temp_path, self._path(name))
+            downloaded.append(name)
+
+        with self._lock:
+            for name in downloaded:
+                self._open_segment(name)
+            self._remote.update(remote_names & set(self._segments))
+            self._pending = {key: vector for key, vector in self._pending.items() if key not in self._rows}
+
+    def upload(self, s3_client, s3_bucket_name):
+        """ Saves pending vectors, uploads the segments S3 does not have and deletes the ones compaction replaced """
+        with self._lock:
+            self.save()
+            names = [name for name in self._segments if name not in self._remote]
+            stale = list(self._stale)
+
+        for name in names:
+            s3_client.upload_file(Filename=self._path(name), Bucket=s3_bucket_name, Key=f"{self.key_prefix}{name}")
+        for i in range(0, len(stale), 1000):
+            s3_client.delete_objects(Bucket=s3_bucket_name,
+                                     Delete={'Objects': [{'Key': f"{self.key_prefix}{name}"} for name in stale[i:i + 1000]]})
+
+        with self._lock:
+            self._remote.update(names)
+            self._remote.difference_update(stale)
+            self._stale.difference_update(stale)
@@ -0,0 +1,120 @@
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+
+THROTTLING_ERROR_CODES = {"ThrottlingException", "TooManyRequestsException", "ServiceUnavailableException"}
+
+
+def is_throttling_error(error):
+    """ Checks whether an embedding call failed because the backend throttled us """
+    if isinstance(error, ClientError):
+        return error.response.get('Error', {}).get('Code') in THROTTLING_ERROR_CODES
+    # BedrockEmbeddings re-raises client errors as ValueError with the original message
+    return any(code in str(error) for code in THROTTLING_ERROR_CODES)
+
+
+class EmbeddingPipeline:
+    """ Embeds chunks in batches, keeping a bounded number of batches in flight """
+
+    def __init__(self, embeddings, batch_size=32, max_in_flight=4, max_retries=5, backoff_base=0.5, backoff_max=20.0, cache=None):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {'chunks': 0, 'batches': 0, 'retries': 0, 'reused': 0, 'embedded': 0, 'seconds': 0.0}
+
+    @property
+    def chunks_per_sec(self):
+        if not self.stats['seconds']:
+            return 0.0
+        return self.stats['chunks'] / self.stats['seconds']
+
+    def _embed_with_retries(self, texts):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.embeddings.embed_documents(texts)
+            except Exception as e:
+                if attempt == self.max_retries or not is_throttling_error(e):
+                    raise
+                with self._lock:
+                    self.stats['retries'] += 1
+                delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+                time.sleep(delay * random.uniform(0.5, 1.0))
+
+    def _embed_batch(self, texts):
+        vectors = self.cache.get_many(texts) if self.cache is not None else [None] * len(texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            embedded = self._embed_with_retries(missing_texts)
+            for i, vector in zip(missing, embedded):
+                vectors[i] = vector
+            if self.cache is not None:
+                self.cache.put_many(missing_texts, embedded)
+
+        with self._lock:
+            self.stats['reused'] += len(texts) - len(missing)
+            self.stats['embedded'] += len(missing)
+        return vectors
+
+    def iter_batches(self, texts):
+        """ Yields (offset, vectors) for each batch, in input order """
+        batches = deque((offset, texts[offset:offset + self.batch_size])
+                        for offset in range(0, len(texts), self.batch_size))
+        started_at = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            in_flight = deque()
+            while batches and len(in_flight) < self.max_in_flight:
+                offset, batch = batches.popleft()
+                in_flight.append((offset, executor.submit(self._embed_batch, batch)))
+
+            while in_flight:
+                offset, future = in_flight.popleft()
+                vectors = future.result()
+                if batches:
+                    next_offset, next_batch = batches.popleft()
+                    in_flight.append((next_offset, executor.submit(self._embed_batch, next_batch)))
+
+                self.stats['chunks'] += len(vectors)
+                self.stats['batches'] += 1
+                self.stats['seconds'] = time.perf_counter() - started_at
+                yield offset, vectors
+
+    def embed_documents(self, texts):
+        vectors = []
+        for _, batch_vectors in self.iter_batches(texts):
+            vectors.extend(batch_vectors)
+        return vectors
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from fakes import FakeEmbeddings
+
+    parser = argparse.ArgumentParser(description="Benchmark the batched embedding pipeline against a fake embedder.")
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--max-in-flight", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated seconds per embedding call")
+    args = parser.parse_args()
+
+    texts = [f"chunk {i} " * 50 for i in range(args.chunks)]
+    pipeline = EmbeddingPipeline(FakeEmbeddings(latency=args.latency), batch_size=args.batch_size, max_in_flight=args.max_in_flight)
+    pipeline.embed_documents(texts)
+    print(f"Embedded {pipeline.stats['chunks']} chunks in {pipeline.stats['batches']} batches: "
+          f"{pipeline.chunks_per_sec:.1f} chunks/sec ({pipeline.stats['retries']} retries)")
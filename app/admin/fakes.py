@@ -0,0 +1,32 @@
+import hashlib
+import math
+import time
+
+from langchain_core.embeddings import Embeddings
+
+
+class FakeEmbeddings(Embeddings):
+    """ Deterministic stand-in for Bedrock embeddings, used for local runs and benchmarks """
+
+    def __init__(self, dimension=1536, latency=0.0):
+        self.dimension = dimension
+        self.latency = latency
+
+    def _embed(self, text):
+        vector = []
+        counter = 0
+        while len(vector) < self.dimension:
+            digest = hashlib.sha256(f"{counter}:{text}".encode("utf-8")).digest()
+            vector.extend((byte - 127.5) / 127.5 for byte in digest)
+            counter += 1
+        vector = vector[:self.dimension]
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts):
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
@@ -0,0 +1,104 @@
+import math
+import os
+
+import faiss
+import numpy
+
+
+FLAT_MAX_VECTORS = int(os.getenv("INDEX_FLAT_MAX_VECTORS", "10000"))
+HNSW_MAX_VECTORS = int(os.getenv("INDEX_HNSW_MAX_VECTORS", "200000"))
+TRAINING_SAMPLE_SIZE = 50000
+
+
+def choose_index_config(vector_count, dimension, index_type=None, use_pq=False):
+    """ Picks an index type and its parameters for a corpus of the given size
+
+    Small corpora stay exact (flat). Mid-sized ones use HNSW, which needs no training. Large
+    ones use IVF, optionally with product quantization to shrink vectors to a few dozen bytes.
+    """
+    index_type = index_type or ("flat" if vector_count <= FLAT_MAX_VECTORS
+                                else "hnsw" if vector_count <= HNSW_MAX_VECTORS
+                                else "ivf")
+    if index_type == "flat":
+        return {'type': "flat"}
+    if index_type == "hnsw":
+        return {'type': "hnsw", 'M': 32, 'ef_construction': 80, 'ef_search': 64}
+
+    nlist = max(1, min(int(4 * math.sqrt(vector_count)), vector_count // 39))
+    config = {'type': "ivf", 'nlist': nlist, 'nprobe': max(1, nlist // 16)}
+    if use_pq:
+        # 8-bit codes over sub-vectors of 16 dimensions, e.g. 96 bytes per 1536-dim Titan vector
+        config.update({'type': "ivfpq", 'pq_m': next(m for m in range(dimension // 16, 0, -1) if dimension % m == 0), 'pq_bits': 8})
+    return config
+
+
+def build_index(vectors, config, seed=0):
+    """ Builds and fills a FAISS index for the config; IVF indexes are trained on a random sample """
+    vectors = numpy.ascontiguousarray(vectors, dtype=numpy.float32)
+    dimension = vectors.shape[1]
+
+    if config['type'] == "flat":
+        index = faiss.IndexFlatL2(dimension)
+    elif config['type'] == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, config['M'])
+        index.hnsw.efConstruction = config['ef_construction']
+    else:
+        quantizer = faiss.IndexFlatL2(dimension)
+        if config['type'] == "ivfpq":
+            index = faiss.IndexIVFPQ(quantizer, dimension, config['nlist'], config['pq_m'], config['pq_bits'])
+        else:
+            index = faiss.IndexIVFFlat(quantizer, dimension, config['nlist'])
+        sample_size = min(len(vectors), TRAINING_SAMPLE_SIZE)
+        sample = vectors[numpy.random.default_rng(seed).choice(len(vectors), sample_size, replace=False)]
+        index.train(sample)
+
+    index.add(vectors)
+    apply_search_params(index, config)
+    return index
+
+
+def apply_search_params(index, config):
+    if config['type'] == "hnsw":
+        index.hnsw.efSearch = config['ef_search']
+    elif config['type'] in ("ivf", "ivfpq"):
+        faiss.extract_index_ivf(index).nprobe = config['nprobe']
+
+
+def reconstruct_all(index):
+    """ Returns every vector stored in the index, in insertion order """
+    if isinstance(index, faiss.IndexIVF):
+        index.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Compare recall, query latency and memory of index types on synthetic vectors.")
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--dimension", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = numpy.random.default_rng(0)
+    centers = rng.normal(size=(256, args.dimension)).astype(numpy.float32)
+    vectors = centers[rng.integers(0, len(centers), args.vectors)] + 0.3 * rng.normal(size=(args.vectors, args.dimension)).astype(numpy.float32)
+    queries = vectors[rng.choice(args.vectors, args.queries, replace=False)] + 0.05 * rng.normal(size=(args.queries, args.dimension)).astype(numpy.float32)
+
+    ground_truth = None
+    for index_type, use_pq in (("flat", False), ("hnsw", False), ("ivf", False), ("ivf", True)):
+        config = choose_index_config(args.vectors, args.dimension, index_type=index_type, use_pq=use_pq)
+        started_at = time.perf_counter()
+        index = build_index(vectors, config)
+        build_seconds = time.perf_counter() - started_at
+
+        started_at = time.perf_counter()
+        _, ids = index.search(queries, args.k)
+        query_ms = (time.perf_counter() - started_at) / args.queries * 1000
+        if ground_truth is None:
+            ground_truth = ids
+        recall = numpy.mean([len(set(found) & set(expected)) / args.k for found, expected in zip(ids, ground_truth)])
+        memory_mb = faiss.serialize_index(index).nbytes / 1024 / 1024
+        print(f"{config['type']}: recall@{args.k} {recall:.3f}, {query_ms:.3f}ms/query, {memory_mb:.1f}MB, built in {build_seconds:.1f}s ({config})")
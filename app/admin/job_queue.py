@@ -0,0 +1,166 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class JobQueue:
+    """ Ingestion job queue backed by SQLite, shared by the admin page and the ingestion worker
+
+    Pass ":memory:" for an in-process queue (used for local runs and testing).
+    """
+
+    def __init__(self, db_path):
+        if db_path == ":memory:":
+            # A named shared-cache database lets every connection in the process see the same queue
+            self._database = f"file:job_queue_{id(self)}?mode=memory&cache=shared"
+            self._anchor = sqlite3.connect(self._database, uri=True)
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._database = db_path
+        self._uri = db_path == ":memory:"
+        self._lock = threading.Lock()
+
+        with self._connect() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    request_id TEXT NOT NULL,
+                    pdf_name TEXT NOT NULL,
+                    is_update INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL,
+                    progress TEXT,
+                    error TEXT,
+                    trace TEXT,
+                    enqueued_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                )
+            """)
+            connection.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id)")
+            columns = [row['name'] for row in connection.execute("PRAGMA table_info(jobs)")]
+            if 'is_update' not in columns:
+                connection.execute("ALTER TABLE jobs ADD COLUMN is_update INTEGER NOT NULL DEFAULT 0")
+            if 'trace' not in columns:
+                connection.execute("ALTER TABLE jobs ADD COLUMN trace TEXT")
+
+    def _connect(self):
+        connection = sqlite3.connect(self._database, uri=self._uri, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        if not self._uri:
+            connection.execute("PRAGMA journal_mode=WAL")
+        return _Transaction(connection)
+
+    def enqueue(self, request_id, pdf_name, update=False):
+        """ Queues a job for the request, or returns the ID of its job that is already queued or running
+
+        An update always gets a job of its own, since it carries a new PDF; it waits for the
+        request's earlier jobs, because claim runs one job per request at a time.
+        """
+        with self._connect() as connection:
+            row = connection.execute("SELECT id FROM jobs WHERE request_id = ? AND status IN ('QUEUED', 'RUNNING') ORDER BY id LIMIT 1",
+                                     (request_id,)).fetchone()
+            if row and not update:
+                return row['id']
+            cursor = connection.execute(
+                "INSERT INTO jobs (request_id, pdf_name, is_update, status, progress, enqueued_at) VALUES (?, ?, ?, 'QUEUED', 'Queued', ?)",
+                (request_id, pdf_name, int(update), time.time())
+            )
+            return cursor.lastrowid
+
+    def claim(self):
+        """ Atomically moves the oldest queued job to RUNNING and returns it, or None if no job can start
+
+        A job waits while another job of the same request is running.
+        """
+        with self._lock, self._connect() as connection:
+            row = connection.execute(
+                "SELECT * FROM jobs WHERE status = 'QUEUED' AND request_id NOT IN "
+                "(SELECT request_id FROM jobs WHERE status = 'RUNNING') ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            connection.execute("UPDATE jobs SET status = 'RUNNING', started_at = ? WHERE id = ? AND status = 'QUEUED'",
+                               (time.time(), row['id']))
+            return dict(row)
+
+    def requeue_running(self):
+        """ Puts jobs left RUNNING by a worker that died back in the queue """
+        with self._connect() as connection:
+            return connection.execute("UPDATE jobs SET status = 'QUEUED', started_at = NULL WHERE status = 'RUNNING'").rowcount
+
+    def report_progress(self, job_id, message):
+        with self._connect() as connection:
+            connection.execute("UPDATE jobs SET progress = ? WHERE id = ?", (str(message), job_id))
+
+    def complete(self, job_id, trace=None):
+        with self._connect() as connection:
+            connection.execute("UPDATE jobs SET status = 'COMPLETE', trace = ?, finished_at = ? WHERE id = ?",
+                               (json.dumps(trace) if trace else None, time.time(), job_id))
+
+    def fail(self, job_id, error, trace=None):
+        with self._connect() as connection:
+            connection.execute("UPDATE jobs SET status = 'FAILED', error = ?, trace = ?, finished_at = ? WHERE id = ?",
+                               (str(error), json.dumps(trace) if trace else None, time.time(), job_id))
+
+    def get_job(self, job_id):
+        with self._connect() as connection:
+            row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            return dict(row) if row else None
+
+    def get_active_job(self, request_id):
+        """ Returns the request's oldest queued or running job, if any """
+        with self._connect() as connection:
+            row = connection.execute("SELECT * FROM jobs WHERE request_id = ? AND status IN ('QUEUED', 'RUNNING') ORDER BY id LIMIT 1",
+                                     (request_id,)).fetchone()
+            return dict(row) if row else None
+
+    def get_last_traced_job(self):
+        """ Returns the most recently finished job that recorded a trace, with the trace decoded """
+        with self._connect() as connection:
+            row = connection.execute("SELECT * FROM jobs WHERE trace IS NOT NULL ORDER BY finished_at DESC LIMIT 1").fetchone()
+        return dict(row, trace=json.loads(row['trace'])) if row else None
+
+    def list_jobs(self, limit=20):
+        with self._connect() as connection:
+            return [dict(row) for row in connection.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,))]
+
+    def stats(self, window_seconds=3600):
+        """ Queue depth, running jobs, and latency/throughput of jobs finished within the window """
+        since = time.time() - window_seconds
+        with self._connect() as connection:
+            depth = connection.execute("SELECT COUNT(*) FROM jobs WHERE status = 'QUEUED'").fetchone()[0]
+            running = connection.execute("SELECT COUNT(*) FROM jobs WHERE status = 'RUNNING'").fetchone()[0]
+            finished = connection.execute(
+                "SELECT COUNT(*), AVG(started_at - enqueued_at), AVG(finished_at - enqueued_at) FROM jobs "
+                "WHERE status = 'COMPLETE' AND finished_at >= ?", (since,)
+            ).fetchone()
+            failed = connection.execute("SELECT COUNT(*) FROM jobs WHERE status = 'FAILED' AND finished_at >= ?",
+                                        (since,)).fetchone()[0]
+        return {
+            'queue_depth': depth,
+            'running': running,
+            'completed': finished[0],
+            'failed': failed,
+            'avg_wait_seconds': finished[1] or 0.0,
+            'avg_latency_seconds': finished[2] or 0.0,
+            'throughput_per_hour': finished[0] * 3600 / window_seconds
+        }
+
+
+class _Transaction:
+    """ Runs the body of a with-block as one immediate transaction and closes the connection """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def __exit__(self, exc_type, exc, traceback):
+        try:
+            self.connection.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.connection.close()
@@ -0,0 +1,106 @@
+import math
+import mmap
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+from pypdf import PdfReader
+
+
+def split_into_docs(pages, chunk_size, overlap_size):
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=overlap_size)
+    documents = text_splitter.split_documents(pages)
+    return documents
+
+
+@contextmanager
+def open_pdf(pdf_name):
+    """ Opens a PdfReader over a memory-mapped file; given a path, pypdf would read the whole file into memory """
+    with open(pdf_name, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        yield PdfReader(mapped)
+
+
+def parse_page_range(pdf_name, first_page, last_page, chunk_size, overlap_size):
+    """ Extracts and chunks pages [first_page, last_page) of the PDF """
+    with open_pdf(pdf_name) as reader:
+        pages = [Document(page_content=reader.pages[page].extract_text(), metadata={'source': pdf_name, 'page': page})
+                 for page in range(first_page, last_page)]
+
+    # Same two passes as PyPDFLoader.load_and_split followed by split_into_docs. Both split each
+    # page on its own, so chunks come out identical however the pages are partitioned.
+    pages = RecursiveCharacterTextSplitter().split_documents(pages)
+    return split_into_docs(pages, chunk_size, overlap_size)
+
+
+def parse_workers(page_count, workers=None, min_pages_per_worker=100):
+    """ Number of processes parse_pdf uses for a PDF of page_count pages; 1 means it parses in-process """
+    return max(1, min(workers or os.cpu_count() or 1, page_count // max(1, min_pages_per_worker)))
+
+
+def parse_pdf(pdf_name, chunk_size, overlap_size, workers=None, ranges_per_worker=4, min_pages_per_worker=100):
+    """ Returns (page count, chunks) for the PDF, extracting page ranges in a process pool
+
+    Chunks are merged in page order, so a chunk's index in the returned list is a stable
+    global chunk ID regardless of the worker count. A spawned worker takes a second or two to
+    start (it imports pypdf and langchain), so each one is only started for at least
+    min_pages_per_worker pages, and smaller PDFs are parsed in-process.
+    """
+    with open_pdf(pdf_name) as reader:
+        page_count = len(reader.pages)
+    workers = parse_workers(page_count, workers, min_pages_per_worker)
+    if workers == 1:
+        return page_count, parse_page_range(pdf_name, 0, page_count, chunk_size, overlap_size)
+
+    pages_per_range = max(1, math.ceil(page_count / (workers * ranges_per_worker)))
+    ranges = [(first, min(first + pages_per_range, page_count)) for first in range(0, page_count, pages_per_range)]
+
+    documents = []
+    # Spawning avoids forking a threaded caller (e.g. the ingestion worker). Spawned workers import this module and
+    # re-run the caller's entry script as __mp_main__, so entry scripts keep heavy imports out of module level
+    with ProcessPoolExecutor(max_workers=min(workers, len(ranges)), mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [executor.submit(parse_page_range, pdf_name, first, last, chunk_size, overlap_size) for first, last in ranges]
+        for future in futures:
+            documents.extend(future.result())
+    return page_count, documents
+
+
+if __name__ == "__main__":
+    import argparse
+    import tempfile
+    import time
+
+    from pypdf import PdfWriter
+
+    parser = argparse.ArgumentParser(description="Benchmark PDF parsing and chunking throughput by worker count.")
+    parser.add_argument("--pdf", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "test.pdf"))
+    parser.add_argument("--synthetic-pages", type=int, default=1000, help="Also benchmark a PDF built by repeating --pdf's pages")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--min-pages-per-worker", type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        synthetic_pdf = os.path.join(folder, "synthetic.pdf")
+        source = PdfReader(args.pdf)
+        writer = PdfWriter()
+        for i in range(args.synthetic_pages):
+            writer.add_page(source.pages[i % len(source.pages)])
+        with open(synthetic_pdf, "wb") as f:
+            writer.write(f)
+
+        for pdf_name in (args.pdf, synthetic_pdf):
+            baseline = None
+            for workers in args.workers:
+                started_at = time.perf_counter()
+                page_count, documents = parse_pdf(pdf_name, 1000, 200, workers=workers,
+                                                  min_pages_per_worker=args.min_pages_per_worker)
+                elapsed = time.perf_counter() - started_at
+                texts = [document.page_content for document in documents]
+                baseline = baseline or texts
+                # parse_pdf caps the requested workers by page count, so the row reports the processes it used
+                used = parse_workers(page_count, workers, args.min_pages_per_worker)
+                print(f"{os.path.basename(pdf_name)}: {workers} workers requested, "
+                      f"{f'{used} workers' if used > 1 else 'parsed in-process'}, {page_count} pages, {len(documents)} chunks, "
+                      f"{page_count / elapsed:.1f} pages/sec, chunk IDs stable: {texts == baseline}")
@@ -0,0 +1,57 @@
+import os
+import sys
+import tempfile
+
+import pytest
+from moto import mock_aws
+
+# The admin app's modules import each other by name, as they do when run from the app folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# admin reads its configuration and creates its clients when it is first imported
+_work_folder = tempfile.mkdtemp(prefix="admin-tests-")
+for name, value in {"AWS_DEFAULT_REGION": "us-east-1", "AWS_ACCESS_KEY_ID": "testing", "AWS_SECRET_ACCESS_KEY": "testing",
+                    "EMBEDDINGS_BACKEND": "fake", "JOB_QUEUE_PATH": os.path.join(_work_folder, "queue.db"),
+                    "EMBEDDING_CACHE_PATH": os.path.join(_work_folder, "embedding_cache"),
+                    "UPLOAD_PATH": os.path.join(_work_folder, "uploads"), "METRICS_PATH": os.path.join(_work_folder, "metrics.prom"),
+                    "VECTOR_STORE_PATH": os.path.join(_work_folder, "vector_stores")}.items():
+    os.environ.setdefault(name, value)
+
+
+def create_tables(dynamodb_client):
+    dynamodb_client.create_table(
+        TableName="PDFProcessingCheckpoints", BillingMode="PAY_PER_REQUEST",
+        KeySchema=[{'AttributeName': "RequestID", 'KeyType': "HASH"}, {'AttributeName': "ChunkID", 'KeyType': "RANGE"}],
+        AttributeDefinitions=[{'AttributeName': "RequestID", 'AttributeType': "S"}, {'AttributeName': "ChunkID", 'AttributeType': "N"}])
+    dynamodb_client.create_table(
+        TableName="PDFProcessingRequests", BillingMode="PAY_PER_REQUEST",
+        KeySchema=[{'AttributeName': "RequestID", 'KeyType': "HASH"}],
+        AttributeDefinitions=[{'AttributeName': "RequestID", 'AttributeType': "S"},
+                              {'AttributeName': "Status", 'AttributeType': "S"},
+                              {'AttributeName': "UpdatedAt", 'AttributeType': "N"}],
+        GlobalSecondaryIndexes=[{
+            'IndexName': "StatusIndex",
+            'KeySchema': [{'AttributeName': "Status", 'KeyType': "HASH"}, {'AttributeName': "UpdatedAt", 'KeyType': "RANGE"}],
+            'Projection': {'ProjectionType': "KEYS_ONLY"}
+        }])
+
+
+@pytest.fixture
+def dynamodb_client():
+    import boto3
+
+    with mock_aws():
+        client = boto3.client("dynamodb", region_name="us-east-1")
+        create_tables(client)
+        yield client
+
+
+@pytest.fixture
+def admin(dynamodb_client, tmp_path, monkeypatch):
+    """ The admin module against mocked S3 and DynamoDB, with fake embeddings and its own local folders """
+    import admin
+    from embedding_cache import EmbeddingCache
+
+    monkeypatch.setattr(admin, "vector_store_folder_path", str(tmp_path / "vector_stores"))
+    monkeypatch.setattr(admin, "embedding_cache", EmbeddingCache(str(tmp_path / "embedding_cache"), "fake"))
+    return admin
@@ -0,0 +1,119 @@
+import os
+
+import pytest
+from pypdf import PdfReader, PdfWriter
+
+from embedding_cache import EmbeddingCache
+from fakes import FakeEmbeddings
+from job_queue import JobQueue
+
+
+TEST_PDF = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test.pdf")
+
+
+def request_status(admin, request_id):
+    item = admin.dynamodb_client.get_item(TableName=admin.REQUEST_STATUS_TABLE, Key={'RequestID': {'S': request_id}})['Item']
+    return item['Status']['S']
+
+
+def write_blank_pdf(filename, pages):
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=612, height=792)
+    with open(filename, "wb") as f:
+        writer.write(f)
+
+
+def test_pdf_without_text_fails_with_a_clear_message(admin, tmp_path):
+    pdf_name = str(tmp_path / "scanned.pdf")
+    write_blank_pdf(pdf_name, 3)
+    messages = []
+
+    with pytest.raises(ValueError, match="No text could be extracted"):
+        admin.process_pdf(pdf_name, "scanned", report=messages.append)
+
+    assert request_status(admin, "scanned") == 'FAILED'
+    assert "OCR" in messages[-1]
+    assert admin.get_published_manifest("GPI-scanned") is None
+
+
+class CountingEmbeddings(FakeEmbeddings):
+    def __init__(self):
+        super().__init__(dimension=16)
+        self.embedded = 0
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return super().embed_documents(texts)
+
+
+def write_pdf_from_pages(filename, pages):
+    """ Writes a PDF made of the given pages of the bundled test.pdf """
+    source = PdfReader(TEST_PDF)
+    writer = PdfWriter()
+    for page in pages:
+        writer.add_page(source.pages[page])
+    with open(filename, "wb") as f:
+        writer.write(f)
+
+
+def test_update_embeds_only_changed_chunks(admin, tmp_path, monkeypatch):
+    embeddings = CountingEmbeddings()
+    monkeypatch.setattr(admin, "bedrock_embeddings", embeddings)
+    first_version, second_version = str(tmp_path / "v1.pdf"), str(tmp_path / "v2.pdf")
+    write_pdf_from_pages(first_version, [0, 1, 2, 3])
+    write_pdf_from_pages(second_version, [0, 1, 2, 5])
+
+    admin.process_pdf(first_version, "manual", report=lambda message: None)
+    first_manifest = admin.get_published_manifest("GPI-manual")
+    assert embeddings.embedded == len(first_manifest['chunk_ids'])
+
+    # A fresh shared cache, so reused vectors can only come from the published version
+    monkeypatch.setattr(admin, "embedding_cache", EmbeddingCache(str(tmp_path / "fresh_cache"), "fake"))
+    embeddings.embedded = 0
+    messages = []
+    admin.process_pdf(second_version, "manual", report=messages.append, update=True)
+    second_manifest = admin.get_published_manifest("GPI-manual")
+
+    changed = len(set(second_manifest['fingerprints']) - set(first_manifest['fingerprints']))
+    assert 0 < changed < len(second_manifest['fingerprints'])
+    assert embeddings.embedded == changed
+    assert any(message.startswith(f"Updating from version {first_manifest['version']}") for message in messages)
+    assert request_status(admin, "manual") == 'COMPLETE'
+
+
+def test_update_of_unpublished_request_marks_it_failed_when_preparation_fails(admin, tmp_path, monkeypatch):
+    pdf_name = str(tmp_path / "v1.pdf")
+    write_pdf_from_pages(pdf_name, [0])
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("published vectors are unreadable")
+
+    monkeypatch.setattr(admin, "clear_previous_version", fail)
+    with pytest.raises(RuntimeError):
+        admin.process_pdf(pdf_name, "broken", report=lambda message: None, update=True)
+    assert request_status(admin, "broken") == 'FAILED'
+
+
+def test_update_waits_behind_the_running_job_of_its_request(admin, tmp_path, monkeypatch):
+    monkeypatch.setattr(admin, "job_queue", JobQueue(":memory:"))
+    monkeypatch.setattr(admin, "upload_folder_path", str(tmp_path / "uploads"))
+    first_upload, second_upload, third_upload = (admin.get_upload_path("manual") for _ in range(3))
+    for upload in (first_upload, second_upload, third_upload):
+        open(upload, "wb").close()
+
+    first_job, _ = admin.queue_upload("manual", first_upload)
+    assert admin.job_queue.claim()['id'] == first_job['id']
+
+    update_job, waits_for = admin.queue_upload("manual", second_upload, update=True)
+    assert update_job['id'] != first_job['id'] and waits_for['id'] == first_job['id']
+    assert admin.job_queue.claim() is None
+
+    # A repeated ingestion joins the active job, and its upload is deleted
+    joined_job, _ = admin.queue_upload("manual", third_upload)
+    assert joined_job['id'] == first_job['id']
+    assert not os.path.exists(third_upload)
+
+    admin.job_queue.complete(first_job['id'])
+    claimed = admin.job_queue.claim()
+    assert claimed['id'] == update_job['id'] and claimed['is_update'] == 1 and claimed['pdf_name'] == second_upload
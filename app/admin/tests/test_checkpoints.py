@@ -0,0 +1,96 @@
+import pytest
+
+import checkpoints
+from checkpoints import CheckpointWriter, get_completed_ranges, get_missing_chunk_ids
+
+
+TABLE = "PDFProcessingCheckpoints"
+STATUS_TABLE = "PDFProcessingRequests"
+
+
+def stored_rows(dynamodb_client, request_id):
+    items = dynamodb_client.query(TableName=TABLE, KeyConditionExpression='RequestID = :requestid',
+                                  ExpressionAttributeValues={':requestid': {'S': request_id}})['Items']
+    return [(int(item['ChunkID']['N']), int(item['EndChunkID']['N'])) for item in items]
+
+
+class UnprocessedOnce:
+    """ Wraps a DynamoDB client so the first BatchWriteItem call leaves every item unprocessed """
+
+    def __init__(self, client, failures=1):
+        self.client = client
+        self.failures = failures
+
+    def batch_write_item(self, RequestItems):
+        if self.failures:
+            self.failures -= 1
+            return {'UnprocessedItems': RequestItems}
+        return self.client.batch_write_item(RequestItems=RequestItems)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+def test_processed_batches_are_written_as_coalesced_ranges(dynamodb_client):
+    writer = CheckpointWriter(dynamodb_client, TABLE, STATUS_TABLE, "doc", flush_interval=3600)
+    for start in range(0, 100, 10):
+        writer.mark_processed(range(start, start + 10))
+    writer.mark_processed(range(120, 130))
+    writer.flush()
+
+    assert writer.write_calls == 1
+    assert stored_rows(dynamodb_client, "doc") == [(0, 99), (120, 129)]
+
+
+def test_unprocessed_items_are_retried(dynamodb_client, monkeypatch):
+    monkeypatch.setattr(checkpoints.time, "sleep", lambda seconds: None)
+    writer = CheckpointWriter(UnprocessedOnce(dynamodb_client), TABLE, STATUS_TABLE, "doc", flush_interval=3600)
+    writer.mark_processed(range(5))
+    writer.flush()
+
+    assert writer.write_calls == 2
+    assert get_completed_ranges(dynamodb_client, TABLE, "doc") == [(0, 4)]
+
+
+def test_chunks_stay_pending_when_retries_run_out(dynamodb_client, monkeypatch):
+    monkeypatch.setattr(checkpoints.time, "sleep", lambda seconds: None)
+    writer = CheckpointWriter(UnprocessedOnce(dynamodb_client, failures=3), TABLE, STATUS_TABLE, "doc",
+                              flush_interval=3600, max_retries=2)
+    writer.mark_processed(range(5))
+    with pytest.raises(RuntimeError, match="unprocessed"):
+        writer.flush()
+
+    assert get_completed_ranges(dynamodb_client, TABLE, "doc") == []
+    writer.flush()
+    assert get_completed_ranges(dynamodb_client, TABLE, "doc") == [(0, 4)]
+
+
+def test_resume_embeds_only_missing_chunks(dynamodb_client):
+    writer = CheckpointWriter(dynamodb_client, TABLE, STATUS_TABLE, "doc", flush_interval=3600)
+    writer.mark_processed(list(range(0, 10)) + list(range(20, 30)))
+    writer.flush()
+
+    ranges = get_completed_ranges(dynamodb_client, TABLE, "doc")
+    missing = get_missing_chunk_ids(ranges, 35)
+    assert missing == list(range(10, 20)) + list(range(30, 35))
+
+    resumed = CheckpointWriter(dynamodb_client, TABLE, STATUS_TABLE, "doc", flush_interval=3600)
+    resumed.mark_processed(missing)
+    resumed.flush()
+    assert get_missing_chunk_ids(get_completed_ranges(dynamodb_client, TABLE, "doc"), 35) == []
+
+
+def test_resume_does_not_overwrite_a_wider_range_with_the_same_start(dynamodb_client):
+    writer = CheckpointWriter(dynamodb_client, TABLE, STATUS_TABLE, "doc", flush_interval=3600)
+    writer.mark_processed(range(0, 50))
+    writer.flush()
+
+    # A resume re-embeds chunk 0, whose row already covers 0-49, and chunk 50 next to it
+    resumed = CheckpointWriter(dynamodb_client, TABLE, STATUS_TABLE, "doc", flush_interval=3600)
+    resumed.mark_processed([0])
+    resumed.flush()
+    assert get_completed_ranges(dynamodb_client, TABLE, "doc") == [(0, 49)]
+
+    resumed.mark_processed([50])
+    resumed.flush()
+    assert stored_rows(dynamodb_client, "doc") == [(0, 50)]
@@ -0,0 +1,115 @@
+import os
+
+import boto3
+import numpy
+from moto import mock_aws
+
+from embedding_cache import SEGMENT_EXTENSION, EmbeddingCache
+
+
+def segment_names(cache):
+    return sorted(name for name in os.listdir(cache.folder_path) if name.endswith(SEGMENT_EXTENSION))
+
+
+def test_saved_segments_round_trip(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model")
+    cache.put_many(["a", "b"], [[1.0, 2.0], [3.0, 4.0]])
+    cache.save()
+    cache.put_many(["c"], [[5.0, 6.0]])
+    cache.save()
+
+    reloaded = EmbeddingCache(str(tmp_path), "model")
+    assert len(reloaded) == 3
+    assert [list(vector) for vector in reloaded.get_many(["c", "a", "missing"])[:2]] == [[5.0, 6.0], [1.0, 2.0]]
+    assert reloaded.get_many(["missing"]) == [None]
+
+
+def test_truncated_segment_is_dropped_instead_of_misread(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model")
+    cache.put_many(["a", "b", "c", "d"], numpy.arange(16, dtype=numpy.float32).reshape(4, 4))
+    cache.save()
+    path = os.path.join(cache.folder_path, segment_names(cache)[0])
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 16)
+
+    reloaded = EmbeddingCache(str(tmp_path), "model")
+    assert len(reloaded) == 0
+    assert reloaded.get_many(["a"]) == [None]
+    assert segment_names(reloaded) == []
+
+
+def test_compact_merges_segments(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model")
+    for i in range(3):
+        cache.put_many([f"text {i}"], [[float(i), 0.0]])
+        cache.save()
+    assert len(segment_names(cache)) == 3
+
+    assert len(cache.compact()) == 3
+    assert len(segment_names(cache)) == 1
+    assert [list(vector) for vector in cache.get_many(["text 0", "text 2"])] == [[0.0, 0.0], [2.0, 0.0]]
+
+
+def test_sync_transfers_only_new_segments(tmp_path):
+    with mock_aws():
+        s3 = boto3.client("s3", region_name="us-east-1")
+        s3.create_bucket(Bucket="cache")
+        uploads = []
+        s3.meta.events.register("before-call.s3.PutObject", lambda **kwargs: uploads.append(1))
+
+        writer = EmbeddingCache(str(tmp_path / "writer"), "model")
+        writer.put_many(["a"], [[1.0, 2.0]])
+        writer.upload(s3, "cache")
+        writer.put_many(["b"], [[3.0, 4.0]])
+        writer.upload(s3, "cache")
+        writer.upload(s3, "cache")
+        assert len(uploads) == 2
+
+        reader = EmbeddingCache(str(tmp_path / "reader"), "model")
+        reader.download(s3, "cache")
+        assert len(reader) == 2
+        downloads = []
+        s3.meta.events.register("before-call.s3.GetObject", lambda **kwargs: downloads.append(1))
+        reader.download(s3, "cache")
+        assert downloads == []
+        reader.upload(s3, "cache")
+        assert len(uploads) == 2
+
+
+def test_saving_alone_compacts_past_max_segments(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model", max_segments=3)
+    for i in range(10):
+        cache.put_many([f"text {i}"], [[float(i), 0.0]])
+        cache.save()
+        assert len(segment_names(cache)) <= 3
+
+    reloaded = EmbeddingCache(str(tmp_path), "model")
+    assert len(reloaded) == 10
+    assert [list(vector) for vector in reloaded.get_many(["text 0", "text 9"])] == [[0.0, 0.0], [9.0, 0.0]]
+
+
+def test_segments_compacted_by_a_save_are_deleted_from_s3_by_the_next_upload(tmp_path):
+    with mock_aws():
+        s3 = boto3.client("s3", region_name="us-east-1")
+        s3.create_bucket(Bucket="cache")
+
+        def remote_names():
+            return sorted(os.path.basename(content['Key']) for content in s3.list_objects_v2(Bucket="cache").get('Contents', []))
+
+        cache = EmbeddingCache(str(tmp_path / "writer"), "model", max_segments=2)
+        for i in range(2):
+            cache.put_many([f"text {i}"], [[float(i), 0.0]])
+            cache.upload(s3, "cache")
+        cache.put_many(["text 2"], [[2.0, 0.0]])
+        cache.save()
+        # The compacted segments are still in S3 until the next upload, and are not downloaded back
+        assert len(segment_names(cache)) == 1 and len(remote_names()) == 2
+        cache.download(s3, "cache")
+        assert len(segment_names(cache)) == 1
+
+        cache.upload(s3, "cache")
+        assert remote_names() == segment_names(cache)
+
+        reader = EmbeddingCache(str(tmp_path / "reader"), "model")
+        reader.download(s3, "cache")
+        assert len(reader) == 3
@@ -0,0 +1,101 @@
+import numpy
+import pytest
+from botocore.exceptions import ClientError
+
+import embedding_pipeline
+from embedding_cache import EmbeddingCache
+from embedding_pipeline import EmbeddingPipeline, is_throttling_error
+from fakes import FakeEmbeddings
+
+
+TEXTS = ["first chunk", "second chunk", "third chunk"]
+
+
+def test_second_run_reuses_every_vector_from_a_cold_cache(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "fake")
+    assert len(cache) == 0
+
+    first = EmbeddingPipeline(FakeEmbeddings(dimension=8), cache=cache)
+    first_vectors = first.embed_documents(TEXTS)
+    assert first.stats['embedded'] == 3 and first.stats['reused'] == 0
+    assert len(cache) == 3
+
+    second = EmbeddingPipeline(FakeEmbeddings(dimension=8), cache=cache)
+    second_vectors = second.embed_documents(TEXTS)
+    assert second.stats['embedded'] == 0 and second.stats['reused'] == 3
+    # The cache stores float32, so reused vectors match to float32 precision
+    numpy.testing.assert_allclose(numpy.asarray(second_vectors), numpy.asarray(first_vectors), rtol=1e-6)
+
+
+def test_saved_vectors_are_reused_after_reloading(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "fake")
+    EmbeddingPipeline(FakeEmbeddings(dimension=8), cache=cache).embed_documents(TEXTS)
+    cache.save()
+
+    pipeline = EmbeddingPipeline(FakeEmbeddings(dimension=8), cache=EmbeddingCache(str(tmp_path), "fake"))
+    pipeline.embed_documents(TEXTS)
+    assert pipeline.stats['embedded'] == 0 and pipeline.stats['reused'] == 3
+
+
+class FlakyEmbeddings(FakeEmbeddings):
+    """ Raises the given errors, one per call, before embedding normally """
+
+    def __init__(self, errors):
+        super().__init__(dimension=8)
+        self.errors = list(errors)
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return super().embed_documents(texts)
+
+
+def client_error(code):
+    return ClientError({'Error': {'Code': code, 'Message': "Rate exceeded"}}, "InvokeModel")
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(embedding_pipeline.time, "sleep", delays.append)
+    # Full delays, so the exponential schedule can be checked exactly
+    monkeypatch.setattr(embedding_pipeline.random, "uniform", lambda low, high: high)
+    return delays
+
+
+def test_throttling_errors_are_recognised():
+    assert is_throttling_error(client_error("ThrottlingException"))
+    assert is_throttling_error(ValueError("Error raised by inference endpoint: TooManyRequestsException"))
+    assert not is_throttling_error(client_error("ValidationException"))
+    assert not is_throttling_error(ValueError("Malformed input"))
+
+
+def test_throttled_batches_back_off_exponentially_and_succeed(sleeps):
+    embeddings = FlakyEmbeddings([client_error("ThrottlingException")] * 4)
+    pipeline = EmbeddingPipeline(embeddings, max_retries=5, backoff_base=0.5, backoff_max=2.0)
+
+    vectors = pipeline.embed_documents(TEXTS)
+
+    assert len(vectors) == 3 and embeddings.calls == 5
+    assert sleeps == [0.5, 1.0, 2.0, 2.0]
+    assert pipeline.stats['retries'] == 4
+
+
+def test_other_errors_are_not_retried(sleeps):
+    embeddings = FlakyEmbeddings([client_error("ValidationException")])
+    pipeline = EmbeddingPipeline(embeddings, max_retries=5)
+
+    with pytest.raises(ClientError):
+        pipeline.embed_documents(TEXTS)
+    assert embeddings.calls == 1 and sleeps == []
+
+
+def test_gives_up_after_the_retry_limit(sleeps):
+    embeddings = FlakyEmbeddings([client_error("ThrottlingException")] * 10)
+    pipeline = EmbeddingPipeline(embeddings, max_retries=3, backoff_base=0.5)
+
+    with pytest.raises(ClientError):
+        pipeline.embed_documents(TEXTS)
+    assert embeddings.calls == 4 and len(sleeps) == 3
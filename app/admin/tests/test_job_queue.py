@@ -0,0 +1,71 @@
+import time
+
+from job_queue import JobQueue
+
+
+def test_enqueue_joins_the_active_job_of_a_request(tmp_path):
+    job_queue = JobQueue(str(tmp_path / "queue.db"))
+    first = job_queue.enqueue("manual", "first.pdf")
+
+    assert job_queue.enqueue("manual", "second.pdf") == first
+    assert job_queue.enqueue("guide", "guide.pdf") != first
+    update = job_queue.enqueue("manual", "third.pdf", update=True)
+    assert update != first and job_queue.get_job(update)['is_update'] == 1
+
+    job_queue.complete(first)
+    assert job_queue.enqueue("manual", "fourth.pdf") == update
+
+
+def test_claim_runs_oldest_first_and_one_job_per_request(tmp_path):
+    job_queue = JobQueue(str(tmp_path / "queue.db"))
+    manual = job_queue.enqueue("manual", "manual.pdf")
+    manual_update = job_queue.enqueue("manual", "manual-v2.pdf", update=True)
+    guide = job_queue.enqueue("guide", "guide.pdf")
+
+    assert job_queue.claim()['id'] == manual
+    assert job_queue.claim()['id'] == guide
+    assert job_queue.claim() is None
+
+    job_queue.complete(manual)
+    claimed = job_queue.claim()
+    assert claimed['id'] == manual_update and claimed['status'] == 'QUEUED'
+    assert job_queue.get_job(manual_update)['status'] == 'RUNNING'
+
+
+def test_jobs_left_running_are_requeued_after_a_restart(tmp_path):
+    path = str(tmp_path / "queue.db")
+    job_queue = JobQueue(path)
+    job_id = job_queue.enqueue("manual", "manual.pdf")
+    job_queue.claim()
+
+    restarted = JobQueue(path)
+    assert restarted.requeue_running() == 1
+    job = restarted.get_job(job_id)
+    assert job['status'] == 'QUEUED' and job['started_at'] is None
+    assert restarted.claim()['id'] == job_id
+
+
+def test_stats_cover_depth_running_and_finished_jobs(monkeypatch):
+    job_queue = JobQueue(":memory:")
+    now = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    completed, failed, running, _ = (job_queue.enqueue(request_id, f"{request_id}.pdf")
+                                     for request_id in ("a", "b", "c", "d"))
+
+    now[0] += 2
+    for _ in range(3):
+        job_queue.claim()
+    now[0] += 4
+    job_queue.complete(completed)
+    job_queue.fail(failed, "boom")
+
+    stats = job_queue.stats(window_seconds=1800)
+    assert stats == {
+        'queue_depth': 1,
+        'running': 1,
+        'completed': 1,
+        'failed': 1,
+        'avg_wait_seconds': 2.0,
+        'avg_latency_seconds': 6.0,
+        'throughput_per_hour': 2.0
+    }
@@ -0,0 +1,23 @@
+import os
+
+from pdf_parser import parse_pdf, parse_workers
+
+
+TEST_PDF = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test.pdf")
+
+
+def test_chunks_are_the_same_in_process_and_across_workers():
+    page_count, in_process = parse_pdf(TEST_PDF, 1000, 200, workers=1)
+    # A low page threshold makes the 17-page PDF fan out to several processes
+    assert parse_workers(page_count, 3, min_pages_per_worker=4) == 3
+    _, fanned_out = parse_pdf(TEST_PDF, 1000, 200, workers=3, min_pages_per_worker=4)
+
+    assert len(in_process) > page_count
+    assert [document.page_content for document in fanned_out] == [document.page_content for document in in_process]
+    assert [document.metadata for document in fanned_out] == [document.metadata for document in in_process]
+
+
+def test_small_pdfs_are_parsed_in_process():
+    assert parse_workers(17, 8, min_pages_per_worker=100) == 1
+    assert parse_workers(1000, 8, min_pages_per_worker=100) == 8
+    assert parse_workers(250, 8, min_pages_per_worker=100) == 2
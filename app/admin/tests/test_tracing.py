@@ -0,0 +1,69 @@
+import os
+
+import tracing
+from tracing import Tracer, trace_breakdown
+
+
+def test_nested_spans_are_collected_in_the_trace():
+    tracer = Tracer("test")
+    with tracer.trace("question", session="s1") as trace:
+        with tracer.span("retrieve", k=5) as outer:
+            with tracer.span("embed"):
+                pass
+            outer['documents'] = 3
+    with tracer.span("untraced"):
+        pass
+
+    # A span is recorded when it closes, so the inner one comes first
+    embed, retrieve = trace['spans']
+    assert (embed['name'], retrieve['name']) == ("embed", "retrieve")
+    assert retrieve['attributes'] == {'k': 5, 'documents': 3}
+    assert retrieve['offset'] <= embed['offset']
+    assert embed['offset'] + embed['seconds'] <= retrieve['offset'] + retrieve['seconds'] <= trace['seconds']
+    assert trace['attributes'] == {'session': "s1"} and tracer.last_trace is trace
+    assert [row['stage'] for row in trace_breakdown(trace)] == ["embed", "retrieve", "question"]
+
+
+def test_record_adds_a_span_timed_by_the_caller():
+    tracer = Tracer("test")
+    with tracer.trace("ingest") as trace:
+        tracer.record("embed_batches", 0.25, batches=4)
+
+    span, = trace['spans']
+    assert (span['name'], span['seconds'], span['attributes']) == ("embed_batches", 0.25, {'batches': 4})
+    # Without a start time, the span is taken to have ended when it was recorded
+    assert -0.25 <= span['offset'] <= trace['seconds']
+
+
+def test_histograms_are_rendered_in_the_prometheus_text_format(tmp_path):
+    tracer = Tracer("querypdf", buckets=(0.1, 1.0))
+    for seconds in (0.05, 0.5, 0.1, 2.0):
+        tracer.observe("generate", seconds)
+    tracer.observe("embed", 0.01)
+
+    assert tracer.prometheus_text() == "\n".join([
+        "# HELP querypdf_stage_duration_seconds Duration of pipeline stages.",
+        "# TYPE querypdf_stage_duration_seconds histogram",
+        'querypdf_stage_duration_seconds_bucket{stage="embed",le="0.1"} 1',
+        'querypdf_stage_duration_seconds_bucket{stage="embed",le="1.0"} 1',
+        'querypdf_stage_duration_seconds_bucket{stage="embed",le="+Inf"} 1',
+        'querypdf_stage_duration_seconds_sum{stage="embed"} 0.01',
+        'querypdf_stage_duration_seconds_count{stage="embed"} 1',
+        'querypdf_stage_duration_seconds_bucket{stage="generate",le="0.1"} 2',
+        'querypdf_stage_duration_seconds_bucket{stage="generate",le="1.0"} 3',
+        'querypdf_stage_duration_seconds_bucket{stage="generate",le="+Inf"} 4',
+        'querypdf_stage_duration_seconds_sum{stage="generate"} 2.65',
+        'querypdf_stage_duration_seconds_count{stage="generate"} 4',
+    ]) + "\n"
+
+    filename = tmp_path / "metrics.prom"
+    tracer.write_prometheus(str(filename))
+    assert filename.read_text() == tracer.prometheus_text()
+    assert [path.name for path in tmp_path.iterdir()] == ["metrics.prom"]
+
+
+def test_user_app_copy_matches():
+    # The admin and user images are built from their own folders, so each carries a copy of the tracer
+    user_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(tracing.__file__))), "user", "tracing.py")
+    with open(tracing.__file__) as admin_copy, open(user_path) as user_copy:
+        assert admin_copy.read() == user_copy.read()
@@ -0,0 +1,93 @@
+import sqlite3
+import sys
+import threading
+import types
+from concurrent.futures import Future
+
+import pytest
+
+import worker
+from job_queue import JobQueue
+
+
+class StopWorker(BaseException):
+    pass
+
+
+class FailingQueue:
+    """ Fails to claim a job a few times, then stops the worker """
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.claims = 0
+
+    def requeue_running(self):
+        return 0
+
+    def claim(self):
+        self.claims += 1
+        if self.claims <= self.failures:
+            raise sqlite3.OperationalError("database is locked")
+        raise StopWorker()
+
+
+def test_worker_survives_claim_errors_with_backoff(monkeypatch):
+    job_queue = FailingQueue(failures=3)
+    monkeypatch.setitem(sys.modules, "admin", types.SimpleNamespace(job_queue=job_queue))
+    sleeps = []
+    monkeypatch.setattr(worker.time, "sleep", sleeps.append)
+    monkeypatch.setattr(worker, "MAX_BACKOFF", 6)
+
+    with pytest.raises(StopWorker):
+        worker.run_worker(max_concurrent_jobs=1, poll_interval=1)
+
+    assert job_queue.claims == 4
+    assert sleeps == [2, 4, 6]
+
+
+def claimed_job(tmp_path):
+    job_queue = JobQueue(str(tmp_path / "queue.db"))
+    job_queue.enqueue("manual", "manual.pdf")
+    return job_queue, job_queue.claim()
+
+
+def test_job_that_cannot_import_admin_is_failed(tmp_path, monkeypatch):
+    job_queue, job = claimed_job(tmp_path)
+    monkeypatch.setitem(sys.modules, "admin", None)
+
+    worker.run_job(job, job_queue)
+
+    failed = job_queue.get_job(job['id'])
+    assert failed['status'] == 'FAILED' and "admin" in failed['error']
+
+
+def test_failing_job_is_failed_and_cleaned_up(tmp_path, monkeypatch):
+    job_queue, job = claimed_job(tmp_path)
+    removed = []
+
+    def process_pdf(pdf_name, request_id, report, update):
+        report("Parsing")
+        raise RuntimeError("parser crashed")
+
+    monkeypatch.setitem(sys.modules, "admin", types.SimpleNamespace(
+        fetch_uploaded_pdf=lambda pdf_name, request_id: None, process_pdf=process_pdf,
+        remove_uploaded_pdf=removed.append, metrics_path=str(tmp_path / "metrics.prom")))
+
+    worker.run_job(job, job_queue)
+
+    failed = job_queue.get_job(job['id'])
+    assert (failed['status'], failed['error'], failed['progress']) == ('FAILED', "parser crashed", "Parsing")
+    assert removed == ["manual.pdf"]
+
+
+def test_job_done_fails_a_job_whose_run_raised(tmp_path):
+    job_queue, job = claimed_job(tmp_path)
+    slots = threading.BoundedSemaphore(1)
+    slots.acquire()
+    future = Future()
+    future.set_exception(sqlite3.OperationalError("disk I/O error"))
+
+    worker.job_done(job, job_queue, slots, future)
+
+    assert slots.acquire(blocking=False)
+    assert job_queue.get_job(job['id'])['status'] == 'FAILED'
@@ -0,0 +1,99 @@
+import bisect
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Upper bounds, in seconds, of the latency histogram buckets; the last bucket is +Inf
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+class Tracer:
+    """ Times named stages of a request as spans and keeps a latency histogram per stage
+
+    A trace collects the spans opened in its context (the same thread, or a coroutine started
+    from it), giving the breakdown of one request. Histograms cover every span in the process,
+    traced or not, and are exported in the Prometheus text format.
+    """
+
+    def __init__(self, namespace, buckets=DEFAULT_BUCKETS):
+        self.namespace = namespace
+        self.buckets = tuple(buckets)
+        self.last_trace = None
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def trace(self, name, **attributes):
+        """ Starts a request; yields its trace, a dict with the request's attributes and spans """
+        trace = {'name': name, 'attributes': attributes, 'started_at': time.time(), 'perf_started_at': time.perf_counter(),
+                 'seconds': None, 'spans': []}
+        token = _current_trace.set(trace)
+        try:
+            yield trace
+        finally:
+            trace['seconds'] = time.perf_counter() - trace['perf_started_at']
+            _current_trace.reset(token)
+            self.observe(name, trace['seconds'])
+            self.last_trace = trace
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """ Times a stage; yields the span's attributes, which the stage can add to """
+        started_at = time.perf_counter()
+        try:
+            yield attributes
+        finally:
+            self.record(name, time.perf_counter() - started_at, started_at=started_at, **attributes)
+
+    def record(self, name, seconds, started_at=None, **attributes):
+        """ Records a stage timed by the caller, e.g. the total of many short calls """
+        trace = _current_trace.get()
+        if trace is not None:
+            started_at = started_at if started_at is not None else time.perf_counter() - seconds
+            trace['spans'].append({'name': name, 'offset': started_at - trace['perf_started_at'],
+                                   'seconds': seconds, 'attributes': attributes})
+        self.observe(name, seconds)
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self._histograms.setdefault(name, {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0})
+            histogram['counts'][bisect.bisect_left(self.buckets, seconds)] += 1
+            histogram['sum'] += seconds
+
+    def prometheus_text(self):
+        """ Renders the stage histograms in the Prometheus text exposition format """
+        metric = f"{self.namespace}_stage_duration_seconds"
+        lines = [f"# HELP {metric} Duration of pipeline stages.", f"# TYPE {metric} histogram"]
+        with self._lock:
+            histograms = {name: (list(histogram['counts']), histogram['sum']) for name, histogram in self._histograms.items()}
+        for name, (counts, total) in sorted(histograms.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_sum{{stage="{name}"}} {total}')
+            lines.append(f'{metric}_count{{stage="{name}"}} {cumulative}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, filename):
+        """ Writes the histograms for a Prometheus textfile collector, replacing the file atomically """
+        temp_filename = f"{filename}.tmp"
+        with open(temp_filename, "w") as f:
+            f.write(self.prometheus_text())
+        os.replace(temp_filename, filename)
+
+
+def trace_breakdown(trace):
+    """ Rows of stage, start and duration in milliseconds, for showing a trace as a table """
+    return [{'stage': span['name'], 'start_ms': round(span['offset'] * 1000, 1), 'duration_ms': round(span['seconds'] * 1000, 1),
+             **span['attributes']}
+            for span in trace['spans']] + [{'stage': trace['name'], 'start_ms': 0.0, 'duration_ms': round(trace['seconds'] * 1000, 1)}]
+
+
+# Shared by every session and job in the process, like the index cache, so histograms cover all requests
+shared_tracer = Tracer("querypdf")
@@ -0,0 +1,112 @@
+import functools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from tracing import shared_tracer
+
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+)
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENT_JOBS = int(os.getenv("INGESTION_MAX_CONCURRENT_JOBS", "2"))
+POLL_INTERVAL = float(os.getenv("INGESTION_POLL_INTERVAL", "2"))
+MAX_BACKOFF = float(os.getenv("INGESTION_MAX_BACKOFF", "60"))
+
+
+def run_job(job, job_queue):
+    """ Runs one ingestion job, publishing process_pdf's messages as the job's progress
+
+    Any exception, including one raised importing admin, marks the job FAILED rather than leaving it RUNNING.
+    """
+    logger.info(f"Starting job {job['id']} for Request ID: {job['request_id']}")
+    trace = None
+    try:
+        # Imported here rather than at module level: PDF parser processes re-run this script as __mp_main__,
+        # and importing admin creates AWS clients, loads the embedding cache and opens the job queue
+        from admin import fetch_uploaded_pdf, metrics_path, process_pdf, remove_uploaded_pdf
+
+        def report(message):
+            logger.info(f"Job {job['id']}: {message}")
+            job_queue.report_progress(job['id'], message)
+
+        try:
+            with shared_tracer.trace("ingest", request_id=job['request_id'], job_id=job['id']) as trace:
+                fetch_uploaded_pdf(job['pdf_name'], job['request_id'])
+                process_pdf(job['pdf_name'], job['request_id'], report=report, update=bool(job['is_update']))
+        finally:
+            clean_up_job(job, remove_uploaded_pdf, metrics_path)
+    except Exception as e:
+        logger.exception(f"Job {job['id']} failed.")
+        job_queue.fail(job['id'], e, trace=trace)
+    else:
+        job_queue.complete(job['id'], trace=trace)
+        logger.info(f"Finished job {job['id']} in {trace['seconds']:.2f}s. Queue stats: {job_queue.stats()}")
+
+
+def clean_up_job(job, remove_uploaded_pdf, metrics_path):
+    """ Removes the job's upload and exports metrics; a failure here is logged and does not fail the job """
+    try:
+        # A job re-queued after a crash, or resumed after a failure, downloads the PDF again
+        remove_uploaded_pdf(job['pdf_name'])
+        # Shared with the admin page's debug panel, and readable by a Prometheus textfile collector
+        shared_tracer.write_prometheus(metrics_path)
+    except Exception:
+        logger.exception(f"Failed to clean up after job {job['id']}.")
+
+
+def job_done(job, job_queue, slots, future):
+    """ Frees the job's slot and fails the job if run_job itself raised, e.g. because the queue could not be written """
+    slots.release()
+    error = future.exception()
+    if error is None:
+        return
+    logger.error(f"Job {job['id']} crashed.", exc_info=error)
+    try:
+        job_queue.fail(job['id'], error)
+    except Exception:
+        # requeue_running picks the job up again when the worker restarts
+        logger.exception(f"Failed to mark job {job['id']} as failed.")
+
+
+def run_worker(max_concurrent_jobs=MAX_CONCURRENT_JOBS, poll_interval=POLL_INTERVAL):
+    """ Pulls jobs from the queue forever, running at most max_concurrent_jobs at a time """
+    from admin import job_queue
+
+    requeued = job_queue.requeue_running()
+    if requeued:
+        logger.info(f"Re-queued {requeued} jobs left running by a previous worker.")
+
+    slots = threading.BoundedSemaphore(max_concurrent_jobs)
+    failures = 0
+    with ThreadPoolExecutor(max_workers=max_concurrent_jobs) as executor:
+        while True:
+            slots.acquire()
+            try:
+                job = job_queue.claim()
+            except Exception:
+                # E.g. the queue database is locked or its disk is full; the loop must outlive it
+                slots.release()
+                failures += 1
+                backoff = min(poll_interval * 2 ** failures, MAX_BACKOFF)
+                logger.exception(f"Failed to claim a job, retrying in {backoff:.0f}s.")
+                time.sleep(backoff)
+                continue
+            failures = 0
+            if job is None:
+                slots.release()
+                time.sleep(poll_interval)
+                continue
+
+            future = executor.submit(run_job, job, job_queue)
+            future.add_done_callback(functools.partial(job_done, job, job_queue, slots))
+
+
+if __name__ == "__main__":
+    run_worker()
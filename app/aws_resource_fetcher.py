@@ -1,9 +1,51 @@
-import boto3
+import functools
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 
 import boto3
 
+# Discovered resources are kept at module level, so they survive across warm Lambda invocations
+RESOURCE_CACHE_TTL_SECONDS = float(os.getenv('RESOURCE_CACHE_TTL_SECONDS', '300'))
+MAX_WORKERS = 8
+_resource_cache = {}
+_resource_cache_lock = threading.Lock()
+
+
+def run_in_parallel(*functions):
+    """Runs independent zero-argument functions concurrently and returns their results in order."""
+    with ThreadPoolExecutor(max_workers=max(1, len(functions))) as executor:
+        futures = [executor.submit(function) for function in functions]
+        return [future.result() for future in futures]
+
+
+def cached(method):
+    """Memoizes a lookup for RESOURCE_CACHE_TTL_SECONDS, shared by every fetcher in the process."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        key = (method.__name__,) + args + tuple(sorted(kwargs.items()))
+        with _resource_cache_lock:
+            entry = _resource_cache.get(key)
+        if entry and time.monotonic() - entry[0] < self.cache_ttl:
+            self.cache_hits += 1
+            return entry[1]
+
+        value = method(self, *args, **kwargs)
+        with _resource_cache_lock:
+            _resource_cache[key] = (time.monotonic(), value)
+        return value
+    return wrapper
+
+
+def clear_resource_cache():
+    with _resource_cache_lock:
+        _resource_cache.clear()
+
+
 class AWSResourceFetcher:
-    def __init__(self):
+    def __init__(self, cache_ttl=RESOURCE_CACHE_TTL_SECONDS):
         self.ec2_client = boto3.client('ec2')
         self.elbv2_client = boto3.client('elbv2')
         self.lambda_client = boto3.client('lambda')
@@ -11,16 +53,29 @@ class AWSResourceFetcher:
         self.s3_client = boto3.client('s3')
         self.ecs_client = boto3.client('ecs')
         self.iam_client = boto3.client('iam')
+        self.tagging_client = boto3.client('resourcegroupstaggingapi')
         self.tags = {
             "Application": "GPI-App",
             "Environment": "Development",
             "Owner": "Mohith"
         }
+        self.cache_ttl = cache_ttl
+        self.cache_hits = 0
+        # AWS API calls made by this fetcher, by "service.Operation"
+        self.call_counts = Counter()
+        self._call_counts_lock = threading.Lock()
+        for client in (self.ec2_client, self.elbv2_client, self.lambda_client, self.dynamodb_client,
+                       self.s3_client, self.ecs_client, self.iam_client, self.tagging_client):
+            client.meta.events.register('before-call', self._count_call)
+
+    def _count_call(self, event_name, **kwargs):
+        with self._call_counts_lock:
+            self.call_counts[event_name.split('.', 1)[1]] += 1
 
-    def filter_by_tags(self, tags, resource_tags):
-        """Checks if resource tags match the predefined tags."""
-        tag_dict = {tag['Key']: tag['Value'] for tag in resource_tags}
-        return all(tag_dict.get(k) == v for k, v in self.tags.items())
+    def filter_by_tags(self, tags, expected_tags=None):
+        """Checks if a resource's tags, as returned by AWS, include the expected (by default, the predefined) tags."""
+        tag_dict = {tag['Key']: tag['Value'] for tag in tags}
+        return all(tag_dict.get(k) == v for k, v in (expected_tags or self.tags).items())
 
     def get_tags_for_resource(self, resource_id, resource_type):
         """Retrieves tags for a specific resource based on resource type."""
@@ -30,6 +85,7 @@ class AWSResourceFetcher:
             tag_response = self.lambda_client.list_tags(Resource=resource_id)
         elif resource_type == 's3':
             tag_response = self.s3_client.get_bucket_tagging(Bucket=resource_id)
+            return tag_response.get('TagSet', [])
         elif resource_type == 'dynamodb':
             tag_response = self.dynamodb_client.list_tags_of_resource(ResourceArn=resource_id)
         elif resource_type == 'ecs':
@@ -44,102 +100,167 @@ class AWSResourceFetcher:
 
         return tag_response.get('Tags', tag_response.get('TagList', []))
 
+    def get_tagged_arns(self, resource_type, tags=None):
+        """Returns the ARNs of all resources of a type carrying the tags, using paginated bulk tag queries
+        instead of one tag lookup per resource. tags maps each key to a list of accepted values."""
+        tags = tags or {key: [value] for key, value in self.tags.items()}
+        paginator = self.tagging_client.get_paginator('get_resources')
+        pages = paginator.paginate(TagFilters=[{'Key': key, 'Values': values} for key, values in tags.items()],
+                                   ResourceTypeFilters=[resource_type])
+        return {mapping['ResourceARN'] for page in pages for mapping in page['ResourceTagMappingList']}
+
+    def list_all(self, client, operation, result_key, **kwargs):
+        """Returns every item of a paginated listing."""
+        return [item for page in client.get_paginator(operation).paginate(**kwargs) for item in page[result_key]]
+
+    def ec2_tag_filters(self):
+        """EC2 filters on tags server side, so matching VPCs and subnets come back from a single listing."""
+        return [{'Name': f'tag:{key}', 'Values': [value]} for key, value in self.tags.items()]
+
+    @cached
     def get_alb(self):
-        response = self.elbv2_client.describe_load_balancers()
-        for alb in response['LoadBalancers']:
-            alb_arn = alb['LoadBalancerArn']
-            tags = self.get_tags_for_resource(alb_arn, 'elbv2')
-            if self.filter_by_tags(tags, self.tags):
+        load_balancers, tagged_arns = run_in_parallel(
+            lambda: self.list_all(self.elbv2_client, 'describe_load_balancers', 'LoadBalancers'),
+            lambda: self.get_tagged_arns('elasticloadbalancing:loadbalancer'))
+        for alb in load_balancers:
+            if alb['LoadBalancerArn'] in tagged_arns:
                 return alb['DNSName']
         return None
 
+    @cached
     def get_vpc(self):
-        response = self.ec2_client.describe_vpcs()
-        for vpc in response['Vpcs']:
-            vpc_id = vpc['VpcId']
-            tags = self.get_tags_for_resource(vpc_id, 'subnet')
-            if self.filter_by_tags(tags, self.tags):
-                return vpc_id
-        return None
+        vpcs = self.list_all(self.ec2_client, 'describe_vpcs', 'Vpcs', Filters=self.ec2_tag_filters())
+        return vpcs[0]['VpcId'] if vpcs else None
+
+    @cached
+    def get_subnet_details(self):
+        """Returns the app's subnets as described by EC2, including their availability zones and tags."""
+        return self.list_all(self.ec2_client, 'describe_subnets', 'Subnets', Filters=self.ec2_tag_filters())
 
     def get_subnets(self):
-        response = self.ec2_client.describe_subnets()
-        subnets = []
-        for subnet in response['Subnets']:
-            subnet_id = subnet['SubnetId']
-            tags = self.get_tags_for_resource(subnet_id, 'subnet')
-            if self.filter_by_tags(tags, self.tags):
-                subnets.append(subnet_id)
-        return subnets
+        return [subnet['SubnetId'] for subnet in self.get_subnet_details()]
 
+    @cached
     def get_lambda_functions(self):
-        response = self.lambda_client.list_functions()
-        functions = []
-        for function in response['Functions']:
-            function_arn = function['FunctionArn']
-            tags = self.get_tags_for_resource(function_arn, 'lambda')
-            if self.filter_by_tags(tags, self.tags):
-                functions.append(function['FunctionName'])
-        return functions
+        functions, tagged_arns = run_in_parallel(
+            lambda: self.list_all(self.lambda_client, 'list_functions', 'Functions'),
+            lambda: self.get_tagged_arns('lambda:function'))
+        return [function['FunctionName'] for function in functions if function['FunctionArn'] in tagged_arns]
 
+    @cached
     def get_dynamodb_table(self, table_name):
         response = self.dynamodb_client.describe_table(TableName=table_name)
         table_arn = response['Table']['TableArn']
         tags = self.get_tags_for_resource(table_arn, 'dynamodb')
-        if self.filter_by_tags(tags, self.tags):
+        if self.filter_by_tags(tags):
             return boto3.resource('dynamodb').Table(table_name)
         return None
 
+    @cached
     def get_s3_buckets(self):
-        response = self.s3_client.list_buckets()
-        buckets = []
-        for bucket in response['Buckets']:
-            bucket_name = bucket['Name']
-            tags = self.get_tags_for_resource(bucket_name, 's3')
-            if self.filter_by_tags(tags, self.tags):
-                buckets.append(bucket_name)
-        return buckets
+        response, tagged_arns = run_in_parallel(
+            self.s3_client.list_buckets,
+            lambda: self.get_tagged_arns('s3'))
+        return [bucket['Name'] for bucket in response['Buckets'] if f"arn:aws:s3:::{bucket['Name']}" in tagged_arns]
 
+    @cached
     def get_ecs_clusters(self):
-        response = self.ecs_client.list_clusters()
-        clusters = []
-        for cluster_arn in response['clusterArns']:
-            tags = self.get_tags_for_resource(cluster_arn, 'ecs')
-            if self.filter_by_tags(tags, self.tags):
-                clusters.append(cluster_arn.split('/')[-1])
-        return clusters
+        cluster_arns, tagged_arns = run_in_parallel(
+            lambda: self.list_all(self.ecs_client, 'list_clusters', 'clusterArns'),
+            lambda: self.get_tagged_arns('ecs:cluster'))
+        return [cluster_arn.split('/')[-1] for cluster_arn in cluster_arns if cluster_arn in tagged_arns]
 
+    @cached
     def get_target_groups(self):
-        response = self.elbv2_client.describe_target_groups()
-        target_groups = []
-        for tg in response['TargetGroups']:
-            tg_arn = tg['TargetGroupArn']
-            tags = self.elbv2_client.list_tags_for_resource(ResourceArn=tg_arn)['Tags']
-            if any(tag['Key'] == 'Name' and tag['Value'] in ["GPI-target-group-admin", "GPI-target-group-user"]
-                   for tag in tags):
-                target_groups.append({
-                    'TargetGroupArn': tg_arn,
-                    'TargetGroupName': tg['TargetGroupName']
-                })
-        return target_groups
+        target_groups, tagged_arns = run_in_parallel(
+            lambda: self.list_all(self.elbv2_client, 'describe_target_groups', 'TargetGroups'),
+            lambda: self.get_tagged_arns('elasticloadbalancing:targetgroup',
+                                         tags={'Name': ["GPI-target-group-admin", "GPI-target-group-user"]}))
+        return [{'TargetGroupArn': tg['TargetGroupArn'], 'TargetGroupName': tg['TargetGroupName']}
+                for tg in target_groups if tg['TargetGroupArn'] in tagged_arns]
 
+    @cached
     def get_iam_role(self):
-        response = self.iam_client.list_roles()
-        for role in response['Roles']:
-            role_name = role['RoleName']
-            tags = self.get_tags_for_resource(role_name, 'iam')
-            if self.filter_by_tags(tags, self.tags):
-                return role['Arn']
+        # IAM is not covered by the tagging API, so role tags are looked up concurrently instead,
+        # a batch at a time so that no more roles are looked up once one matches
+        roles = self.list_all(self.iam_client, 'list_roles', 'Roles')
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            for start in range(0, len(roles), MAX_WORKERS):
+                batch = roles[start:start + MAX_WORKERS]
+                role_tags = executor.map(lambda role: self.get_tags_for_resource(role['RoleName'], 'iam'), batch)
+                for role, tags in zip(batch, role_tags):
+                    if self.filter_by_tags(tags):
+                        return role['Arn']
         return None
 
+    def discover(self):
+        """Looks up every resource type concurrently."""
+        lookups = {
+            'alb': self.get_alb,
+            'vpc': self.get_vpc,
+            'subnets': self.get_subnets,
+            'lambda_functions': self.get_lambda_functions,
+            's3_buckets': self.get_s3_buckets,
+            'ecs_clusters': self.get_ecs_clusters,
+            'target_groups': self.get_target_groups,
+            'iam_role': self.get_iam_role
+        }
+        return dict(zip(lookups, run_in_parallel(*lookups.values())))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from moto import mock_aws
+
+    parser = argparse.ArgumentParser(description="Compare AWS calls and latency of per-resource and bulk resource discovery against moto.")
+    parser.add_argument('--resources', type=int, default=100, help="Resources of each type, a third of them tagged for the app")
+    parser.add_argument('--latency', type=float, default=0.02, help="Simulated network latency added to every AWS request, in seconds")
+    args = parser.parse_args()
+
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    with mock_aws():
+        fetcher = AWSResourceFetcher()
+        app_tags = [{'Key': key, 'Value': value} for key, value in fetcher.tags.items()]
+        vpc_id = fetcher.ec2_client.create_vpc(CidrBlock='10.0.0.0/16')['Vpc']['VpcId']
+        fetcher.ec2_client.create_tags(Resources=[vpc_id], Tags=app_tags)
+        for i in range(args.resources):
+            subnet_id = fetcher.ec2_client.create_subnet(VpcId=vpc_id, CidrBlock=f'10.0.{i}.0/24')['Subnet']['SubnetId']
+            bucket_name = f'gpi-benchmark-{i}'
+            fetcher.s3_client.create_bucket(Bucket=bucket_name)
+            role_name = f'gpi-benchmark-role-{i}'
+            fetcher.iam_client.create_role(RoleName=role_name, AssumeRolePolicyDocument='{}')
+            if i % 3 == 0:
+                fetcher.ec2_client.create_tags(Resources=[subnet_id], Tags=app_tags)
+                fetcher.s3_client.put_bucket_tagging(Bucket=bucket_name, Tagging={'TagSet': app_tags})
+                fetcher.iam_client.tag_role(RoleName=role_name, Tags=app_tags)
+
+        def legacy_discovery():
+            """One tag lookup per resource, one after another, as before"""
+            subnets = [subnet['SubnetId'] for subnet in fetcher.ec2_client.describe_subnets()['Subnets']
+                       if fetcher.filter_by_tags(fetcher.get_tags_for_resource(subnet['SubnetId'], 'subnet'), fetcher.tags)]
+            buckets = []
+            for bucket in fetcher.s3_client.list_buckets()['Buckets']:
+                try:
+                    tags = fetcher.get_tags_for_resource(bucket['Name'], 's3')
+                except fetcher.s3_client.exceptions.ClientError:
+                    tags = []
+                if fetcher.filter_by_tags(tags, fetcher.tags):
+                    buckets.append(bucket['Name'])
+            role = next((role['Arn'] for role in fetcher.iam_client.list_roles()['Roles']
+                         if fetcher.filter_by_tags(fetcher.get_tags_for_resource(role['RoleName'], 'iam'), fetcher.tags)), None)
+            return subnets, buckets, role
+
+        def bulk_discovery():
+            return run_in_parallel(fetcher.get_subnets, fetcher.get_s3_buckets, fetcher.get_iam_role)
 
+        for client in (fetcher.ec2_client, fetcher.s3_client, fetcher.iam_client, fetcher.tagging_client):
+            client.meta.events.register('before-send', lambda **kwargs: time.sleep(args.latency))
 
-# resource_fetcher = AWSResourceFetcher()
-# alb_dns = resource_fetcher.get_alb()
-# vpc_id = resource_fetcher.get_vpc()
-# subnets = resource_fetcher.get_subnets()
-# lambda_functions = resource_fetcher.get_lambda_functions()
-# dynamodb_tables = resource_fetcher.get_dynamodb_tables()
-# s3_buckets = resource_fetcher.get_s3_buckets()
-# ecs_clusters = resource_fetcher.get_ecs_clusters()
-# target_groups = resource_fetcher.get_target_groups()
\ No newline at end of file
+        for name, discovery in (('per-resource', legacy_discovery), ('bulk', bulk_discovery), ('bulk, warm cache', bulk_discovery)):
+            fetcher.call_counts.clear()
+            started_at = time.perf_counter()
+            subnets, buckets, role = discovery()
+            elapsed = time.perf_counter() - started_at
+            print(f"{name}: {sum(fetcher.call_counts.values())} AWS calls in {elapsed * 1000:.0f}ms, "
+                  f"found {len(subnets)} subnets, {len(buckets)} buckets, role {role is not None}")
@@ -1,9 +1,13 @@
+import time
+_import_started_at = time.perf_counter()
+
 import uuid
 import boto3
-from aws_resource_fetcher import AWSResourceFetcher
+from aws_resource_fetcher import AWSResourceFetcher, run_in_parallel
 import re
 import json
 import logging
+import os
 
 logging.basicConfig(
     level=logging.DEBUG,
@@ -12,16 +16,38 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-resource_fetcher = AWSResourceFetcher()
-container_info_table = resource_fetcher.get_dynamodb_table(table_name="ContainerInfo")
-subnets = resource_fetcher.get_subnets()
+# Clients and discovered resources are created on first use and reused by warm invocations;
+# the fetcher refreshes discovered resources once they are older than RESOURCE_CACHE_TTL_SECONDS
+_clients = {}
+_resource_fetcher = None
+_cold_start = True
+
+
+def get_client(service_name):
+    if service_name not in _clients:
+        _clients[service_name] = boto3.client(service_name)
+    return _clients[service_name]
+
+
+def get_resource_fetcher():
+    global _resource_fetcher
+    if _resource_fetcher is None:
+        _resource_fetcher = AWSResourceFetcher()
+    return _resource_fetcher
 
-ecs_client = boto3.client('ecs')
-dynamodb = boto3.resource('dynamodb')
-autoscaling_client = boto3.client('application-autoscaling')
 
+def get_resources():
+    """ Returns the ContainerInfo table and the app's subnets, looked up concurrently """
+    resource_fetcher = get_resource_fetcher()
+    return run_in_parallel(lambda: resource_fetcher.get_dynamodb_table(table_name="ContainerInfo"),
+                           resource_fetcher.get_subnet_details)
 
-def generate_unique_container_id():
+
+def server_timing(timings):
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
+
+
+def generate_unique_container_id(container_info_table):
     while True:
         container_id = str(uuid.uuid4())
         response = container_info_table.get_item(Key={'ContainerID': container_id})
@@ -30,8 +56,11 @@ def generate_unique_container_id():
             return container_id
 
 
-def create_or_update_ecs_service(consumer_name, role, image, az):
+def create_or_update_ecs_service(consumer_name, role, image, az, container_info_table, subnets):
     """ Adds container to an existing service, or creates new service with a container """
+    resource_fetcher = get_resource_fetcher()
+    ecs_client = get_client('ecs')
+    autoscaling_client = get_client('application-autoscaling')
     try:
         # Common Tags
         tags = [
@@ -135,7 +164,7 @@ def create_or_update_ecs_service(consumer_name, role, image, az):
                 desiredCount=current_desired_count + 1
             )
             
-        container_id = generate_unique_container_id()
+        container_id = generate_unique_container_id(container_info_table)
         logger.info(f'Finished adding new container to {ecs_service_name}. Container ID: {container_id}')
 
         return {
@@ -152,7 +181,12 @@ def create_or_update_ecs_service(consumer_name, role, image, az):
 
 
 def lambda_handler(event, context):
+    global _cold_start
     logger.info(' --- From Lambda Function ---')
+    handler_started_at = time.perf_counter()
+    timings = {'init': INIT_SECONDS} if _cold_start else {}
+    _cold_start = False
+
     path = event.get('path', '')
     consumer_name = path.split('/')[2] if len(path.split('/')) > 2 else None
     
@@ -171,14 +205,66 @@ def lambda_handler(event, context):
             'body': json.dumps("Invalid path")
         }
 
-    lambda_function_name = context.function_name
-    response = resource_fetcher.lambda_client.get_function_configuration(FunctionName=lambda_function_name)
-    az = response['Environment']['Variables'].get('AWS_REGION')
+    # Lambda sets AWS_REGION in the environment, so there is no need to read it from the function configuration
+    az = os.environ.get('AWS_REGION')
+
+    started_at = time.perf_counter()
+    container_info_table, subnets = get_resources()
+    timings['discovery'] = time.perf_counter() - started_at
+
+    started_at = time.perf_counter()
     response = create_or_update_ecs_service(
                         consumer_name=consumer_name,
                         role=role, 
                         image=image,
-                        az=az
+                        az=az,
+                        container_info_table=container_info_table,
+                        subnets=subnets
                     )
+    timings['ecs'] = time.perf_counter() - started_at
+    timings['handler'] = time.perf_counter() - handler_started_at
+
+    logger.info(f'Timings: {server_timing(timings)}')
+    response.setdefault('headers', {})['Server-Timing'] = server_timing(timings)
+    return response
+
+
+INIT_SECONDS = time.perf_counter() - _import_started_at
+
+if __name__ == '__main__':
+    import argparse
+
+    from moto import mock_aws
+
+    parser = argparse.ArgumentParser(description="Measure cold and warm invocation latency of the handler against mocked AWS.")
+    parser.add_argument('--invocations', type=int, default=5)
+    parser.add_argument('--subnets', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.02, help="Simulated network latency added to every AWS request, in seconds")
+    args = parser.parse_args()
+
+    os.environ.setdefault('AWS_REGION', 'us-east-1')
+    os.environ.setdefault('AWS_DEFAULT_REGION', os.environ['AWS_REGION'])
+    with mock_aws():
+        app_tags = [{'Key': "Application", 'Value': "GPI-App"}, {'Key': "Environment", 'Value': "Development"},
+                    {'Key': "Owner", 'Value': "Mohith"}]
+        ec2_client = boto3.client('ec2')
+        vpc_id = ec2_client.create_vpc(CidrBlock='10.0.0.0/16')['Vpc']['VpcId']
+        for i in range(args.subnets):
+            subnet_id = ec2_client.create_subnet(VpcId=vpc_id, CidrBlock=f'10.0.{i}.0/24')['Subnet']['SubnetId']
+            ec2_client.create_tags(Resources=[subnet_id], Tags=app_tags + [{'Key': "Name", 'Value': f"GPI-private-subnet-{i}"}])
+        boto3.client('dynamodb').create_table(
+            TableName="ContainerInfo", BillingMode="PAY_PER_REQUEST", Tags=app_tags,
+            KeySchema=[{'AttributeName': "ContainerID", 'KeyType': "HASH"}],
+            AttributeDefinitions=[{'AttributeName': "ContainerID", 'AttributeType': "S"}])
+
+        # Registered on the default session, so every client the handler creates lazily sees the latency
+        boto3.setup_default_session()
+        boto3.DEFAULT_SESSION.events.register('before-send', lambda **kwargs: time.sleep(args.latency))
 
-    return response
\ No newline at end of file
+        for i in range(args.invocations):
+            started_at = time.perf_counter()
+            response = lambda_handler({'path': "/user/benchmark"}, None)
+            elapsed = time.perf_counter() - started_at
+            print(f"{'cold' if i == 0 else 'warm'} invocation: {elapsed * 1000:.0f}ms "
+                  f"(status {response['statusCode']}, Server-Timing: {response['headers']['Server-Timing']})")
+        print(f"AWS calls made by the resource fetcher: {dict(get_resource_fetcher().call_counts)}")
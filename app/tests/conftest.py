@@ -0,0 +1,10 @@
+import os
+import sys
+
+# The fetcher and the provisioning Lambda import modules by name, as they do when deployed together
+APP_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_PATH)
+sys.path.insert(0, os.path.join(APP_PATH, "home"))
+
+# Their clients are created without an explicit region, as Lambda provides one
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
@@ -0,0 +1,171 @@
+import io
+import zipfile
+
+import pytest
+from moto import mock_aws
+
+from aws_resource_fetcher import AWSResourceFetcher, clear_resource_cache
+
+
+APP_TAGS = {"Application": "GPI-App", "Environment": "Development", "Owner": "Mohith"}
+
+
+def tag_list(tags, key="Key", value="Value"):
+    return [{key: k, value: v} for k, v in tags.items()]
+
+
+@pytest.fixture
+def fetcher():
+    clear_resource_cache()
+    with mock_aws():
+        yield AWSResourceFetcher()
+    clear_resource_cache()
+
+
+def create_vpc_and_subnets(fetcher, count):
+    """ Creates a tagged VPC with count subnets, every other one tagged; returns the VPC and tagged subnet IDs """
+    ec2 = fetcher.ec2_client
+    vpc_id = ec2.create_vpc(CidrBlock="10.0.0.0/16")["Vpc"]["VpcId"]
+    ec2.create_tags(Resources=[vpc_id], Tags=tag_list(APP_TAGS))
+    subnet_ids = []
+    for i in range(count):
+        subnet_id = ec2.create_subnet(VpcId=vpc_id, CidrBlock=f"10.0.{i}.0/24")["Subnet"]["SubnetId"]
+        if i % 2 == 0:
+            ec2.create_tags(Resources=[subnet_id], Tags=tag_list(APP_TAGS))
+            subnet_ids.append(subnet_id)
+    return vpc_id, subnet_ids
+
+
+def create_table(fetcher, name, tags):
+    fetcher.dynamodb_client.create_table(
+        TableName=name, BillingMode="PAY_PER_REQUEST", Tags=tag_list(tags),
+        KeySchema=[{"AttributeName": "ContainerID", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "ContainerID", "AttributeType": "S"}])
+
+
+def create_role(fetcher, name, tags=None):
+    role = fetcher.iam_client.create_role(RoleName=name, AssumeRolePolicyDocument="{}")["Role"]
+    if tags:
+        fetcher.iam_client.tag_role(RoleName=name, Tags=tag_list(tags))
+    return role["Arn"]
+
+
+def test_filter_by_tags_matches_the_resource_tags(fetcher):
+    assert fetcher.filter_by_tags(tag_list(dict(APP_TAGS, Name="extra")))
+    assert not fetcher.filter_by_tags(tag_list(dict(APP_TAGS, Owner="someone else")))
+    assert fetcher.filter_by_tags(tag_list({"Name": "a"}), {"Name": "a"})
+
+
+def test_vpc_and_subnets_are_filtered_by_tag(fetcher):
+    vpc_id, subnet_ids = create_vpc_and_subnets(fetcher, 6)
+    assert fetcher.get_vpc() == vpc_id
+    assert sorted(fetcher.get_subnets()) == sorted(subnet_ids)
+    assert all("AvailabilityZone" in subnet for subnet in fetcher.get_subnet_details())
+
+
+def test_dynamodb_table_is_returned_only_when_tagged(fetcher):
+    create_table(fetcher, "ContainerInfo", APP_TAGS)
+    create_table(fetcher, "Untagged", {"Owner": "someone else"})
+
+    assert fetcher.get_dynamodb_table("ContainerInfo").name == "ContainerInfo"
+    assert fetcher.get_dynamodb_table(table_name="ContainerInfo").name == "ContainerInfo"
+    assert fetcher.get_dynamodb_table("Untagged") is None
+
+
+def test_iam_role_is_the_first_tagged_role(fetcher):
+    create_role(fetcher, "untagged")
+    expected = create_role(fetcher, "tagged", APP_TAGS)
+    assert fetcher.get_iam_role() == expected
+
+
+def test_buckets_are_matched_through_the_tagging_api(fetcher):
+    for i in range(4):
+        fetcher.s3_client.create_bucket(Bucket=f"bucket-{i}")
+        if i % 2 == 0:
+            fetcher.s3_client.put_bucket_tagging(Bucket=f"bucket-{i}", Tagging={"TagSet": tag_list(APP_TAGS)})
+    assert sorted(fetcher.get_s3_buckets()) == ["bucket-0", "bucket-2"]
+
+
+def test_ecs_clusters_are_matched_through_the_tagging_api(fetcher):
+    fetcher.ecs_client.create_cluster(clusterName="app", tags=tag_list(APP_TAGS, "key", "value"))
+    fetcher.ecs_client.create_cluster(clusterName="other")
+    assert fetcher.get_ecs_clusters() == ["app"]
+
+
+def test_lambda_functions_are_matched_through_the_tagging_api(fetcher):
+    role_arn = create_role(fetcher, "lambda-role")
+    code = io.BytesIO()
+    with zipfile.ZipFile(code, "w") as archive:
+        archive.writestr("handler.py", "def handler(event, context):\n    return event\n")
+    for name, tags in (("app-function", APP_TAGS), ("other-function", {})):
+        fetcher.lambda_client.create_function(FunctionName=name, Runtime="python3.11", Role=role_arn, Handler="handler.handler",
+                                              Code={"ZipFile": code.getvalue()}, Tags=tags)
+    assert fetcher.get_lambda_functions() == ["app-function"]
+
+
+def test_load_balancer_and_target_groups_are_matched_through_the_tagging_api(fetcher):
+    vpc_id, subnet_ids = create_vpc_and_subnets(fetcher, 4)
+    fetcher.elbv2_client.create_load_balancer(Name="other", Subnets=subnet_ids)
+    alb = fetcher.elbv2_client.create_load_balancer(Name="app", Subnets=subnet_ids, Tags=tag_list(APP_TAGS))["LoadBalancers"][0]
+    for name in ("GPI-target-group-admin", "GPI-target-group-user", "unrelated"):
+        fetcher.elbv2_client.create_target_group(Name=name, Protocol="HTTP", Port=80, VpcId=vpc_id,
+                                                 Tags=[{"Key": "Name", "Value": name}])
+
+    assert fetcher.get_alb() == alb["DNSName"]
+    assert sorted(group["TargetGroupName"] for group in fetcher.get_target_groups()) == \
+        ["GPI-target-group-admin", "GPI-target-group-user"]
+
+
+def test_lookups_are_cached_including_keyword_calls(fetcher):
+    create_vpc_and_subnets(fetcher, 2)
+    create_table(fetcher, "ContainerInfo", APP_TAGS)
+    fetcher.get_subnets()
+    fetcher.get_dynamodb_table(table_name="ContainerInfo")
+    calls = sum(fetcher.call_counts.values())
+
+    fetcher.get_subnets()
+    fetcher.get_dynamodb_table(table_name="ContainerInfo")
+    assert sum(fetcher.call_counts.values()) == calls
+    assert fetcher.cache_hits == 2
+
+
+def test_bulk_discovery_makes_far_fewer_calls_than_per_resource_lookups(fetcher):
+    count = 30
+    create_vpc_and_subnets(fetcher, count)
+    for i in range(count):
+        fetcher.s3_client.create_bucket(Bucket=f"bucket-{i}")
+        if i % 2 == 0:
+            fetcher.s3_client.put_bucket_tagging(Bucket=f"bucket-{i}", Tagging={"TagSet": tag_list(APP_TAGS)})
+        create_role(fetcher, f"role-{i}", APP_TAGS if i == count // 2 else None)
+
+    # One tag lookup per subnet, bucket and role, as discovery worked before
+    fetcher.call_counts.clear()
+    per_resource_subnets = [subnet["SubnetId"] for subnet in fetcher.ec2_client.describe_subnets()["Subnets"]
+                            if fetcher.filter_by_tags(fetcher.get_tags_for_resource(subnet["SubnetId"], "subnet"))]
+    per_resource_buckets = []
+    for bucket in fetcher.s3_client.list_buckets()["Buckets"]:
+        try:
+            if fetcher.filter_by_tags(fetcher.get_tags_for_resource(bucket["Name"], "s3")):
+                per_resource_buckets.append(bucket["Name"])
+        except fetcher.s3_client.exceptions.ClientError:
+            pass
+    per_resource_role = next(role["Arn"] for role in fetcher.iam_client.list_roles()["Roles"]
+                             if fetcher.filter_by_tags(fetcher.get_tags_for_resource(role["RoleName"], "iam")))
+    per_resource_calls = sum(fetcher.call_counts.values())
+
+    fetcher.call_counts.clear()
+    assert sorted(fetcher.get_subnets()) == sorted(per_resource_subnets)
+    assert sorted(fetcher.get_s3_buckets()) == sorted(per_resource_buckets)
+    assert fetcher.get_iam_role() == per_resource_role
+    bulk_calls = sum(fetcher.call_counts.values())
+
+    assert per_resource_calls > 2 * count
+    assert bulk_calls * 3 < per_resource_calls
+
+
+def test_discover_returns_every_resource_type(fetcher):
+    create_vpc_and_subnets(fetcher, 2)
+    resources = fetcher.discover()
+    assert set(resources) == {"alb", "vpc", "subnets", "lambda_functions", "s3_buckets", "ecs_clusters", "target_groups", "iam_role"}
+    assert resources["vpc"] is not None
+    assert len(resources["subnets"]) == 1
@@ -0,0 +1,59 @@
+import boto3
+import pytest
+from moto import mock_aws
+
+import lambda_function
+from aws_resource_fetcher import clear_resource_cache
+
+
+APP_TAGS = [{"Key": "Application", "Value": "GPI-App"}, {"Key": "Environment", "Value": "Development"},
+            {"Key": "Owner", "Value": "Mohith"}]
+
+
+@pytest.fixture
+def cold_lambda(monkeypatch):
+    """ The handler module as a fresh Lambda container sees it, against mocked AWS """
+    clear_resource_cache()
+    monkeypatch.setattr(lambda_function, "_clients", {})
+    monkeypatch.setattr(lambda_function, "_resource_fetcher", None)
+    monkeypatch.setattr(lambda_function, "_cold_start", True)
+    with mock_aws():
+        ec2_client = boto3.client("ec2")
+        vpc_id = ec2_client.create_vpc(CidrBlock="10.0.0.0/16")["Vpc"]["VpcId"]
+        subnet_id = ec2_client.create_subnet(VpcId=vpc_id, CidrBlock="10.0.0.0/24")["Subnet"]["SubnetId"]
+        ec2_client.create_tags(Resources=[subnet_id], Tags=APP_TAGS + [{"Key": "Name", "Value": "GPI-private-subnet-1"}])
+        boto3.client("dynamodb").create_table(
+            TableName="ContainerInfo", BillingMode="PAY_PER_REQUEST", Tags=APP_TAGS,
+            KeySchema=[{"AttributeName": "ContainerID", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "ContainerID", "AttributeType": "S"}])
+        yield lambda_function
+    clear_resource_cache()
+
+
+def timing_names(response):
+    return [entry.split(";")[0] for entry in response["headers"]["Server-Timing"].split(", ")]
+
+
+def test_resources_are_looked_up_on_first_use(cold_lambda):
+    table, subnets = cold_lambda.get_resources()
+    assert table.name == "ContainerInfo"
+    assert [subnet["Tags"] for subnet in subnets][0][-1]["Value"] == "GPI-private-subnet-1"
+
+
+def test_warm_invocation_reuses_clients_and_reports_timings(cold_lambda):
+    event = {"path": "/user/test"}
+    cold_response = cold_lambda.lambda_handler(event, None)
+    fetcher = cold_lambda.get_resource_fetcher()
+    ecs_client = cold_lambda.get_client("ecs")
+    calls = sum(fetcher.call_counts.values())
+    assert calls > 0
+
+    warm_response = cold_lambda.lambda_handler(event, None)
+    assert cold_lambda.get_resource_fetcher() is fetcher
+    assert cold_lambda.get_client("ecs") is ecs_client
+    # Discovered resources come from the fetcher's cache
+    assert sum(fetcher.call_counts.values()) == calls
+
+    # Import time is only reported by the invocation that paid it
+    assert timing_names(cold_response) == ["init", "discovery", "ecs", "handler"]
+    assert timing_names(warm_response) == ["discovery", "ecs", "handler"]
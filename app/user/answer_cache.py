@@ -0,0 +1,85 @@
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy
+
+
+class AnswerCache:
+    """ Reuses answers to semantically similar questions asked about the same index version """
+
+    def __init__(self, threshold=0.95, ttl_seconds=3600, max_entries=1000):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self.counters = {'lookups': 0, 'hits': 0, 'evictions': 0, 'latency_saved': 0.0}
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counters['lookups']
+            return dict(self.counters,
+                        entries=len(self._entries),
+                        hit_rate=self.counters['hits'] / lookups if lookups else 0.0)
+
+    @staticmethod
+    def _normalize(vector):
+        vector = numpy.asarray(vector, dtype=numpy.float32)
+        norm = numpy.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _expire(self, index_key, now):
+        """ Drops expired entries and entries for older versions of the same bucket's index """
+        bucket, version = index_key
+        stale_ids = [entry_id for entry_id, entry in self._entries.items()
+                     if now - entry['created_at'] > self.ttl_seconds
+                     or (entry['index_key'][0] == bucket and entry['index_key'][1] != version)]
+        for entry_id in stale_ids:
+            del self._entries[entry_id]
+
+    def lookup(self, index_key, question_vector):
+        """ Returns (answer, similarity) for the closest cached question above the threshold, or None """
+        started_at = time.perf_counter()
+        query = self._normalize(question_vector)
+
+        with self._lock:
+            self.counters['lookups'] += 1
+            self._expire(index_key, time.time())
+            candidates = [(entry_id, entry) for entry_id, entry in self._entries.items() if entry['index_key'] == index_key]
+            if not candidates:
+                return None
+
+            similarities = numpy.stack([entry['vector'] for _, entry in candidates]) @ query
+            best = int(numpy.argmax(similarities))
+            if similarities[best] < self.threshold:
+                return None
+
+            entry_id, entry = candidates[best]
+            self._entries.move_to_end(entry_id)
+            self.counters['hits'] += 1
+            self.counters['latency_saved'] += max(0.0, entry['latency'] - (time.perf_counter() - started_at))
+            return entry['answer'], float(similarities[best])
+
+    def put(self, index_key, question_vector, answer, latency):
+        with self._lock:
+            self._entries[next(self._ids)] = {
+                'index_key': index_key,
+                'vector': self._normalize(question_vector),
+                'answer': answer,
+                'latency': latency,
+                'created_at': time.time()
+            }
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.counters['evictions'] += 1
+
+
+shared_answer_cache = AnswerCache(
+    threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+    ttl_seconds=int(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600")),
+    max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+)
@@ -1,21 +1,56 @@
 import boto3
+import json
 import streamlit
 import uuid
 import os
+import shutil
+import time
 
 from langchain_aws.embeddings import BedrockEmbeddings
-from langchain_community.vectorstores import FAISS
 from langchain_community.llms.bedrock import Bedrock
 from langchain.prompts import PromptTemplate
-from langchain.chains import RetrievalQA
+from botocore.exceptions import ClientError
 
-s3_client            = boto3.client("s3")
+from aws_io import AsyncAWS
+from compact_index import COMPACT_FORMAT, CompactVectorStore
+from index_cache import shared_index_cache
+from query_executor import QueryRejected, normalize_question, shared_query_executor
+from answer_cache import shared_answer_cache
+from s3_downloader import S3Downloader
+from fakes import FakeEmbeddings, FakeStreamingLLM
+from context_builder import ContextBudgetRetriever
+from hybrid_retriever import BM25Index, HybridRetriever
+from reranker import RerankingRetriever
+from shard_router import ShardRouter
+from tracing import shared_tracer, trace_breakdown
+
+MANIFEST_KEY = "manifest.json"
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+# Chunks passed to the prompt, and how many candidates to over-fetch and rerank to pick them; 0 searches for the top k directly
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "5"))
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "50"))
+SHARD_TIMEOUT = float(os.getenv("SHARD_TIMEOUT_SECONDS", "2"))
+# Upper bound on the estimated tokens of retrieved context in the prompt; 0 sends the hits as they are
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+
+aws_io               = AsyncAWS(max_pool_connections=int(os.getenv("AWS_MAX_POOL_CONNECTIONS", "32")))
+s3_client            = boto3.client("s3", config=aws_io.client_config)
 download_folder_path = "/tmp"
-bedrock_client       = boto3.client("bedrock-runtime")
-bedrock_embeddings   = BedrockEmbeddings(model_id="amazon.titan-embed-text-v1", client=bedrock_client)
+s3_downloader        = S3Downloader(max_workers=int(os.getenv("S3_DOWNLOAD_WORKERS", "8")))
+bedrock_client       = boto3.client("bedrock-runtime", config=aws_io.client_config)
+embeddings_backend   = os.getenv("EMBEDDINGS_BACKEND", "bedrock")
+llm_backend          = os.getenv("LLM_BACKEND", "bedrock")
+
+if embeddings_backend == "fake":
+    bedrock_embeddings = FakeEmbeddings()
+else:
+    bedrock_embeddings = BedrockEmbeddings(model_id="amazon.titan-embed-text-v1", client=bedrock_client)
 
 
 def get_llm():
+    if llm_backend == "fake":
+        return FakeStreamingLLM()
+
     llm = Bedrock(
             model_id="anthropic.claude-v2:1", 
             client=bedrock_client,
@@ -25,7 +60,7 @@ def get_llm():
     return llm
 
 
-def get_response(llm, vector_store, question):
+def get_prompt():
     prompt_template = """
     
     Human: Please use the given context and provide a concise answer to the question below. If you do not know the answer, respond that the answer is not known and do not try to make up an answer.
@@ -44,28 +79,249 @@ def get_response(llm, vector_store, question):
                 input_variables=["context","question"]
             )
 
-    qa = RetrievalQA.from_chain_type(
-                        llm=llm,
-                        chain_type="stuff",
-                        retriever=vector_store.as_retriever(search_type="similarity", search_kwargs={"k": 5}),
-                        return_source_documents=True,
-                        chain_type_kwargs={"prompt": prompt}
-                        )
+    return prompt
+
+
+def with_context_budget(retriever):
+    """ Merges overlapping hits and drops repeated text before it reaches the prompt """
+    if not CONTEXT_TOKEN_BUDGET:
+        return retriever
+    return ContextBudgetRetriever(retriever=retriever, token_budget=CONTEXT_TOKEN_BUDGET)
+
+
+def with_reranking(retriever):
+    """ Turns a retriever built for RERANK_CANDIDATES hits into one returning the RETRIEVAL_TOP_K best after reranking """
+    if not RERANK_CANDIDATES:
+        return retriever
+    return RerankingRetriever(retriever=retriever, k=RETRIEVAL_TOP_K)
+
+
+def first_stage_k():
+    return RERANK_CANDIDATES or RETRIEVAL_TOP_K
+
+
+def get_retriever(vector_store, bm25_index=None):
+    """ Similarity search over the FAISS index, fused with keyword search when the index has a BM25 companion """
+    retriever = HybridRetriever(vector_store=vector_store, bm25_index=bm25_index, k=first_stage_k(),
+                                candidates=max(HYBRID_CANDIDATES, first_stage_k()))
+    return with_context_budget(with_reranking(retriever))
+
+
+def get_response(llm, vector_store, question, bm25_index=None):
+    """ Answers in one call, with retrieval and the LLM call traced as separate stages like stream_response """
+    with shared_tracer.span("retrieve") as span:
+        documents = get_retriever(vector_store, bm25_index).invoke(question)
+        span['documents'] = len(documents)
+
+    # Stuffs the chunks into the prompt the way RetrievalQA's "stuff" chain did
+    context = "\n\n".join(document.page_content for document in documents)
+    with shared_tracer.span("generate"):
+        return llm.invoke(get_prompt().format(context=context, question=question))
 
-    answer = qa({"query": question})
 
-    return answer['result']
+def stream_response(llm, retriever, question, timings, question_vector=None):
+    """ Yields the answer token by token, recording time-to-first-token and total latency in timings
+
+    question_vector, when given, is the question's embedding and is searched with instead of embedding it again.
+    """
+    started_at = time.perf_counter()
+    with shared_tracer.span("retrieve") as span:
+        documents = retriever.invoke(question, query_vector=question_vector)
+        span['documents'] = len(documents)
+    timings['retrieval'] = time.perf_counter() - started_at
+
+    context = "\n\n".join(document.page_content for document in documents)
+    with shared_tracer.span("generate") as span:
+        for token in llm.stream(get_prompt().format(context=context, question=question)):
+            if 'first_token' not in timings:
+                timings['first_token'] = time.perf_counter() - started_at
+                span['first_token_ms'] = round((timings['first_token'] - timings['retrieval']) * 1000, 1)
+            yield token
+
+    timings['total'] = time.perf_counter() - started_at
+
+
+def remove_older_versions(s3_bucket_name, version):
+    """ Deletes the downloaded index versions of a bucket older than the given one
+
+    Versions are publish timestamps. Stores loaded from a deleted folder keep working, since their
+    files stay open and mapped until the stores are garbage collected. Indexes evicted from the cache
+    only to free memory keep their folders, so loading them again skips the files that are up to date.
+    """
+    bucket_folder_path = os.path.join(download_folder_path, s3_bucket_name)
+    if not os.path.isdir(bucket_folder_path):
+        return
+    for local_version in os.listdir(bucket_folder_path):
+        if local_version.isdigit() and version.isdigit() and int(local_version) < int(version):
+            shutil.rmtree(os.path.join(bucket_folder_path, local_version), ignore_errors=True)
+
 
 def load_index(s3_bucket_name):
-    response = s3_client.list_objects_v2(Bucket=s3_bucket_name)
-    if 'Contents' in response and len(response['Contents']) > 0:
-        for content in response['Contents']:
-            key = content['Key']
-            s3_client.download_file(Bucket=s3_bucket_name, Key=key, Filename=f"{download_folder_path}/{key}")
-            print(f'Downloaded {key} to {download_folder_path}/{key}')
-    else:
-        print('No objects were found in the S3 bucket.')
+    """ Downloads the index published in the bucket and returns its manifest """
+    try:
+        response = s3_client.get_object(Bucket=s3_bucket_name, Key=MANIFEST_KEY)
+    except s3_client.exceptions.NoSuchKey:
+        print(f'No index manifest was found in the S3 bucket {s3_bucket_name}.')
+        return None
+
+    manifest = json.loads(response['Body'].read())
+    # Each version gets its own folder, so files of one version are never replaced while being read
+    local_folder_path = os.path.join(download_folder_path, s3_bucket_name, manifest['version'])
+    stats = s3_downloader.download_prefix(s3_bucket_name, manifest['index_prefix'], local_folder_path)
+    print(f"Downloaded {stats['downloaded']} of {stats['objects']} objects ({stats['bytes']} bytes) "
+          f"to {local_folder_path} in {stats['seconds']:.2f}s, {stats['skipped']} already up to date")
+    # Older versions are superseded; newer ones may be downloading for another session, so they are kept
+    remove_older_versions(s3_bucket_name, manifest['version'])
+
+    manifest['local_folder_path'] = local_folder_path
+    return manifest
+
+
+def get_index_version(s3_bucket_name):
+    """ Returns the ETag of the bucket's manifest, which changes whenever a new index is published """
+    try:
+        response = s3_client.head_object(Bucket=s3_bucket_name, Key=MANIFEST_KEY)
+    except ClientError as e:
+        if e.response['Error']['Code'] in ("404", "NoSuchKey"):
+            return None
+        raise
+    return response['ETag'].strip('"')
+
 
+def load_vector_store(s3_bucket_name):
+    """ Returns (manifest, vector store, BM25 index) for the bucket, served from the process-wide cache when possible """
+    version = get_index_version(s3_bucket_name)
+    if version is None:
+        return None, None, None
+
+    def loader():
+        with shared_tracer.span("download", bucket=s3_bucket_name):
+            manifest = load_index(s3_bucket_name)
+        if manifest.get('format') != COMPACT_FORMAT:
+            raise ValueError(f"The index in {s3_bucket_name} was published in the old pickle format. "
+                             "Please upload its PDF again as a new version to republish it.")
+        with shared_tracer.span("load", bucket=s3_bucket_name):
+            faiss_index = CompactVectorStore.load(
+                folder_path=manifest['local_folder_path'],
+                index_name=manifest['index_name'],
+                dimension=manifest['dimension'],
+                embeddings=bedrock_embeddings,
+                index_config=manifest.get('index')
+            )
+            bm25_filename = os.path.join(manifest['local_folder_path'], f"{manifest['index_name']}.bm25.json.gz")
+            bm25_index = BM25Index.load(bm25_filename) if os.path.exists(bm25_filename) else None
+        # Entries are charged what they keep resident, not their size on disk: a loaded BM25 index is
+        # many times its gzipped file, and a flat index's mapped vectors are all paged in by every search
+        size = faiss_index.memory_bytes() + (bm25_index.memory_bytes() if bm25_index else 0)
+        return (manifest, faiss_index, bm25_index), size
+
+    return shared_index_cache.get_or_load((s3_bucket_name, version), loader)
+
+
+def try_load_vector_store(s3_bucket_name):
+    """ Like load_vector_store, but returns the error instead of raising it, so one bad bucket cannot fail a collection """
+    try:
+        return load_vector_store(s3_bucket_name), None
+    except Exception as e:
+        print(f"Could not load the index in {s3_bucket_name}: {e}")
+        return (None, None, None), e
+
+
+def load_collection(s3_bucket_names):
+    """ Loads the indexes of several buckets concurrently; returns them with the buckets that failed to load
+
+    Buckets without a published index are left out, as are buckets that could not be read (no
+    access, another region, an index in the old format), which are returned with their errors.
+    """
+    loaded = aws_io.gather(*(aws_io.run("s3", try_load_vector_store, s3_bucket_name) for s3_bucket_name in s3_bucket_names))
+    collection = {name: (manifest, faiss_index)
+                  for name, ((manifest, faiss_index, _), _) in zip(s3_bucket_names, loaded) if manifest}
+    failed = {name: error for name, (_, error) in zip(s3_bucket_names, loaded) if error is not None}
+    return collection, failed
+
+
+def answer_question(index_key, retriever, question):
+    """ Answers from the semantic cache when possible, otherwise streams a fresh answer onto the page """
+    with shared_tracer.trace("query", index=index_key[0]) as trace:
+        streamlit.session_state['last_trace'] = trace
+        with shared_tracer.span("embed"):
+            question_vector = bedrock_embeddings.embed_query(question)
+        with shared_tracer.span("cache_lookup") as span:
+            cached = shared_answer_cache.lookup(index_key, question_vector)
+            span['hit'] = cached is not None
+        if cached:
+            answer, similarity = cached
+            streamlit.write(answer)
+            streamlit.success("Done")
+            streamlit.caption(f"Answered from cache (similarity {similarity:.3f}).")
+            return
+
+        llm = get_llm()
+        timings = {}
+
+        def generate():
+            answer = streamlit.write_stream(stream_response(llm, retriever, question, timings, question_vector))
+            shared_answer_cache.put(index_key, question_vector, answer, timings['total'])
+            return answer
+
+        try:
+            answer, shared = shared_query_executor.run((index_key, normalize_question(question)), generate)
+        except QueryRejected as error:
+            streamlit.error("Too many questions are being answered right now. Please try again in a moment."
+                            if error.reason == "queue_full" else
+                            "Your question waited too long for a free slot. Please try again in a moment.")
+            return
+        if shared:
+            streamlit.write(answer)
+            streamlit.success("Done")
+            streamlit.caption("Answered together with the same question asked in another session.")
+            return
+        queue_wait = next((span for span in trace['spans'] if span['name'] == "queue_wait"), None)
+        if queue_wait and queue_wait['seconds'] >= 0.1:
+            streamlit.caption(f"Waited {queue_wait['seconds']:.2f}s for a free slot")
+        rerank = next((span for span in trace['spans'] if span['name'] == "rerank"), None)
+        if rerank:
+            streamlit.caption(f"Reranked {rerank['attributes']['candidates']} candidates to {rerank['attributes']['k']} "
+                              f"in {rerank['attributes']['rerank_ms']:.1f}ms")
+        if isinstance(retriever, ContextBudgetRetriever) and retriever.last_stats:
+            streamlit.caption(f"Context: {retriever.last_stats['passages']} passages, {retriever.last_stats['tokens_after']} tokens "
+                              f"({retriever.last_stats['tokens_saved']} saved by merging and deduplicating)")
+    streamlit.success("Done")
+    streamlit.caption(f"First token after {timings.get('first_token', timings['total']):.2f}s "
+                      f"(retrieval {timings['retrieval']:.2f}s), total {timings['total']:.2f}s")
+
+
+def collection_page(buckets):
+    s3_bucket_names = streamlit.multiselect("Select the documents to search", options=buckets)
+    if not s3_bucket_names:
+        streamlit.write("Please select at least one document to proceed.")
+        return
+
+    collection, failed = load_collection(s3_bucket_names)
+    if failed:
+        streamlit.caption(f"Skipped documents that could not be loaded: {', '.join(sorted(failed))}")
+    streamlit.write(f"Searching {len(collection)} documents "
+                    f"({sum(len(manifest['chunk_ids']) for manifest, _ in collection.values())} chunks).")
+
+    question = streamlit.text_input("Please enter your question.")
+    if streamlit.button("Ask") and collection:
+        router = ShardRouter(shards={name: faiss_index for name, (_, faiss_index) in collection.items()},
+                             embeddings=bedrock_embeddings, k=first_stage_k(), shard_timeout=SHARD_TIMEOUT)
+        versions = ",".join(f"{name}@{manifest['version']}" for name, (manifest, _) in sorted(collection.items()))
+        answer_question((f"collection:{','.join(sorted(collection))}", versions), with_context_budget(with_reranking(router)), question)
+        if router.last_stats.get('timed_out'):
+            streamlit.caption(f"Skipped slow documents: {', '.join(router.last_stats['timed_out'])}")
+
+
+def show_debug_panel():
+    """ Shows the stage breakdown of this session's last question, and the process's stage histograms """
+    with streamlit.sidebar.expander("Debug: last request"):
+        trace = streamlit.session_state.get('last_trace')
+        if trace and trace['seconds'] is not None:
+            streamlit.dataframe(trace_breakdown(trace))
+        else:
+            streamlit.write("No question has been answered in this session yet.")
+        streamlit.code(shared_tracer.prometheus_text(), language="text")
 
 
 def main():
@@ -76,46 +332,35 @@ def main():
     buckets_response = s3_client.list_buckets()
     buckets = [bucket['Name'] for bucket in buckets_response['Buckets']]
     
-    s3_bucket_name = streamlit.selectbox("Select an S3 bucket", options=buckets)
+    if streamlit.radio("Search", ["One document", "Many documents"], horizontal=True) == "Many documents":
+        collection_page(buckets)
+        s3_bucket_name = None
+    else:
+        s3_bucket_name = streamlit.selectbox("Select an S3 bucket", options=buckets)
 
     if s3_bucket_name:
-        load_index(s3_bucket_name)
-
-        files_list = os.listdir(download_folder_path)
-        streamlit.write("##")
-        streamlit.write(f"List of files in {download_folder_path}:")
-        streamlit.write(files_list)
-        streamlit.write("###")
-        
-        faiss_index_name = None
-        for idx, f in enumerate(files_list):
-            streamlit.write(f"File {idx}: {f}")
-            if f.endswith(".faiss"):
-                faiss_index_name = f.removesuffix(".faiss")
+        manifest, faiss_index, bm25_index = load_vector_store(s3_bucket_name)
         
-        if faiss_index_name:
-            faiss_index = FAISS.load_local(
-                index_name=faiss_index_name, 
-                folder_path=download_folder_path, 
-                embeddings=bedrock_embeddings,
-                allow_dangerous_deserialization=True
-            )
-
+        if manifest:
             streamlit.write("##")
-            streamlit.write(f"Created Index from '{faiss_index_name}'.")
+            streamlit.write(f"Created Index from '{manifest['index_name']}' (version {manifest['version']}, {len(manifest['chunk_ids'])} chunks).")
             streamlit.write("##")
             
             question = streamlit.text_input("Please enter your question.")
             if streamlit.button("Ask"):
-                with streamlit.spinner("Querying..."):
-                    llm = get_llm()
-                    response = get_response(llm, faiss_index, question)
-                    streamlit.write(response)
-                    streamlit.success("Done")
+                answer_question((s3_bucket_name, manifest['version']), get_retriever(faiss_index, bm25_index), question)
         else:
             streamlit.write("No FAISS index files found in the selected bucket.")
-    else:
+    elif s3_bucket_name is not None:
         streamlit.write("Please select an S3 bucket to proceed.")
 
+    streamlit.sidebar.write("Index cache")
+    streamlit.sidebar.json(shared_index_cache.stats())
+    streamlit.sidebar.write("Answer cache")
+    streamlit.sidebar.json(shared_answer_cache.stats())
+    streamlit.sidebar.write("Query executor")
+    streamlit.sidebar.json(shared_query_executor.stats())
+    show_debug_panel()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
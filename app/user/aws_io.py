@@ -0,0 +1,56 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from botocore.config import Config
+
+
+DEFAULT_LIMITS = {'s3': 16, 'dynamodb': 8, 'bedrock-runtime': 4}
+
+
+class AsyncAWS:
+    """ asyncio layer over blocking boto3 calls, so independent calls can overlap
+
+    Calls run on a shared thread pool sized to the clients' connection pools. Per-service limits
+    are enforced with thread semaphores, so they hold across every event loop and thread of the
+    process (Streamlit sessions, ingestion worker jobs). Functions run through this layer must not
+    call gather themselves, or they could wait on their own pool.
+    """
+
+    def __init__(self, max_pool_connections=32, limits=None):
+        self.client_config = Config(max_pool_connections=max_pool_connections)
+        self._executor = ThreadPoolExecutor(max_workers=max_pool_connections, thread_name_prefix="aws-io")
+        self._limits = {service: threading.BoundedSemaphore(limit) for service, limit in (limits or DEFAULT_LIMITS).items()}
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.stats = {'calls': 0, 'max_in_flight': 0}
+
+    def _call_limited(self, service, function, *args, **kwargs):
+        with self._limits.get(service) or nullcontext():
+            with self._lock:
+                self._in_flight += 1
+                self.stats['calls'] += 1
+                self.stats['max_in_flight'] = max(self.stats['max_in_flight'], self._in_flight)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+
+    async def run(self, service, function, *args, **kwargs):
+        """ Runs a blocking function that talks to the given service, within that service's limit """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(self._call_limited, service, function, *args, **kwargs))
+
+    async def call(self, client, operation, **kwargs):
+        """ Runs a boto3 client operation, e.g. await aws_io.call(s3_client, "upload_file", ...) """
+        return await self.run(client.meta.service_model.service_name, getattr(client, operation), **kwargs)
+
+    def gather(self, *coroutines):
+        """ Runs the coroutines concurrently from synchronous code and returns their results in order """
+        async def gather_all():
+            return await asyncio.gather(*coroutines)
+        return asyncio.run(gather_all())
+
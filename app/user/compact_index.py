@@ -0,0 +1,202 @@
+import json
+import mmap
+import os
+
+import faiss
+import numpy
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+from tracing import shared_tracer
+
+
+# Must match the layout the admin app publishes (see the admin app's compact_index.py)
+COMPACT_FORMAT = "compact-v1"
+VECTORS_EXTENSION = "vectors.f32"
+IDS_EXTENSION = "ids.i64"
+CHUNKS_EXTENSION = "chunks.jsonl"
+OFFSETS_EXTENSION = "offsets.u64"
+ANN_INDEX_EXTENSION = "faiss"
+
+
+def apply_search_params(index, config):
+    """ Search-time parameters (HNSW efSearch, IVF nprobe) are not stored in the index file itself """
+    if config['type'] == "hnsw":
+        index.hnsw.efSearch = config['ef_search']
+    elif config['type'] in ("ivf", "ivfpq"):
+        faiss.extract_index_ivf(index).nprobe = config['nprobe']
+
+
+class ChunkStore:
+    """ Reads chunk records from the memory-mapped chunks file, one record at a time
+
+    Only the records of hits are ever decoded, so opening a store costs the same for any index size.
+    """
+
+    def __init__(self, chunks_filename, offsets_filename, ids_filename):
+        with open(chunks_filename, "rb") as f:
+            # mmap cannot map an empty file
+            self.chunks = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+        self.offsets = numpy.memmap(offsets_filename, dtype="<u8", mode="r")
+        self.ids = numpy.memmap(ids_filename, dtype="<i8", mode="r") if os.path.getsize(ids_filename) else numpy.empty(0, dtype="<i8")
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def get(self, position):
+        record = json.loads(self.chunks[int(self.offsets[position]):int(self.offsets[position + 1])])
+        return Document(page_content=record['page_content'], metadata=record['metadata'])
+
+    def search(self, doc_id):
+        """ Looks a chunk up by its chunk ID, like the docstore of a langchain FAISS store """
+        position = int(numpy.searchsorted(self.ids, int(doc_id)))
+        if position == len(self.ids) or self.ids[position] != int(doc_id):
+            return None
+        return self.get(position)
+
+
+class CompactVectorStore(VectorStore):
+    """ Read-only vector store over an index published in the compact layout
+
+    Flat indexes are searched exactly over the memory-mapped vectors, so only pages touched by a
+    search become resident. ANN indexes are searched through their FAISS index.
+    """
+
+    def __init__(self, vectors, docstore, embeddings, index=None, index_bytes=0):
+        self.vectors = vectors
+        self.docstore = docstore
+        self.index = index
+        self.index_bytes = index_bytes
+        self._embeddings = embeddings
+
+    @classmethod
+    def load(cls, folder_path, index_name, dimension, embeddings, index_config=None):
+        def path(extension):
+            return os.path.join(folder_path, f"{index_name}.{extension}")
+
+        vectors = numpy.memmap(path(VECTORS_EXTENSION), dtype="<f4", mode="r").reshape(-1, dimension) \
+            if os.path.getsize(path(VECTORS_EXTENSION)) else numpy.empty((0, dimension), dtype="<f4")
+        docstore = ChunkStore(path(CHUNKS_EXTENSION), path(OFFSETS_EXTENSION), path(IDS_EXTENSION))
+
+        index = None
+        index_bytes = 0
+        index_config = index_config or {'type': "flat"}
+        if index_config['type'] != "flat":
+            # IVF inverted lists are memory-mapped too, leaving only the coarse centroids in memory;
+            # HNSW graphs are read into memory whole
+            index = faiss.read_index(path(ANN_INDEX_EXTENSION), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+            apply_search_params(index, index_config)
+            if index_config['type'] in ("ivf", "ivfpq"):
+                quantizer = faiss.extract_index_ivf(index).quantizer
+                index_bytes = quantizer.ntotal * quantizer.d * 4
+            else:
+                index_bytes = os.path.getsize(path(ANN_INDEX_EXTENSION))
+        return cls(vectors, docstore, embeddings, index, index_bytes)
+
+    def memory_bytes(self):
+        """ Approximate memory the store keeps resident while it is being searched
+
+        An exact search scans every vector, so a flat index keeps its whole mapped vectors file in
+        memory; ANN searches touch few vectors and chunk records are only read for hits.
+        """
+        if self.index is None:
+            return self.vectors.nbytes
+        return self.index_bytes
+
+    @property
+    def embeddings(self):
+        return self._embeddings
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        raise NotImplementedError("Compact indexes are read-only; the admin app publishes a new version instead")
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise NotImplementedError("Compact indexes are written by the admin app")
+
+    def search_positions_by_vector(self, embedding, k=4):
+        """ Returns (squared L2 distance, position) of the k closest chunks without decoding their records
+
+        Callers merging hits from several stores decode only the ones they keep, with docstore.get.
+        """
+        k = min(k, len(self.vectors))
+        if k == 0:
+            return []
+        query = numpy.asarray([embedding], dtype=numpy.float32)
+        with shared_tracer.span("search", k=k):
+            if self.index is None:
+                distances, positions = faiss.knn(query, self.vectors, k)
+            else:
+                distances, positions = self.index.search(query, k)
+        return [(float(distance), int(position)) for position, distance in zip(positions[0], distances[0]) if position != -1]
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4, **kwargs):
+        """ Returns the k closest chunks with their squared L2 distances, the same scores FAISS.similarity_search_with_score returns """
+        return [(self.docstore.get(position), distance) for distance, position in self.search_positions_by_vector(embedding, k)]
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [document for document, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        with shared_tracer.span("embed"):
+            embedding = self._embeddings.embed_query(query)
+        return self.similarity_search_with_score_by_vector(embedding, k)
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return [document for document, _ in self.similarity_search_with_score(query, k)]
+
+
+if __name__ == "__main__":
+    import argparse
+    import tempfile
+    import time
+    import tracemalloc
+
+    from langchain_community.vectorstores import FAISS
+
+    from fakes import FakeEmbeddings
+
+    parser = argparse.ArgumentParser(description="Compare load time, Python heap and query latency of pickled and compact indexes.")
+    parser.add_argument("--chunks", type=int, default=50000)
+    parser.add_argument("--dimension", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args()
+
+    embeddings = FakeEmbeddings(dimension=args.dimension)
+    rng = numpy.random.default_rng(0)
+    vectors = rng.normal(size=(args.chunks, args.dimension)).astype(numpy.float32)
+    texts = [f"chunk {i} " + "lorem ipsum dolor sit amet " * 30 for i in range(args.chunks)]
+    metadatas = [{'source': "benchmark.pdf", 'page': i // 5, 'chunk_id': i} for i in range(args.chunks)]
+
+    with tempfile.TemporaryDirectory() as folder:
+        FAISS.from_embeddings(list(zip(texts, vectors)), embeddings, metadatas=metadatas,
+                              ids=[str(i) for i in range(args.chunks)]).save_local(folder, "pickled")
+
+        # Written in the layout of the admin app's save_compact_index
+        vectors.astype("<f4").tofile(os.path.join(folder, f"compact.{VECTORS_EXTENSION}"))
+        numpy.arange(args.chunks, dtype="<i8").tofile(os.path.join(folder, f"compact.{IDS_EXTENSION}"))
+        offsets = [0]
+        with open(os.path.join(folder, f"compact.{CHUNKS_EXTENSION}"), "wb") as f:
+            for text, metadata in zip(texts, metadatas):
+                f.write(json.dumps({'page_content': text, 'metadata': metadata}).encode("utf-8") + b"\n")
+                offsets.append(f.tell())
+        numpy.asarray(offsets, dtype="<u8").tofile(os.path.join(folder, f"compact.{OFFSETS_EXTENSION}"))
+
+        loaders = {
+            'pickle': lambda: FAISS.load_local(folder, embeddings, "pickled", allow_dangerous_deserialization=True),
+            'compact': lambda: CompactVectorStore.load(folder, "compact", args.dimension, embeddings)
+        }
+        queries = vectors[rng.choice(args.chunks, args.queries)]
+        for name, loader in loaders.items():
+            tracemalloc.start()
+            started_at = time.perf_counter()
+            vector_store = loader()
+            load_seconds = time.perf_counter() - started_at
+            _, heap_peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            started_at = time.perf_counter()
+            for query in queries:
+                vector_store.similarity_search_with_score_by_vector(query.tolist(), 5)
+            query_ms = (time.perf_counter() - started_at) / args.queries * 1000
+            print(f"{name}: loaded in {load_seconds * 1000:.1f}ms, peak Python heap {heap_peak / 1024 / 1024:.1f}MB, {query_ms:.2f}ms/query")
@@ -0,0 +1,180 @@
+from typing import Any, Dict
+
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import Field
+
+from hybrid_retriever import tokenize
+from tracing import shared_tracer
+
+
+# Claude and Titan tokenizers average roughly four characters of English text per token
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def overlap_length(first, second, min_overlap=20, max_overlap=400):
+    """ Length of the longest suffix of first that is also a prefix of second, or 0 if shorter than min_overlap """
+    for length in range(min(len(first), len(second), max_overlap), min_overlap - 1, -1):
+        if first.endswith(second[:length]):
+            return length
+    return 0
+
+
+def merge_adjacent(documents):
+    """ Merges hits that are consecutive chunks of the same page into one passage
+
+    Chunks are split with an overlap, so consecutive chunks repeat up to the overlap's length of
+    text. Each passage keeps the rank of its best hit. Returns (passages, number of hits merged away).
+    """
+    runs = {}
+    for rank, document in enumerate(documents):
+        metadata = document.metadata
+        key = (metadata.get('source_document'), metadata.get('source'), metadata.get('page'))
+        runs.setdefault(key, []).append((metadata.get('chunk_id'), rank, document))
+
+    passages = []
+    merged = 0
+    for hits in runs.values():
+        hits.sort(key=lambda hit: (hit[0] is None, hit[0] or 0))
+        current = None
+        for chunk_id, rank, document in hits:
+            if current and chunk_id is not None and current['last_chunk_id'] is not None \
+                    and chunk_id == current['last_chunk_id'] + 1:
+                text = document.page_content
+                overlap = overlap_length(current['text'], text)
+                current['text'] += text[overlap:] if overlap else "\n" + text
+                current['last_chunk_id'] = chunk_id
+                current['rank'] = min(current['rank'], rank)
+                merged += 1
+                continue
+            current = {'text': document.page_content, 'rank': rank, 'last_chunk_id': chunk_id, 'metadata': dict(document.metadata)}
+            passages.append(current)
+
+    passages.sort(key=lambda passage: passage['rank'])
+    return [Document(page_content=passage['text'], metadata=passage['metadata']) for passage in passages], merged
+
+
+def jaccard_similarity(first_terms, second_terms):
+    if not first_terms or not second_terms:
+        return 0.0
+    return len(first_terms & second_terms) / len(first_terms | second_terms)
+
+
+def build_context(documents, token_budget, duplicate_threshold=0.9):
+    """ Turns ranked hits into the passages to put in the prompt, and stats on the tokens saved
+
+    Consecutive chunks of a page are merged, passages whose terms nearly all repeat a better
+    ranked passage are dropped, and passages are added in rank order until token_budget is
+    reached; the passage that crosses the budget is truncated to fit. A budget of 0 disables it.
+    """
+    tokens_before = sum(estimate_tokens(document.page_content) for document in documents)
+    passages, merged = merge_adjacent(documents)
+
+    kept = []
+    kept_terms = []
+    duplicates = 0
+    for passage in passages:
+        terms = set(tokenize(passage.page_content))
+        if any(jaccard_similarity(terms, other) >= duplicate_threshold for other in kept_terms):
+            duplicates += 1
+            continue
+        kept.append(passage)
+        kept_terms.append(terms)
+
+    context = []
+    remaining = token_budget
+    for passage in kept:
+        tokens = estimate_tokens(passage.page_content)
+        if not token_budget or tokens <= remaining:
+            context.append(passage)
+            remaining -= tokens
+            continue
+        if remaining > 0:
+            context.append(Document(page_content=passage.page_content[:remaining * CHARS_PER_TOKEN],
+                                    metadata=dict(passage.metadata, truncated=True)))
+        break
+
+    tokens_after = sum(estimate_tokens(document.page_content) for document in context)
+    return context, {
+        'hits': len(documents),
+        'merged': merged,
+        'duplicates': duplicates,
+        'passages': len(context),
+        'tokens_before': tokens_before,
+        'tokens_after': tokens_after,
+        'tokens_saved': tokens_before - tokens_after
+    }
+
+
+class ContextBudgetRetriever(BaseRetriever):
+    """ Wraps a retriever so the documents it returns fit a prompt token budget without repeated text """
+
+    retriever: Any
+    token_budget: int = 1500
+    duplicate_threshold: float = 0.9
+    last_stats: Dict[str, Any] = Field(default_factory=dict)
+
+    def _get_relevant_documents(self, query, *, run_manager=None, query_vector=None):
+        documents = self.retriever.invoke(query, query_vector=query_vector)
+        with shared_tracer.span("context") as span:
+            context, self.last_stats = build_context(documents, self.token_budget, self.duplicate_threshold)
+            span.update(self.last_stats)
+        return context
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from langchain_community.vectorstores import FAISS
+
+    from fakes import FakeEmbeddings, FakeStreamingLLM
+    from hybrid_retriever import BM25Index, HybridRetriever
+
+    parser = argparse.ArgumentParser(description="Measure prompt tokens and generation latency with and without context assembly.")
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--token-budget", type=int, default=1500)
+    parser.add_argument("--prefill-seconds-per-1k-tokens", type=float, default=0.2,
+                        help="Simulated LLM prompt processing time, so generation latency follows prompt size")
+    args = parser.parse_args()
+
+    # Pages of repeated sentences about few topics, so neighbouring chunks and near-duplicates both occur
+    sentences = [f"Clause {i % 40}.{i % 7} requires the tenant to {['pay rent', 'insure the premises', 'repair damage', 'notify the landlord'][i % 4]} "
+                 f"within {i % 30 + 1} days of notice number {i}." for i in range(args.pages * 40)]
+    pages = [Document(page_content=" ".join(sentences[page * 40:(page + 1) * 40]), metadata={'source': "lease.pdf", 'page': page})
+             for page in range(args.pages)]
+    chunks = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200).split_documents(pages)
+    for chunk_id, chunk in enumerate(chunks):
+        chunk.metadata['chunk_id'] = chunk_id
+
+    embeddings = FakeEmbeddings(dimension=256)
+    ids = [str(i) for i in range(len(chunks))]
+    vector_store = FAISS.from_documents(chunks, embeddings, ids=ids)
+    # The fake embeddings carry no meaning, so keyword search is what finds a query's chunk and its neighbours
+    bm25_index = BM25Index.from_texts(ids, [chunk.page_content for chunk in chunks])
+    retrievers = {
+        'top-k': HybridRetriever(vector_store=vector_store, bm25_index=bm25_index, k=args.k),
+        'budgeted': ContextBudgetRetriever(retriever=HybridRetriever(vector_store=vector_store, bm25_index=bm25_index, k=args.k),
+                                           token_budget=args.token_budget)
+    }
+    llm = FakeStreamingLLM(first_token_delay=0.0, token_delay=0.0, prefill_seconds_per_1k_tokens=args.prefill_seconds_per_1k_tokens)
+
+    for name, retriever in retrievers.items():
+        prompt_tokens = []
+        started_at = time.perf_counter()
+        for i in range(args.queries):
+            # Query with a chunk's own text, so its neighbours rank highly as they would for a real question
+            documents = retriever.invoke(chunks[(i * 37) % len(chunks)].page_content[:200])
+            prompt = "\n\n".join(document.page_content for document in documents)
+            prompt_tokens.append(estimate_tokens(prompt))
+            llm.invoke(prompt)
+        elapsed = time.perf_counter() - started_at
+        print(f"{name}: {sum(prompt_tokens) / len(prompt_tokens):.0f} prompt tokens/query, "
+              f"{elapsed / args.queries * 1000:.0f}ms/query including simulated generation")
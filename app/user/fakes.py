@@ -0,0 +1,61 @@
+import hashlib
+import math
+import time
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+
+class FakeEmbeddings(Embeddings):
+    """ Deterministic stand-in for Bedrock embeddings, matching the admin app's fake embedder """
+
+    def __init__(self, dimension=1536, latency=0.0):
+        self.dimension = dimension
+        self.latency = latency
+
+    def _embed(self, text):
+        vector = []
+        counter = 0
+        while len(vector) < self.dimension:
+            digest = hashlib.sha256(f"{counter}:{text}".encode("utf-8")).digest()
+            vector.extend((byte - 127.5) / 127.5 for byte in digest)
+            counter += 1
+        vector = vector[:self.dimension]
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts):
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+class FakeStreamingLLM(LLM):
+    """ Local LLM that yields a canned answer word by word on a timer, so streaming works without Bedrock """
+
+    response: str = "This is a locally generated answer used to exercise the streaming path without calling Bedrock."
+    first_token_delay: float = 0.5
+    token_delay: float = 0.05
+    # Time to process the prompt before the first token, so latency grows with the prompt like a hosted model's
+    prefill_seconds_per_1k_tokens: float = 0.1
+
+    @property
+    def _llm_type(self):
+        return "fake-streaming"
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        return "".join(chunk.text for chunk in self._stream(prompt, stop=stop, run_manager=run_manager, **kwargs))
+
+    def _stream(self, prompt, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.first_token_delay + self.prefill_seconds_per_1k_tokens * len(prompt) / 4000)
+        for i, word in enumerate(self.response.split(" ")):
+            if i:
+                time.sleep(self.token_delay)
+            chunk = GenerationChunk(text=word if i == 0 else f" {word}")
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
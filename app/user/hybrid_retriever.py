@@ -0,0 +1,172 @@
+import gzip
+import heapq
+import json
+import math
+import re
+import sys
+from collections import Counter, defaultdict
+from typing import Any, Optional
+
+from langchain_core.retrievers import BaseRetriever
+
+from tracing import shared_tracer
+
+
+# Must match the admin app's tokenizer, which built the index
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.\-/][a-z0-9]+)*")
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """ Read side of the keyword index the admin app stores next to each FAISS index """
+
+    def __init__(self, index):
+        self.k1 = index['k1']
+        self.b = index['b']
+        self.doc_ids = index['doc_ids']
+        self.doc_lengths = index['doc_lengths']
+        self.avg_doc_length = index['avg_doc_length'] or 1.0
+        self.postings = index['postings']
+        self.idf = {term: math.log(1 + (len(self.doc_ids) - len(docs) + 0.5) / (len(docs) + 0.5))
+                    for term, (docs, _) in self.postings.items()}
+
+    @classmethod
+    def from_texts(cls, doc_ids, texts, k1=1.5, b=0.75):
+        """ Builds an index in memory, in the same layout the admin app stores """
+        postings = {}
+        doc_lengths = []
+        for position, text in enumerate(texts):
+            terms = Counter(tokenize(text))
+            doc_lengths.append(sum(terms.values()))
+            for term, frequency in terms.items():
+                docs, frequencies = postings.setdefault(term, ([], []))
+                docs.append(position)
+                frequencies.append(frequency)
+        return cls({'k1': k1, 'b': b, 'doc_ids': list(doc_ids), 'doc_lengths': doc_lengths,
+                    'avg_doc_length': sum(doc_lengths) / len(doc_lengths) if doc_lengths else 0.0,
+                    'postings': postings})
+
+    def memory_bytes(self):
+        """ Approximate resident size of the loaded index, which is many times its gzipped file size
+
+        Counts the containers, the term strings and the ints outside CPython's cache of small ints.
+        """
+        size = sys.getsizeof(self.postings) + sys.getsizeof(self.idf) + sys.getsizeof(self.doc_ids) + sys.getsizeof(self.doc_lengths)
+        size += sum(sys.getsizeof(doc_id) for doc_id in self.doc_ids)
+        int_size = sys.getsizeof(1 << 20)
+        float_size = sys.getsizeof(1.0)
+        for term, (docs, frequencies) in self.postings.items():
+            size += sys.getsizeof(term) + float_size + sys.getsizeof(self.postings[term]) + sys.getsizeof(docs) + sys.getsizeof(frequencies)
+            size += int_size * sum(1 for value in docs if value > 256)
+        size += int_size * sum(1 for value in self.doc_lengths if value > 256)
+        return size
+
+    @classmethod
+    def load(cls, filename):
+        with gzip.open(filename, "rt", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def search(self, query, k):
+        """ Returns the top k (doc_id, score) pairs for the query """
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            if term not in self.postings:
+                continue
+            docs, frequencies = self.postings[term]
+            idf = self.idf[term]
+            for position, frequency in zip(docs, frequencies):
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[position] / self.avg_doc_length)
+                scores[position] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(self.doc_ids[position], score) for position, score in top]
+
+
+def reciprocal_rank_fusion(rankings, k, rrf_k=60):
+    """ Fuses ranked lists of doc IDs; each list contributes 1 / (rrf_k + rank) per document """
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] += 1.0 / (rrf_k + rank + 1)
+    return [doc_id for doc_id, _ in heapq.nlargest(k, scores.items(), key=lambda item: item[1])]
+
+
+class HybridRetriever(BaseRetriever):
+    """ Combines FAISS similarity search with BM25 keyword search using reciprocal rank fusion """
+
+    vector_store: Any
+    bm25_index: Optional[Any] = None
+    k: int = 5
+    candidates: int = 20
+    rrf_k: int = 60
+
+    def _get_relevant_documents(self, query, *, run_manager=None, query_vector=None):
+        # A caller that already embedded the question passes its vector, saving a second embedding call
+        if query_vector is not None:
+            vector_hits = self.vector_store.similarity_search_by_vector(query_vector, k=self.candidates)
+        else:
+            vector_hits = self.vector_store.similarity_search(query, k=self.candidates)
+        if self.bm25_index is None:
+            return vector_hits[:self.k]
+
+        documents = {str(document.metadata['chunk_id']): document for document in vector_hits}
+        with shared_tracer.span("keyword_search"):
+            keyword_ids = [doc_id for doc_id, _ in self.bm25_index.search(query, self.candidates)]
+        fused_ids = reciprocal_rank_fusion([list(documents), keyword_ids], self.k, self.rrf_k)
+        return [documents.get(doc_id) or self.vector_store.docstore.search(doc_id) for doc_id in fused_ids]
+
+
+if __name__ == "__main__":
+    import argparse
+    import random
+    import time
+
+    from langchain_community.vectorstores import FAISS
+
+    from fakes import FakeEmbeddings
+
+    parser = argparse.ArgumentParser(description="Offline retrieval benchmark: recall@k and latency for vector, BM25 and hybrid retrieval.")
+    parser.add_argument("--documents", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    # Each synthetic chunk mixes shared filler words with a unique clause number and part number,
+    # mimicking the exact-identifier lookups users run against leases and runbooks
+    rng = random.Random(0)
+    vocabulary = [f"word{i}" for i in range(500)]
+    texts, metadatas, ids = [], [], []
+    for i in range(args.documents):
+        filler = " ".join(rng.choice(vocabulary) for _ in range(120))
+        texts.append(f"Section {i // 10}.{i % 10}.{rng.randint(1, 9)} part PN-{100000 + i}. {filler}")
+        metadatas.append({'chunk_id': i})
+        ids.append(str(i))
+
+    embeddings = FakeEmbeddings(dimension=256)
+    vector_store = FAISS.from_texts(texts, embeddings, metadatas=metadatas, ids=ids)
+
+    bm25_index = BM25Index.from_texts(ids, texts)
+    retrievers = {
+        'vector': HybridRetriever(vector_store=vector_store, k=args.k),
+        'bm25': None,
+        'hybrid': HybridRetriever(vector_store=vector_store, bm25_index=bm25_index, k=args.k)
+    }
+
+    queries = []
+    for i in rng.sample(range(args.documents), args.queries):
+        identifier = f"PN-{100000 + i}" if i % 2 else texts[i].split(" ")[1]
+        queries.append((f"What does the document say about {identifier}?", str(i)))
+
+    for name, retriever in retrievers.items():
+        hits = 0
+        started_at = time.perf_counter()
+        for query, expected_id in queries:
+            if retriever is None:
+                result_ids = [doc_id for doc_id, _ in bm25_index.search(query, args.k)]
+            else:
+                result_ids = [str(document.metadata['chunk_id']) for document in retriever.invoke(query)]
+            hits += expected_id in result_ids
+        elapsed = time.perf_counter() - started_at
+        print(f"{name}: recall@{args.k} {hits / len(queries):.3f}, {elapsed / len(queries) * 1000:.2f}ms/query")
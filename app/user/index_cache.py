@@ -0,0 +1,79 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+class IndexCache:
+    """ Process-wide LRU cache of loaded indexes, bounded by an approximate memory budget
+
+    on_evict(key, value), if set, is called for each entry that is evicted or replaced by a newer
+    version, e.g. to delete the entry's downloaded files.
+    """
+
+    def __init__(self, max_bytes, on_evict=None):
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters,
+                        entries=len(self._entries),
+                        bytes=sum(size for _, size in self._entries.values()),
+                        max_bytes=self.max_bytes)
+
+    def _get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.counters['hits'] += 1
+                return self._entries[key][0]
+        return None
+
+    def _put(self, key, value, size):
+        evicted = []
+        with self._lock:
+            # A new version of a bucket's index makes the older ones unreachable
+            for stale_key in [k for k in self._entries if k[0] == key[0] and k != key]:
+                evicted.append((stale_key, self._entries.pop(stale_key)[0]))
+            self._entries[key] = (value, size)
+            used = sum(entry_size for _, entry_size in self._entries.values())
+            while used > self.max_bytes and len(self._entries) > 1:
+                evicted_key, (evicted_value, evicted_size) = self._entries.popitem(last=False)
+                evicted.append((evicted_key, evicted_value))
+                used -= evicted_size
+                self.counters['evictions'] += 1
+
+        if self.on_evict:
+            for evicted_key, evicted_value in evicted:
+                self.on_evict(evicted_key, evicted_value)
+
+    def get_or_load(self, key, loader):
+        """ Returns the cached value for (bucket, version), calling loader() -> (value, size_in_bytes) on a miss """
+        value = self._get(key)
+        if value is not None:
+            return value
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # Concurrent sessions asking for the same index wait for a single load
+        with key_lock:
+            value = self._get(key)
+            if value is not None:
+                return value
+
+            with self._lock:
+                self.counters['misses'] += 1
+            value, size = loader()
+            self._put(key, value, size)
+
+        with self._lock:
+            self._key_locks.pop(key, None)
+        return value
+
+
+shared_index_cache = IndexCache(max_bytes=int(os.getenv("INDEX_CACHE_MAX_MB", "1024")) * 1024 * 1024)
@@ -0,0 +1,147 @@
+import os
+import re
+import threading
+import time
+from collections import deque
+
+from tracing import shared_tracer
+
+
+class QueryRejected(Exception):
+    """ Raised when a question is not admitted, because the queue is full or it waited too long """
+
+    def __init__(self, reason):
+        super().__init__(f"Question rejected: {reason}")
+        self.reason = reason
+
+
+def normalize_question(question):
+    """ Questions that differ only in case, spacing or trailing punctuation are the same question """
+    return re.sub(r"\s+", " ", question).strip().rstrip("?!. ").lower()
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.abandoned = False
+
+
+class QueryExecutor:
+    """ Process-wide admission control for questions that go to the LLM
+
+    At most max_concurrent questions are answered at once. Others wait in a first-come,
+    first-served queue of at most max_queued, and give up after queue_timeout seconds.
+    A question asked while an identical one (same key) is being answered waits for that
+    answer instead of taking a slot of its own.
+
+    Questions run on the caller's thread, so Streamlit calls made while answering still
+    reach the asking session's page.
+    """
+
+    def __init__(self, max_concurrent, max_queued, queue_timeout):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self._condition = threading.Condition()
+        self._queue = deque()
+        self._running = 0
+        self._flights = {}
+        self.counters = {'admitted': 0, 'coalesced': 0, 'rejected_queue_full': 0, 'rejected_timeout': 0,
+                         'queue_wait_seconds_total': 0.0, 'queue_wait_seconds_max': 0.0}
+
+    def stats(self):
+        with self._condition:
+            return dict(self.counters, running=self._running, queued=len(self._queue), max_concurrent=self.max_concurrent,
+                        max_queued=self.max_queued, in_flight=len(self._flights))
+
+    def _acquire(self):
+        started_at = time.perf_counter()
+        ticket = object()
+        with self._condition:
+            # A free slot with nobody waiting for it is taken at once; the queue limit only applies to callers that must wait
+            if self._queue or self._running >= self.max_concurrent:
+                self._wait_for_slot(ticket)
+            self._running += 1
+            waited = time.perf_counter() - started_at
+            self.counters['admitted'] += 1
+            self.counters['queue_wait_seconds_total'] += waited
+            self.counters['queue_wait_seconds_max'] = max(self.counters['queue_wait_seconds_max'], waited)
+            self._condition.notify_all()
+        shared_tracer.record("queue_wait", waited, started_at=started_at)
+
+    def _wait_for_slot(self, ticket):
+        """ Queues the caller until it is at the head of the queue and a slot is free; called holding the condition """
+        if len(self._queue) >= self.max_queued:
+            self.counters['rejected_queue_full'] += 1
+            raise QueryRejected("queue_full")
+        self._queue.append(ticket)
+        deadline = time.monotonic() + self.queue_timeout
+        # Only the head of the queue may take a free slot, so questions are admitted in arrival order
+        while self._queue[0] is not ticket or self._running >= self.max_concurrent:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._queue.remove(ticket)
+                self.counters['rejected_timeout'] += 1
+                # The head may have left; let the next waiter check again
+                self._condition.notify_all()
+                raise QueryRejected("timeout")
+            self._condition.wait(remaining)
+        self._queue.popleft()
+
+    def _release(self):
+        with self._condition:
+            self._running -= 1
+            self._condition.notify_all()
+
+    def run(self, key, fn):
+        """ Returns (fn(), False) once admitted, or (the answer of the identical question in flight, True)
+
+        Exceptions from fn are raised to every caller sharing its answer. A leader that leaves
+        without an answer or an Exception (Streamlit stops or reruns a session by raising
+        BaseExceptions) hands the question over to one of its followers instead.
+        """
+        while True:
+            with self._condition:
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = _Flight()
+                else:
+                    self.counters['coalesced'] += 1
+            if leader:
+                break
+            # The leader gives up after queue_timeout if it is not admitted, so this wait is bounded too
+            with shared_tracer.span("coalesced_wait"):
+                flight.done.wait()
+            if flight.abandoned:
+                continue
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            self._acquire()
+            try:
+                flight.result = fn()
+            finally:
+                self._release()
+        except Exception as error:
+            flight.error = error
+            raise
+        except BaseException:
+            flight.abandoned = True
+            raise
+        finally:
+            with self._condition:
+                self._flights.pop(key, None)
+            flight.done.set()
+        return flight.result, False
+
+
+shared_query_executor = QueryExecutor(
+    max_concurrent=int(os.getenv("QUERY_MAX_CONCURRENT", "4")),
+    max_queued=int(os.getenv("QUERY_MAX_QUEUED", "32")),
+    queue_timeout=float(os.getenv("QUERY_QUEUE_TIMEOUT_SECONDS", "30"))
+)
@@ -0,0 +1,131 @@
+import math
+import time
+from collections import Counter
+from typing import Any, Dict
+
+from langchain_core.retrievers import BaseRetriever
+from pydantic import Field
+
+from hybrid_retriever import tokenize
+from tracing import shared_tracer
+
+
+class LexicalReranker:
+    """ Scores candidate chunks against a question with no model, in well under a millisecond per candidate
+
+    The score blends BM25 computed over the candidate set alone, the share of the question's
+    consecutive word pairs that appear in the chunk, and the candidate's first-stage rank, so
+    a candidate with no words in common with the question keeps the order the search gave it.
+    """
+
+    def __init__(self, k1=1.5, b=0.75, phrase_weight=0.5, rank_weight=0.2):
+        self.k1 = k1
+        self.b = b
+        self.phrase_weight = phrase_weight
+        self.rank_weight = rank_weight
+
+    def score(self, query, documents):
+        query_terms = tokenize(query)
+        query_pairs = set(zip(query_terms, query_terms[1:]))
+        query_terms = set(query_terms)
+
+        document_terms = [tokenize(document.page_content) for document in documents]
+        frequencies = [Counter(terms) for terms in document_terms]
+        lengths = [len(terms) for terms in document_terms]
+        avg_length = sum(lengths) / len(lengths) if lengths else 0.0
+        avg_length = avg_length or 1.0
+
+        idf = {}
+        for term in query_terms:
+            count = sum(1 for frequency in frequencies if term in frequency)
+            idf[term] = math.log(1 + (len(documents) - count + 0.5) / (count + 0.5))
+
+        lexical_scores = []
+        phrase_scores = []
+        for terms, frequency, length in zip(document_terms, frequencies, lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / avg_length)
+            lexical_scores.append(sum(idf[term] * frequency[term] * (self.k1 + 1) / (frequency[term] + norm)
+                                      for term in query_terms if term in frequency))
+            if query_pairs:
+                phrase_scores.append(len(query_pairs & set(zip(terms, terms[1:]))) / len(query_pairs))
+            else:
+                phrase_scores.append(0.0)
+
+        max_lexical = max(lexical_scores, default=0.0) or 1.0
+        return [lexical / max_lexical + self.phrase_weight * phrase + self.rank_weight * (1 - rank / len(documents))
+                for rank, (lexical, phrase) in enumerate(zip(lexical_scores, phrase_scores))]
+
+
+class RerankingRetriever(BaseRetriever):
+    """ Over-fetches candidates from a first-stage retriever and keeps the k that the reranker scores highest """
+
+    retriever: Any
+    reranker: Any = Field(default_factory=LexicalReranker)
+    k: int = 5
+    last_stats: Dict[str, Any] = Field(default_factory=dict)
+
+    def _get_relevant_documents(self, query, *, run_manager=None, query_vector=None):
+        candidates = self.retriever.invoke(query, query_vector=query_vector)
+        with shared_tracer.span("rerank", candidates=len(candidates)) as span:
+            started_at = time.perf_counter()
+            scores = self.reranker.score(query, candidates) if candidates else []
+            ranked = sorted(range(len(candidates)), key=lambda position: -scores[position])[:self.k]
+            self.last_stats = {'candidates': len(candidates), 'k': len(ranked),
+                               'rerank_ms': round((time.perf_counter() - started_at) * 1000, 2)}
+            span.update(self.last_stats)
+        return [candidates[position] for position in ranked]
+
+
+if __name__ == "__main__":
+    import argparse
+    import random
+
+    from langchain_community.vectorstores import FAISS
+
+    from fakes import FakeEmbeddings
+    from hybrid_retriever import BM25Index, HybridRetriever
+
+    parser = argparse.ArgumentParser(description="Offline benchmark: recall@k and latency of single-stage retrieval and of over-fetching then reranking.")
+    parser.add_argument("--documents", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--candidates", type=int, nargs="+", default=[20, 50, 100])
+    args = parser.parse_args()
+
+    # Chunks share most of their words, and each question paraphrases a sentence of one chunk, so the
+    # right chunk is in the first stage's candidates but not always in its top k
+    rng = random.Random(0)
+    vocabulary = [f"word{i}" for i in range(300)]
+    subjects = ["tenant", "landlord", "contractor", "insurer", "auditor", "operator"]
+    actions = ["repair the boiler", "renew the policy", "inspect the wiring", "pay the deposit", "file the report", "rotate the keys"]
+    texts, metadatas, ids, queries = [], [], [], []
+    for i in range(args.documents):
+        filler = " ".join(rng.choice(vocabulary) for _ in range(100))
+        subject, action = rng.choice(subjects), rng.choice(actions)
+        texts.append(f"{filler} The {subject} must {action} within {i % 90 + 1} days. {filler}")
+        metadatas.append({'chunk_id': i})
+        ids.append(str(i))
+    for i in rng.sample(range(args.documents), args.queries):
+        sentence = texts[i].split(". ")[0].split(" The ")[1]
+        queries.append((f"When must the {sentence}?", str(i)))
+
+    vector_store = FAISS.from_texts(texts, FakeEmbeddings(dimension=256), metadatas=metadatas, ids=ids)
+    bm25_index = BM25Index.from_texts(ids, texts)
+    retrievers = {f"single-stage k={args.k}": HybridRetriever(vector_store=vector_store, bm25_index=bm25_index, k=args.k)}
+    for candidates in args.candidates:
+        retrievers[f"rerank {candidates}->{args.k}"] = RerankingRetriever(
+            retriever=HybridRetriever(vector_store=vector_store, bm25_index=bm25_index, k=candidates, candidates=candidates),
+            k=args.k)
+
+    for name, retriever in retrievers.items():
+        hits = 0
+        rerank_ms = []
+        started_at = time.perf_counter()
+        for query, expected_id in queries:
+            result_ids = [str(document.metadata['chunk_id']) for document in retriever.invoke(query)]
+            hits += expected_id in result_ids
+            if isinstance(retriever, RerankingRetriever):
+                rerank_ms.append(retriever.last_stats['rerank_ms'])
+        elapsed = time.perf_counter() - started_at
+        rerank = f", rerank {sum(rerank_ms) / len(rerank_ms):.2f}ms" if rerank_ms else ""
+        print(f"{name}: recall@{args.k} {hits / len(queries):.3f}, {elapsed / len(queries) * 1000:.2f}ms/query{rerank}")
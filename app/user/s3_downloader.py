@@ -0,0 +1,101 @@
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.config import Config
+
+
+class S3Downloader:
+    """ Downloads every object under a prefix concurrently, skipping files that are already up to date """
+
+    def __init__(self, max_workers=8, s3_client=None):
+        self.max_workers = max_workers
+        self.s3_client = s3_client or boto3.client("s3", config=Config(max_pool_connections=max_workers))
+
+    def list_objects(self, s3_bucket_name, prefix=""):
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=s3_bucket_name, Prefix=prefix):
+            for content in page.get('Contents', []):
+                yield content
+
+    @staticmethod
+    def _is_current(filename, content):
+        etag_filename = f"{filename}.etag"
+        if not (os.path.exists(filename) and os.path.exists(etag_filename)):
+            return False
+        if os.path.getsize(filename) != content['Size']:
+            return False
+        with open(etag_filename) as f:
+            return f.read() == content['ETag']
+
+    @staticmethod
+    def _write_atomically(filename, write):
+        temp_filename = f"{filename}.{uuid.uuid4().hex}.tmp"
+        try:
+            write(temp_filename)
+            os.replace(temp_filename, filename)
+        finally:
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
+
+    def _download(self, s3_bucket_name, content, filename):
+        if self._is_current(filename, content):
+            return False
+
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        self._write_atomically(filename, lambda temp_filename: self.s3_client.download_file(
+            Bucket=s3_bucket_name, Key=content['Key'], Filename=temp_filename))
+
+        def write_etag(temp_filename):
+            with open(temp_filename, "w") as f:
+                f.write(content['ETag'])
+        self._write_atomically(f"{filename}.etag", write_etag)
+        return True
+
+    def download_prefix(self, s3_bucket_name, prefix, local_folder_path):
+        """ Mirrors s3://bucket/prefix into local_folder_path and returns download stats """
+        started_at = time.perf_counter()
+        contents = [content for content in self.list_objects(s3_bucket_name, prefix) if not content['Key'].endswith("/")]
+        filenames = [os.path.join(local_folder_path, os.path.relpath(content['Key'], prefix or ".")) for content in contents]
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            downloaded = list(executor.map(lambda args: self._download(s3_bucket_name, *args), zip(contents, filenames)))
+
+        return {
+            'objects': len(contents),
+            'downloaded': sum(downloaded),
+            'skipped': len(contents) - sum(downloaded),
+            'bytes': sum(content['Size'] for content, fetched in zip(contents, downloaded) if fetched),
+            'seconds': time.perf_counter() - started_at
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+    import tempfile
+
+    from moto import mock_aws
+
+    parser = argparse.ArgumentParser(description="Benchmark S3Downloader against a moto S3 stand-in.")
+    parser.add_argument("--objects", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--object-kb", type=int, default=64)
+    parser.add_argument("--max-workers", type=int, default=8)
+    args = parser.parse_args()
+
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        for count in args.objects:
+            bucket = f"bench-{count}"
+            client.create_bucket(Bucket=bucket)
+            body = os.urandom(args.object_kb * 1024)
+            for i in range(count):
+                client.put_object(Bucket=bucket, Key=f"indexes/v1/part-{i}", Body=body)
+
+            downloader = S3Downloader(max_workers=args.max_workers, s3_client=client)
+            with tempfile.TemporaryDirectory() as folder:
+                cold = downloader.download_prefix(bucket, "indexes/v1/", folder)
+                warm = downloader.download_prefix(bucket, "indexes/v1/", folder)
+            print(f"{count} objects: cold {cold['seconds']:.3f}s ({cold['downloaded']} downloaded), "
+                  f"warm {warm['seconds']:.3f}s ({warm['skipped']} skipped)")
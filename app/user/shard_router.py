@@ -0,0 +1,104 @@
+import heapq
+import os
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Dict
+
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import Field
+
+from tracing import shared_tracer
+
+
+# Shared by every session in the process, so a burst of collection queries cannot spawn unbounded threads
+shard_executor = ThreadPoolExecutor(max_workers=int(os.getenv("SHARD_SEARCH_WORKERS", "16")))
+
+
+def search_shard(vector_store, query_vector, k):
+    """ Returns (distance, hit) pairs, where a hit is a position to decode later if the store supports it, else a Document """
+    if hasattr(vector_store, "search_positions_by_vector"):
+        return vector_store.search_positions_by_vector(query_vector, k)
+    return [(score, document) for document, score in vector_store.similarity_search_with_score_by_vector(query_vector, k)]
+
+
+class ShardRouter(BaseRetriever):
+    """ Searches per-document indexes as shards of one collection and merges their hits by score
+
+    The question is embedded once and every shard is searched in parallel. Shards that do not
+    answer within shard_timeout are left out of the result rather than stalling the answer.
+    Hits are merged by score first, so only the chunk records of the overall top k are decoded.
+    """
+
+    shards: Dict[str, Any]
+    embeddings: Any
+    k: int = 5
+    shard_timeout: float = 2.0
+    last_stats: Dict[str, Any] = Field(default_factory=dict)
+
+    def _get_relevant_documents(self, query, *, run_manager=None, query_vector=None):
+        if query_vector is None:
+            with shared_tracer.span("embed"):
+                query_vector = self.embeddings.embed_query(query)
+        with shared_tracer.span("shard_search", shards=len(self.shards)):
+            futures = {
+                shard_executor.submit(search_shard, vector_store, query_vector, self.k): name
+                for name, vector_store in self.shards.items()
+            }
+            done, not_done = wait(futures, timeout=self.shard_timeout)
+        for future in not_done:
+            future.cancel()
+
+        hits = []
+        failed = []
+        for future in done:
+            if future.exception():
+                failed.append(futures[future])
+                continue
+            for score, hit in future.result():
+                hits.append((score, len(hits), futures[future], hit))
+
+        self.last_stats = {
+            'shards': len(self.shards),
+            'hits': len(hits),
+            'timed_out': sorted(futures[future] for future in not_done),
+            'failed': sorted(failed)
+        }
+        # FAISS returns L2 distances, so the closest hits across all shards have the smallest scores
+        documents = []
+        for _, _, name, hit in heapq.nsmallest(self.k, hits):
+            document = self.shards[name].docstore.get(hit) if isinstance(hit, int) else hit
+            documents.append(Document(page_content=document.page_content, metadata=dict(document.metadata, source_document=name)))
+        return documents
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    from langchain_community.vectorstores import FAISS
+
+    from fakes import FakeEmbeddings
+
+    parser = argparse.ArgumentParser(description="Benchmark collection query latency as the number of document shards grows.")
+    parser.add_argument("--documents", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--chunks-per-document", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=20)
+    args = parser.parse_args()
+
+    embeddings = FakeEmbeddings(dimension=256)
+    shards = {}
+    for documents in args.documents:
+        while len(shards) < documents:
+            name = f"doc-{len(shards)}"
+            texts = [f"{name} chunk {i}" for i in range(args.chunks_per_document)]
+            shards[name] = FAISS.from_texts(texts, embeddings, metadatas=[{'chunk_id': i} for i in range(len(texts))])
+
+        router = ShardRouter(shards=dict(shards), embeddings=embeddings, k=5, shard_timeout=5.0)
+        latencies = []
+        for i in range(args.queries):
+            started_at = time.perf_counter()
+            router.invoke(f"doc-{i % documents} chunk {i}")
+            latencies.append(time.perf_counter() - started_at)
+        latencies.sort()
+        print(f"{documents} documents: p50 {latencies[len(latencies) // 2] * 1000:.1f}ms, "
+              f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f}ms, timed out shards {len(router.last_stats['timed_out'])}")
@@ -0,0 +1,10 @@
+import os
+import sys
+
+# The user app's modules import each other by name, as they do when run from the app folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# app creates its AWS clients and picks its backends when it is first imported
+for name, value in {"AWS_DEFAULT_REGION": "us-east-1", "AWS_ACCESS_KEY_ID": "testing", "AWS_SECRET_ACCESS_KEY": "testing",
+                    "EMBEDDINGS_BACKEND": "fake", "LLM_BACKEND": "fake"}.items():
+    os.environ.setdefault(name, value)
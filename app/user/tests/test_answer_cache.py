@@ -0,0 +1,69 @@
+import numpy
+
+import answer_cache
+from answer_cache import AnswerCache
+
+
+INDEX = ("manuals", "v1")
+
+
+def test_hits_at_the_threshold_and_misses_just_below_it():
+    probe = AnswerCache(threshold=0.0)
+    probe.put(INDEX, [1.0, 0.0], "answer", latency=1.0)
+    _, similarity = probe.lookup(INDEX, [1.0, 1.0])
+
+    at_threshold = AnswerCache(threshold=similarity)
+    at_threshold.put(INDEX, [1.0, 0.0], "answer", latency=1.0)
+    assert at_threshold.lookup(INDEX, [1.0, 1.0]) == ("answer", similarity)
+
+    above_threshold = AnswerCache(threshold=float(numpy.nextafter(numpy.float32(similarity), numpy.float32(1))))
+    above_threshold.put(INDEX, [1.0, 0.0], "answer", latency=1.0)
+    assert above_threshold.lookup(INDEX, [1.0, 1.0]) is None
+
+
+def test_closest_question_wins_and_scale_does_not_matter():
+    cache = AnswerCache(threshold=0.9)
+    cache.put(INDEX, [1.0, 0.0, 0.0], "first", latency=1.0)
+    cache.put(INDEX, [0.0, 1.0, 0.0], "second", latency=1.0)
+
+    answer, similarity = cache.lookup(INDEX, [0.1, 5.0, 0.0])
+    assert answer == "second" and similarity > 0.99
+    assert cache.lookup(INDEX, [0.0, 0.0, 1.0]) is None
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "time", lambda: now[0])
+    cache = AnswerCache(threshold=0.9, ttl_seconds=60)
+    cache.put(INDEX, [1.0, 0.0], "answer", latency=1.0)
+
+    now[0] += 60
+    assert cache.lookup(INDEX, [1.0, 0.0])[0] == "answer"
+    now[0] += 1
+    assert cache.lookup(INDEX, [1.0, 0.0]) is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_a_new_index_version_invalidates_the_bucket_only():
+    cache = AnswerCache(threshold=0.9)
+    cache.put(INDEX, [1.0, 0.0], "old answer", latency=1.0)
+    cache.put(("guides", "v1"), [1.0, 0.0], "guide answer", latency=1.0)
+
+    assert cache.lookup(("manuals", "v2"), [1.0, 0.0]) is None
+    assert cache.lookup(INDEX, [1.0, 0.0]) is None
+    assert cache.lookup(("guides", "v1"), [1.0, 0.0])[0] == "guide answer"
+
+
+def test_stats_count_hits_misses_and_latency_saved():
+    cache = AnswerCache(threshold=0.9, max_entries=2)
+    cache.put(INDEX, [1.0, 0.0, 0.0], "first", latency=2.0)
+    cache.lookup(INDEX, [1.0, 0.0, 0.0])
+    cache.lookup(INDEX, [0.0, 1.0, 0.0])
+    cache.put(INDEX, [0.0, 1.0, 0.0], "second", latency=1.0)
+    cache.put(INDEX, [0.0, 0.0, 1.0], "third", latency=1.0)
+
+    stats = cache.stats()
+    assert (stats['lookups'], stats['hits'], stats['hit_rate']) == (2, 1, 0.5)
+    assert 1.9 < stats['latency_saved'] <= 2.0
+    assert (stats['entries'], stats['evictions']) == (2, 1)
+    assert cache.lookup(INDEX, [1.0, 0.0, 0.0]) is None
@@ -0,0 +1,34 @@
+from langchain_core.documents import Document
+
+import app
+from fakes import FakeStreamingLLM
+from tracing import shared_tracer
+
+
+class FixedRetriever:
+    def __init__(self):
+        self.calls = []
+
+    def invoke(self, query, query_vector=None):
+        self.calls.append((query, query_vector))
+        return [Document(page_content="The tenant must repair the boiler.")]
+
+
+def test_stream_response_yields_tokens_and_times_the_first_one_separately():
+    llm = FakeStreamingLLM(response="Within fourteen days.", first_token_delay=0.05, token_delay=0.02,
+                           prefill_seconds_per_1k_tokens=0.0)
+    retriever = FixedRetriever()
+    timings = {}
+
+    with shared_tracer.trace("question") as trace:
+        tokens = list(app.stream_response(llm, retriever, "When must the boiler be repaired?", timings, question_vector=[0.5, 0.5]))
+
+    assert tokens == ["Within", " fourteen", " days."]
+    assert retriever.calls == [("When must the boiler be repaired?", [0.5, 0.5])]
+    assert timings['retrieval'] <= timings['first_token'] < timings['total']
+    assert timings['first_token'] - timings['retrieval'] >= 0.05
+    assert timings['total'] - timings['first_token'] >= 2 * 0.02
+
+    generate = next(span for span in trace['spans'] if span['name'] == "generate")
+    assert generate['attributes']['first_token_ms'] >= 50
+    assert generate['seconds'] * 1000 > generate['attributes']['first_token_ms']
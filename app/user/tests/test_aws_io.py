@@ -0,0 +1,71 @@
+import threading
+import time
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from aws_io import AsyncAWS
+
+
+class ConcurrencyProbe:
+    """ A blocking call that records how many copies of itself run at once """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def __call__(self, value, seconds=0.05):
+        with self._lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(seconds)
+        with self._lock:
+            self.running -= 1
+        return value
+
+
+def test_gather_returns_results_in_call_order():
+    layer = AsyncAWS(max_pool_connections=4)
+    probe = ConcurrencyProbe()
+    # The first call finishes last
+    results = layer.gather(*(layer.run("s3", probe, i, seconds=0.08 - i * 0.02) for i in range(4)))
+    assert results == [0, 1, 2, 3]
+
+
+def test_each_service_is_capped_at_its_own_limit():
+    layer = AsyncAWS(max_pool_connections=8, limits={'s3': 2, 'dynamodb': 1})
+    s3_probe, dynamodb_probe = ConcurrencyProbe(), ConcurrencyProbe()
+    layer.gather(*[layer.run("s3", s3_probe, i) for i in range(6)],
+                 *[layer.run("dynamodb", dynamodb_probe, i) for i in range(3)])
+    assert s3_probe.max_running == 2
+    assert dynamodb_probe.max_running == 1
+    # Both services' calls overlapped each other
+    assert layer.stats['max_in_flight'] == 3
+
+
+def test_exceptions_propagate_to_the_caller():
+    layer = AsyncAWS(max_pool_connections=2)
+
+    def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError, match="boom"):
+        layer.gather(layer.run("s3", lambda: 1), layer.run("s3", fail))
+    # The semaphore was released, so the next call is not blocked
+    assert layer.gather(layer.run("s3", lambda: 2)) == [2]
+
+
+def test_client_calls_are_limited_by_their_service_and_counted():
+    with mock_aws():
+        layer = AsyncAWS(max_pool_connections=4, limits={'s3': 1})
+        s3 = boto3.client("s3", region_name="us-east-1", config=layer.client_config)
+        s3.create_bucket(Bucket="bucket")
+
+        layer.gather(*(layer.call(s3, "put_object", Bucket="bucket", Key=f"key-{i}", Body=b"data") for i in range(5)))
+        keys = layer.gather(layer.call(s3, "list_objects_v2", Bucket="bucket"))[0]['Contents']
+
+    assert sorted(content['Key'] for content in keys) == [f"key-{i}" for i in range(5)]
+    assert layer.stats == {'calls': 6, 'max_in_flight': 1}
+
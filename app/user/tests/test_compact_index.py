@@ -0,0 +1,95 @@
+import importlib.util
+import os
+
+import faiss
+import numpy
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from compact_index import COMPACT_FORMAT, CompactVectorStore
+from fakes import FakeEmbeddings
+
+
+DIMENSION = 16
+CHUNKS = 200
+
+
+def load_admin_writer():
+    """ The admin app's compact_index, which writes the layout this app reads; both modules share a name """
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "admin", "compact_index.py")
+    spec = importlib.util.spec_from_file_location("admin_compact_index", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    rng = numpy.random.default_rng(0)
+    vectors = rng.normal(size=(CHUNKS, DIMENSION)).astype(numpy.float32)
+    # Chunk IDs are sparse after an update drops chunks, so positions and IDs differ
+    chunk_ids = [3 * i + 1 for i in range(CHUNKS)]
+    documents = [Document(page_content=f"chunk {chunk_id} ünïcode ✓", metadata={'source': "manual.pdf", 'page': chunk_id // 7, 'chunk_id': chunk_id})
+                 for chunk_id in chunk_ids]
+    queries = rng.normal(size=(10, DIMENSION)).astype(numpy.float32)
+    return vectors, chunk_ids, documents, queries
+
+
+def published(tmp_path, corpus, ann_index=None, index_config=None):
+    vectors, chunk_ids, documents, _ = corpus
+    writer = load_admin_writer()
+    assert writer.COMPACT_FORMAT == COMPACT_FORMAT
+    writer.save_compact_index(str(tmp_path), "manual", vectors, documents, chunk_ids, ann_index=ann_index)
+    return CompactVectorStore.load(str(tmp_path), "manual", DIMENSION, FakeEmbeddings(dimension=DIMENSION), index_config)
+
+
+def in_memory(corpus):
+    vectors, chunk_ids, documents, _ = corpus
+    return FAISS.from_embeddings([(document.page_content, vector) for document, vector in zip(documents, vectors)],
+                                 FakeEmbeddings(dimension=DIMENSION), metadatas=[document.metadata for document in documents],
+                                 ids=[str(chunk_id) for chunk_id in chunk_ids])
+
+
+def hits(vector_store, query, k=5):
+    return vector_store.similarity_search_with_score_by_vector(query.tolist(), k)
+
+
+def documents_and_scores(results):
+    # langchain's FAISS also sets Document.id, which the compact layout does not store
+    return [(document.page_content, document.metadata) for document, _ in results], [float(score) for _, score in results]
+
+
+def test_flat_round_trip_matches_in_memory_faiss(tmp_path, corpus):
+    store = published(tmp_path, corpus)
+    reference = in_memory(corpus)
+
+    for query in corpus[3]:
+        documents, scores = documents_and_scores(hits(store, query))
+        expected_documents, expected_scores = documents_and_scores(hits(reference, query))
+        assert documents == expected_documents
+        assert scores == pytest.approx(expected_scores, rel=1e-5)
+    assert len(store.docstore) == CHUNKS
+    assert store.memory_bytes() == CHUNKS * DIMENSION * 4
+
+
+def test_chunks_are_read_by_position_and_by_chunk_id(tmp_path, corpus):
+    _, chunk_ids, documents, _ = corpus
+    store = published(tmp_path, corpus)
+
+    assert store.docstore.get(57) == documents[57]
+    assert store.docstore.search(chunk_ids[57]) == documents[57]
+    assert store.docstore.search(chunk_ids[57] + 1) is None
+    assert store.docstore.search(chunk_ids[-1] + 3) is None
+
+
+def test_ann_round_trip_matches_in_memory_faiss(tmp_path, corpus):
+    vectors = corpus[0]
+    ann_index = faiss.IndexHNSWFlat(DIMENSION, 32)
+    ann_index.add(vectors)
+    store = published(tmp_path, corpus, ann_index=ann_index, index_config={'type': "hnsw", 'ef_search': CHUNKS})
+    reference = in_memory(corpus)
+
+    assert store.index is not None
+    for query in corpus[3]:
+        assert documents_and_scores(hits(store, query))[0] == documents_and_scores(hits(reference, query))[0]
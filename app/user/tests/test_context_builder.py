@@ -0,0 +1,57 @@
+from langchain_core.documents import Document
+
+from context_builder import CHARS_PER_TOKEN, build_context, merge_adjacent
+
+
+PAGE = " ".join(f"sentence{i} about the boiler and the deposit." for i in range(40))
+
+
+def chunk(chunk_id, start, end, page=1, source="lease.pdf"):
+    return Document(page_content=PAGE[start:end], metadata={'source': source, 'page': page, 'chunk_id': chunk_id})
+
+
+def test_consecutive_chunks_are_merged_without_their_overlap():
+    # The chunks overlap by 40 characters, as the splitter leaves them
+    hits = [chunk(8, 160, 300), chunk(7, 0, 200), chunk(2, 400, 500, page=2)]
+    passages, merged = merge_adjacent(hits)
+
+    assert merged == 1
+    assert [passage.page_content for passage in passages] == [PAGE[0:300], PAGE[400:500]]
+    # The passage keeps the best rank of its hits, and the metadata of its first chunk
+    assert passages[0].metadata['chunk_id'] == 7
+
+
+def test_chunks_of_other_pages_or_with_gaps_are_not_merged():
+    hits = [chunk(1, 0, 100), chunk(3, 200, 300), chunk(2, 80, 220, source="other.pdf")]
+    passages, merged = merge_adjacent(hits)
+
+    assert merged == 0
+    assert [passage.page_content for passage in passages] == [PAGE[0:100], PAGE[200:300], PAGE[80:220]]
+
+
+def test_near_duplicate_passages_are_dropped():
+    hits = [chunk(1, 0, 200),
+            Document(page_content=PAGE[0:200].upper(), metadata={'source': "copy.pdf", 'page': 9, 'chunk_id': 40}),
+            chunk(5, 600, 800)]
+    context, stats = build_context(hits, token_budget=0)
+
+    assert [document.page_content for document in context] == [PAGE[0:200], PAGE[600:800]]
+    assert stats['duplicates'] == 1 and stats['passages'] == 2
+
+
+def test_passages_are_added_in_rank_order_until_the_budget_is_spent():
+    hits = [chunk(1, 0, 100), chunk(5, 400, 500), chunk(9, 800, 1000)]
+    context, stats = build_context(hits, token_budget=60)
+
+    # 25 + 25 tokens fit whole; the third passage is cut to the 10 tokens left
+    assert [document.page_content for document in context] == [PAGE[0:100], PAGE[400:500], PAGE[800:800 + 10 * CHARS_PER_TOKEN]]
+    assert context[2].metadata['truncated'] is True
+    assert (stats['tokens_before'], stats['tokens_after'], stats['tokens_saved']) == (100, 60, 40)
+
+
+def test_nothing_is_added_after_the_budget_is_spent():
+    hits = [chunk(1, 0, 100), chunk(5, 400, 500)]
+    context, stats = build_context(hits, token_budget=25)
+
+    assert [document.page_content for document in context] == [PAGE[0:100]]
+    assert stats['passages'] == 1
@@ -0,0 +1,74 @@
+import math
+
+import pytest
+from langchain_core.documents import Document
+
+from hybrid_retriever import BM25Index, HybridRetriever, reciprocal_rank_fusion, tokenize
+
+
+CORPUS = {
+    "0": "The boiler must be repaired",
+    "1": "Pay the deposit",
+    "2": "Boiler, boiler inspection"
+}
+
+
+def test_fusion_ranks_documents_found_by_both_searches_first():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]], k=4)
+    # b: 1/62 + 1/61, a: 1/61, d: 1/62, c: 1/63
+    assert fused == ["b", "a", "d", "c"]
+    assert reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]], k=2) == ["b", "a"]
+
+
+def test_fusion_constant_flattens_the_weight_of_rank():
+    # With a small constant, topping one list beats appearing second in both
+    assert reciprocal_rank_fusion([["a", "b"], ["c", "b"]], k=1, rrf_k=0) == ["a"]
+    assert reciprocal_rank_fusion([["a", "b"], ["c", "b"]], k=1, rrf_k=60) == ["b"]
+
+
+def test_bm25_scores_a_fixed_corpus():
+    index = BM25Index.from_texts(list(CORPUS), list(CORPUS.values()))
+    results = index.search("boiler", k=3)
+
+    # Two of three documents contain the term; lengths are 5, 3 and 3 words
+    idf = math.log(1 + (3 - 2 + 0.5) / (2 + 0.5))
+    avg_length = 11 / 3
+
+    def score(frequency, length):
+        norm = 1.5 * (1 - 0.75 + 0.75 * length / avg_length)
+        return idf * frequency * 2.5 / (frequency + norm)
+
+    assert [doc_id for doc_id, _ in results] == ["2", "0"]
+    assert results[0][1] == pytest.approx(score(2, 3))
+    assert results[1][1] == pytest.approx(score(1, 5))
+    assert index.search("landlord", k=3) == []
+
+
+def test_tokenizer_keeps_identifiers_whole():
+    assert tokenize("See Section 4.2-b of RFC-2119/v2.") == ["see", "section", "4.2-b", "of", "rfc-2119/v2"]
+
+
+class FixedVectorStore:
+    """ A vector search that always returns the same chunks, in order """
+
+    def __init__(self, documents, hits):
+        self.documents = documents
+        self.hits = hits
+        self.docstore = self
+
+    def similarity_search(self, query, k):
+        return [self.documents[doc_id] for doc_id in self.hits[:k]]
+
+    def search(self, doc_id):
+        return self.documents[doc_id]
+
+
+def test_hybrid_retrieval_adds_keyword_matches_the_vector_search_missed():
+    documents = {doc_id: Document(page_content=text, metadata={'chunk_id': int(doc_id)}) for doc_id, text in CORPUS.items()}
+    vector_store = FixedVectorStore(documents, hits=["1", "2"])
+    retriever = HybridRetriever(vector_store=vector_store, bm25_index=BM25Index.from_texts(list(CORPUS), list(CORPUS.values())),
+                                k=3, candidates=2)
+
+    results = [document.metadata['chunk_id'] for document in retriever.invoke("repaired boiler")]
+    # 2 is second in both rankings. 1 and 0 tie, each topping one ranking; 0 is fetched from the docstore
+    assert results == [2, 1, 0]
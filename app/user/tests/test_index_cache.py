@@ -0,0 +1,49 @@
+from index_cache import IndexCache
+
+
+def test_evicted_and_replaced_entries_are_reported():
+    evicted = []
+    cache = IndexCache(max_bytes=100, on_evict=lambda key, value: evicted.append(key))
+
+    cache.get_or_load(("a", "1"), lambda: ("a1", 60))
+    cache.get_or_load(("a", "2"), lambda: ("a2", 60))
+    assert evicted == [("a", "1")]
+
+    cache.get_or_load(("b", "1"), lambda: ("b1", 60))
+    assert evicted == [("a", "1"), ("a", "2")]
+    assert cache.stats()['entries'] == 1
+
+
+def load(value, size, loads=None):
+    def loader():
+        if loads is not None:
+            loads.append(value)
+        return value, size
+    return loader
+
+
+def test_least_recently_used_entries_are_evicted_to_fit_the_budget():
+    evicted = []
+    cache = IndexCache(max_bytes=100, on_evict=lambda key, value: evicted.append(key))
+    for bucket in ("a", "b", "c"):
+        cache.get_or_load((bucket, "1"), load(bucket, 30))
+
+    # Reading "a" makes "b" the least recently used
+    assert cache.get_or_load(("a", "1"), load("reloaded", 30)) == "a"
+    cache.get_or_load(("d", "1"), load("d", 30))
+    assert evicted == [("b", "1")]
+
+    cache.get_or_load(("e", "1"), load("e", 50))
+    assert evicted == [("b", "1"), ("c", "1"), ("a", "1")]
+    assert cache.stats() == {'hits': 1, 'misses': 5, 'evictions': 3, 'entries': 2, 'bytes': 80, 'max_bytes': 100}
+
+
+def test_an_entry_larger_than_the_budget_is_kept_alone():
+    cache = IndexCache(max_bytes=100)
+    cache.get_or_load(("a", "1"), load("a", 30))
+    cache.get_or_load(("big", "1"), load("big", 500))
+
+    assert cache.stats()['entries'] == 1 and cache.stats()['bytes'] == 500
+    loads = []
+    assert cache.get_or_load(("big", "1"), load("big", 500, loads)) == "big"
+    assert loads == []
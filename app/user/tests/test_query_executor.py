@@ -0,0 +1,145 @@
+import threading
+
+import pytest
+
+from query_executor import QueryExecutor, QueryRejected
+
+
+class SessionStopped(BaseException):
+    """ Stands in for Streamlit's StopException and RerunException """
+
+
+def run_followers(executor, key, count, fn):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(executor.run(key, fn))) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def wait_for_followers(executor, count):
+    while executor.stats()['coalesced'] < count:
+        threading.Event().wait(0.01)
+
+
+def test_identical_questions_share_one_answer():
+    executor = QueryExecutor(max_concurrent=2, max_queued=4, queue_timeout=5)
+    release = threading.Event()
+    calls = []
+
+    def answer():
+        calls.append(1)
+        release.wait()
+        return "answer"
+
+    leader = threading.Thread(target=lambda: calls.append(executor.run("key", answer)))
+    leader.start()
+    while not calls:
+        threading.Event().wait(0.01)
+    threads, results = run_followers(executor, "key", 2, answer)
+    wait_for_followers(executor, 2)
+    release.set()
+    for thread in threads + [leader]:
+        thread.join()
+
+    assert calls.count(1) == 1
+    assert results == [("answer", True), ("answer", True)]
+
+
+def test_followers_retry_when_the_leader_session_stops():
+    executor = QueryExecutor(max_concurrent=2, max_queued=4, queue_timeout=5)
+    started = threading.Event()
+    release = threading.Event()
+    leader_error = []
+
+    def stopped():
+        started.set()
+        release.wait()
+        raise SessionStopped()
+
+    def leader():
+        try:
+            executor.run("key", stopped)
+        except SessionStopped as error:
+            leader_error.append(error)
+
+    thread = threading.Thread(target=leader)
+    thread.start()
+    started.wait()
+    calls = []
+
+    def answer():
+        calls.append(1)
+        # The follower that took over waits until the other one follows it again
+        wait_for_followers(executor, 3)
+        return "answer"
+
+    threads, results = run_followers(executor, "key", 2, answer)
+    wait_for_followers(executor, 2)
+    release.set()
+    for follower in threads + [thread]:
+        follower.join()
+
+    assert len(leader_error) == 1
+    assert len(calls) == 1
+    assert sorted(results) == [("answer", False), ("answer", True)]
+
+
+def test_errors_are_shared_with_followers():
+    executor = QueryExecutor(max_concurrent=1, max_queued=1, queue_timeout=5)
+    started = threading.Event()
+    release = threading.Event()
+
+    def failing():
+        started.set()
+        release.wait()
+        raise ValueError("no answer")
+
+    errors = []
+
+    def ask():
+        try:
+            executor.run("key", failing)
+        except ValueError as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=ask)]
+    threads[0].start()
+    started.wait()
+    threads.append(threading.Thread(target=ask))
+    threads[1].start()
+    wait_for_followers(executor, 1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(errors) == 2 and errors[0] is errors[1]
+
+
+def test_free_slot_admits_without_queueing():
+    executor = QueryExecutor(max_concurrent=1, max_queued=0, queue_timeout=5)
+    assert executor.run("key", lambda: "answer") == ("answer", False)
+    assert executor.stats()['admitted'] == 1 and executor.stats()['rejected_queue_full'] == 0
+
+
+def test_full_queue_rejects():
+    executor = QueryExecutor(max_concurrent=1, max_queued=0, queue_timeout=5)
+    started = threading.Event()
+    release = threading.Event()
+
+    def busy():
+        started.set()
+        release.wait()
+        return "answer"
+
+    thread = threading.Thread(target=lambda: executor.run("first", busy))
+    thread.start()
+    started.wait()
+    try:
+        with pytest.raises(QueryRejected) as error:
+            executor.run("second", lambda: "answer")
+    finally:
+        release.set()
+        thread.join()
+    assert error.value.reason == "queue_full"
+    assert executor.stats()['rejected_queue_full'] == 1
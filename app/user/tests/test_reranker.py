@@ -0,0 +1,44 @@
+from langchain_core.documents import Document
+
+from reranker import LexicalReranker, RerankingRetriever
+
+
+# In the order a first-stage search returned them
+CANDIDATES = [
+    "Deposits are returned within thirty days of the end of the lease.",
+    "The landlord must repair the roof, and the tenant must clean the gutters.",
+    "The tenant must repair the boiler within fourteen days of notice.",
+    "Boiler servicing is booked by the landlord once a year.",
+    "Keys are returned to the agent."
+]
+QUESTION = "When must the tenant repair the boiler?"
+
+
+class FixedRetriever:
+    """ First stage that returns the candidates in a fixed order """
+
+    def invoke(self, query, query_vector=None):
+        return [Document(page_content=text, metadata={'chunk_id': i}) for i, text in enumerate(CANDIDATES)]
+
+
+def test_candidates_are_reordered_by_matching_terms_and_phrases():
+    scores = LexicalReranker().score(QUESTION, FixedRetriever().invoke(QUESTION))
+
+    order = sorted(range(len(CANDIDATES)), key=lambda position: -scores[position])
+    # The exact phrase first, then the chunk sharing "tenant must repair", then the one mentioning boilers
+    assert order[:3] == [2, 1, 3]
+
+
+def test_first_stage_rank_breaks_ties_between_unrelated_candidates():
+    documents = [Document(page_content=text) for text in ("Nothing relevant here.", "Nor here.", "Or here.")]
+    scores = LexicalReranker().score(QUESTION, documents)
+
+    assert scores[0] > scores[1] > scores[2]
+
+
+def test_retriever_keeps_the_k_best_candidates():
+    retriever = RerankingRetriever(retriever=FixedRetriever(), k=2)
+    documents = retriever.invoke(QUESTION)
+
+    assert [document.metadata['chunk_id'] for document in documents] == [2, 1]
+    assert retriever.last_stats['candidates'] == 5 and retriever.last_stats['k'] == 2
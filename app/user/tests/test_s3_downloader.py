@@ -0,0 +1,97 @@
+import os
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from s3_downloader import S3Downloader
+
+
+BUCKET = "index-bucket"
+PREFIX = "indexes/v1/"
+
+
+class SmallPages:
+    """ Wraps an S3 client so listings come back two keys per page """
+
+    def __init__(self, client):
+        self.client = client
+
+    def get_paginator(self, operation_name):
+        paginator = self.client.get_paginator(operation_name)
+
+        class Paginator:
+            def paginate(self, **kwargs):
+                return paginator.paginate(PaginationConfig={'PageSize': 2}, **kwargs)
+        return Paginator()
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+@pytest.fixture
+def s3_client():
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        for name in ("index.faiss", "index.json", "shards/0.bin", "shards/1.bin", "shards/2.bin"):
+            client.put_object(Bucket=BUCKET, Key=PREFIX + name, Body=f"contents of {name}".encode())
+        client.put_object(Bucket=BUCKET, Key=PREFIX + "empty/", Body=b"")
+        client.put_object(Bucket=BUCKET, Key="indexes/v2/index.faiss", Body=b"another version")
+        yield client
+
+
+def read(filename):
+    with open(filename, "rb") as f:
+        return f.read()
+
+
+def test_every_page_of_the_prefix_is_mirrored(s3_client, tmp_path):
+    stats = S3Downloader(max_workers=4, s3_client=SmallPages(s3_client)).download_prefix(BUCKET, PREFIX, str(tmp_path))
+
+    assert (stats['objects'], stats['downloaded'], stats['skipped']) == (5, 5, 0)
+    assert read(tmp_path / "shards" / "2.bin") == b"contents of shards/2.bin"
+    assert not (tmp_path / "empty").exists()
+    assert sorted(name for name in os.listdir(tmp_path) if not name.endswith(".etag")) == ["index.faiss", "index.json", "shards"]
+
+
+def test_up_to_date_files_are_skipped_by_etag_and_size(s3_client, tmp_path):
+    downloader = S3Downloader(max_workers=4, s3_client=s3_client)
+    downloader.download_prefix(BUCKET, PREFIX, str(tmp_path))
+
+    warm = downloader.download_prefix(BUCKET, PREFIX, str(tmp_path))
+    assert (warm['downloaded'], warm['skipped'], warm['bytes']) == (0, 5, 0)
+
+    s3_client.put_object(Bucket=BUCKET, Key=PREFIX + "index.json", Body=b"republished")
+    with open(tmp_path / "shards" / "0.bin", "ab") as f:
+        f.write(b" and more")
+    refreshed = downloader.download_prefix(BUCKET, PREFIX, str(tmp_path))
+
+    assert (refreshed['downloaded'], refreshed['skipped']) == (2, 3)
+    assert read(tmp_path / "index.json") == b"republished"
+    assert read(tmp_path / "shards" / "0.bin") == b"contents of shards/0.bin"
+
+
+def test_failed_download_leaves_the_previous_file_in_place(s3_client, tmp_path):
+    downloader = S3Downloader(max_workers=1, s3_client=s3_client)
+    downloader.download_prefix(BUCKET, PREFIX, str(tmp_path))
+    s3_client.put_object(Bucket=BUCKET, Key=PREFIX + "index.faiss", Body=b"a newer index")
+
+    def interrupted_download(Bucket, Key, Filename):
+        with open(Filename, "wb") as f:
+            f.write(b"a ne")
+        raise ConnectionError("connection reset")
+
+    downloader.s3_client = type("Client", (), {
+        'download_file': staticmethod(interrupted_download),
+        'get_paginator': staticmethod(s3_client.get_paginator)
+    })()
+    with pytest.raises(ConnectionError):
+        downloader.download_prefix(BUCKET, PREFIX, str(tmp_path))
+
+    assert read(tmp_path / "index.faiss") == b"contents of index.faiss"
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+    downloader.s3_client = s3_client
+    assert downloader.download_prefix(BUCKET, PREFIX, str(tmp_path))['downloaded'] == 1
+    assert read(tmp_path / "index.faiss") == b"a newer index"
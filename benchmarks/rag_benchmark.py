@@ -0,0 +1,301 @@
+""" Offline benchmark of the ingestion and query paths, with no AWS account needed
+
+Runs the admin app's process_pdf and the user app's get_response against a local moto server
+standing in for S3 and DynamoDB, with the apps' deterministic fake embeddings and LLM standing in
+for Bedrock. Each document is ingested and queried in its own process: the two apps are separate
+images with modules of the same names, and a fresh process also gives a clean peak-memory reading.
+
+    python benchmarks/rag_benchmark.py --pages 10 1000 5000 --output results.json
+
+It also saves an --upload-mb upload through the admin app's upload path, streamed and the old
+buffered way, and reports how much each raised the process's peak memory (ru_maxrss).
+
+Results are written as JSON, one entry per document size, to diff between releases.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADMIN_APP_PATH = os.path.join(REPO_ROOT, "app", "admin")
+USER_APP_PATH = os.path.join(REPO_ROOT, "app", "user")
+TEST_PDF = os.path.join(ADMIN_APP_PATH, "test.pdf")
+QUESTIONS = [
+    "What is this document about?",
+    "Summarize the main requirements.",
+    "Which section describes the configuration?",
+    "What are the listed risks?",
+    "Who is responsible for maintenance?"
+]
+
+
+def peak_memory_bytes():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def stage_seconds(trace):
+    """ Total seconds per stage name in a trace """
+    totals = {}
+    for span in trace['spans']:
+        totals[span['name']] = totals.get(span['name'], 0.0) + span['seconds']
+    return {name: round(seconds, 4) for name, seconds in totals.items()}
+
+
+def run_ingestion(pdf_name, request_id):
+    """ Runs inside a subprocess with the admin app on the path """
+    import admin
+
+    with admin.shared_tracer.trace("ingest") as trace:
+        admin.process_pdf(pdf_name, request_id, report=lambda message: None)
+
+    manifest = admin.get_published_manifest(f"GPI-{request_id}")
+    objects = admin.s3_client.list_objects_v2(Bucket=f"GPI-{request_id}", Prefix=manifest['index_prefix'])['Contents']
+    spans = {span['name']: span for span in trace['spans']}
+    pages = spans['load_split']['attributes']['pages']
+    return {
+        'pages': pages,
+        'chunks': len(manifest['chunk_ids']),
+        'embedded_chunks': spans['embed']['attributes']['embedded'],
+        'index_type': manifest['index']['type'],
+        'index_bytes': sum(content['Size'] for content in objects),
+        'seconds': round(trace['seconds'], 4),
+        'pages_per_second': round(pages / trace['seconds'], 2),
+        'chunks_per_second': round(len(manifest['chunk_ids']) / trace['seconds'], 2),
+        'stages': stage_seconds(trace),
+        'peak_memory_bytes': peak_memory_bytes()
+    }
+
+
+def run_queries(request_id, warm_queries):
+    """ Runs inside a subprocess with the user app on the path; the first query also loads the index """
+    import app
+
+    s3_bucket_name = f"GPI-{request_id}"
+    llm = app.get_llm()
+
+    with app.shared_tracer.trace("cold_query") as cold_trace:
+        manifest, vector_store, bm25_index = app.load_vector_store(s3_bucket_name)
+        app.get_response(llm, vector_store, QUESTIONS[0], bm25_index)
+
+    warm_seconds = []
+    warm_stages = []
+    context_stats = []
+    for i in range(warm_queries):
+        manifest, vector_store, bm25_index = app.load_vector_store(s3_bucket_name)
+        with app.shared_tracer.trace("warm_query") as trace:
+            app.get_response(llm, vector_store, QUESTIONS[i % len(QUESTIONS)], bm25_index)
+        warm_seconds.append(trace['seconds'])
+        warm_stages.append(stage_seconds(trace))
+        context_stats.extend(span['attributes'] for span in trace['spans'] if span['name'] == "context")
+
+    warm_seconds.sort()
+    return {
+        'cold_query_seconds': round(cold_trace['seconds'], 4),
+        'cold_query_stages': stage_seconds(cold_trace),
+        'warm_query_p50_seconds': round(statistics.median(warm_seconds), 4),
+        'warm_query_p95_seconds': round(warm_seconds[max(0, int(len(warm_seconds) * 0.95) - 1)], 4),
+        'warm_query_stages': {name: round(statistics.mean(stages.get(name, 0.0) for stages in warm_stages), 4)
+                              for name in sorted(set().union(*warm_stages))},
+        # Estimated prompt context tokens per query, before and after merging, deduplication and the budget
+        'context_tokens': {key: round(statistics.mean(stats[key] for stats in context_stats), 1)
+                           for key in ("tokens_before", "tokens_after", "tokens_saved")} if context_stats else None,
+        'peak_memory_bytes': peak_memory_bytes()
+    }
+
+
+def run_upload(megabytes, mode, folder):
+    """ Runs inside a subprocess with the admin app on the path; saves one upload to disk and S3
+
+    Streamlit hands the app an in-memory file, so the peak before saving already includes the
+    upload. The 'buffered' mode is the previous upload path, which copied it with getvalue().
+    """
+    import io
+
+    import admin
+
+    request_id = f"upload-{mode}"
+    s3_bucket_name = f"GPI-{request_id}"
+    admin.s3_client.create_bucket(Bucket=s3_bucket_name)
+    uploaded_pdf = io.BytesIO(os.urandom(megabytes * 1024 * 1024))
+    saved_file_name = os.path.join(folder, f"{request_id}.pdf")
+
+    peak_before = peak_memory_bytes()
+    started_at = time.perf_counter()
+    if mode == "streamed":
+        admin.save_uploaded_pdf(uploaded_pdf, saved_file_name, s3_bucket_name, f"{request_id}.pdf")
+    else:
+        with open(saved_file_name, "wb") as sf:
+            sf.write(uploaded_pdf.getvalue())
+        admin.s3_client.upload_file(Filename=saved_file_name, Bucket=s3_bucket_name, Key=f"{request_id}.pdf")
+    seconds = time.perf_counter() - started_at
+    peak_after = peak_memory_bytes()
+    return {
+        'mode': mode,
+        'megabytes': megabytes,
+        'seconds': round(seconds, 4),
+        'peak_memory_bytes_before': peak_before,
+        'peak_memory_bytes_after': peak_after,
+        'peak_memory_bytes_added': peak_after - peak_before
+    }
+
+
+def build_synthetic_pdf(pages, filename):
+    """ Builds a PDF of the given page count by repeating the pages of the bundled test.pdf """
+    from pypdf import PdfReader, PdfWriter
+
+    source = PdfReader(TEST_PDF)
+    writer = PdfWriter()
+    for i in range(pages):
+        writer.add_page(source.pages[i % len(source.pages)])
+    with open(filename, "wb") as f:
+        writer.write(f)
+
+
+def create_tables(dynamodb_client):
+    dynamodb_client.create_table(
+        TableName="PDFProcessingCheckpoints",
+        KeySchema=[{'AttributeName': 'RequestID', 'KeyType': 'HASH'}, {'AttributeName': 'ChunkID', 'KeyType': 'RANGE'}],
+        AttributeDefinitions=[{'AttributeName': 'RequestID', 'AttributeType': 'S'}, {'AttributeName': 'ChunkID', 'AttributeType': 'N'}],
+        BillingMode='PAY_PER_REQUEST'
+    )
+    dynamodb_client.create_table(
+        TableName="PDFProcessingRequests",
+        KeySchema=[{'AttributeName': 'RequestID', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'RequestID', 'AttributeType': 'S'},
+                              {'AttributeName': 'Status', 'AttributeType': 'S'},
+                              {'AttributeName': 'UpdatedAt', 'AttributeType': 'N'}],
+        GlobalSecondaryIndexes=[{
+            'IndexName': "StatusIndex",
+            'KeySchema': [{'AttributeName': 'Status', 'KeyType': 'HASH'}, {'AttributeName': 'UpdatedAt', 'KeyType': 'RANGE'}],
+            'Projection': {'ProjectionType': 'KEYS_ONLY'}
+        }],
+        BillingMode='PAY_PER_REQUEST'
+    )
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def run_stage(stage, app_path, environment, *arguments):
+    """ Runs one stage of this script in a subprocess with the app's folder as its working directory """
+    completed = subprocess.run([sys.executable, os.path.abspath(__file__), "--stage", stage, *arguments],
+                               cwd=app_path, env=dict(environment, PYTHONPATH=app_path),
+                               check=True, capture_output=True, text=True)
+    # The stage prints its result as the last line; the apps may print progress before it
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of ingestion and queries with fake Bedrock and moto S3/DynamoDB.")
+    parser.add_argument("--pages", type=int, nargs="+", default=[100, 1000, 5000],
+                        help="Synthetic document sizes, in addition to the bundled test.pdf")
+    parser.add_argument("--warm-queries", type=int, default=20)
+    parser.add_argument("--upload-mb", type=int, default=200,
+                        help="Size of the upload whose peak memory is measured, or 0 to skip it")
+    parser.add_argument("--output", help="Write the JSON results to this file instead of stdout")
+    parser.add_argument("--stage", choices=["ingest", "query", "upload"], help=argparse.SUPPRESS)
+    parser.add_argument("--pdf", help=argparse.SUPPRESS)
+    parser.add_argument("--request-id", help=argparse.SUPPRESS)
+    parser.add_argument("--mode", choices=["streamed", "buffered"], help=argparse.SUPPRESS)
+    parser.add_argument("--folder", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stage == "ingest":
+        print(json.dumps(run_ingestion(args.pdf, args.request_id)))
+        return
+    if args.stage == "query":
+        print(json.dumps(run_queries(args.request_id, args.warm_queries)))
+        return
+    if args.stage == "upload":
+        print(json.dumps(run_upload(args.upload_mb, args.mode, args.folder)))
+        return
+
+    import boto3
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    # In its own process: moto keeps every stored object in memory, and stages forked from a process
+    # that holds them would start with its peak memory, since Linux keeps ru_maxrss across fork and exec
+    server = subprocess.Popen([sys.executable, "-m", "moto.server", "-H", "127.0.0.1", "-p", str(port)],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_for_port(port)
+
+    with tempfile.TemporaryDirectory() as folder:
+        environment = dict(os.environ,
+                           AWS_ENDPOINT_URL=f"http://127.0.0.1:{port}", AWS_DEFAULT_REGION="us-east-1",
+                           AWS_ACCESS_KEY_ID="testing", AWS_SECRET_ACCESS_KEY="testing",
+                           EMBEDDINGS_BACKEND="fake", LLM_BACKEND="fake",
+                           JOB_QUEUE_PATH=os.path.join(folder, "queue.db"),
+                           VECTOR_STORE_PATH=os.path.join(folder, "vector_stores"))
+        try:
+            create_tables(boto3.client("dynamodb", endpoint_url=environment['AWS_ENDPOINT_URL'], region_name="us-east-1",
+                                       aws_access_key_id="testing", aws_secret_access_key="testing"))
+
+            documents = [("test-pdf", TEST_PDF)]
+            for pages in args.pages:
+                filename = os.path.join(folder, f"synthetic-{pages}.pdf")
+                build_synthetic_pdf(pages, filename)
+                documents.append((f"synthetic-{pages}", filename))
+
+            results = []
+            for request_id, pdf_name in documents:
+                # A fresh embedding cache per document, so no document reuses another's embeddings
+                stage_environment = dict(environment, EMBEDDING_CACHE_PATH=os.path.join(folder, "embedding_cache", request_id))
+                ingestion = run_stage("ingest", ADMIN_APP_PATH, stage_environment, "--pdf", pdf_name, "--request-id", request_id)
+                query = run_stage("query", USER_APP_PATH, stage_environment, "--request-id", request_id,
+                                  "--warm-queries", str(args.warm_queries))
+                results.append({'document': request_id, 'ingestion': ingestion, 'query': query})
+                print(f"{request_id}: {ingestion['pages']} pages ingested at {ingestion['pages_per_second']} pages/sec, "
+                      f"index {ingestion['index_bytes']} bytes, cold query {query['cold_query_seconds']}s, "
+                      f"warm p50 {query['warm_query_p50_seconds']}s", file=sys.stderr)
+
+            uploads = []
+            if args.upload_mb:
+                for mode in ("buffered", "streamed"):
+                    upload = run_stage("upload", ADMIN_APP_PATH, environment, "--upload-mb", str(args.upload_mb),
+                                       "--mode", mode, "--folder", folder)
+                    uploads.append(upload)
+                    print(f"{mode} {args.upload_mb} MB upload: peak memory +{upload['peak_memory_bytes_added']} bytes "
+                          f"in {upload['seconds']}s", file=sys.stderr)
+        finally:
+            server.terminate()
+            server.wait()
+
+    report = {
+        'created_at': time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'results': results,
+        'uploads': uploads
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()